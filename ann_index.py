@@ -0,0 +1,459 @@
+# Approximate Nearest-Neighbour Index for the Multimodal RAG System
+
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+
+from quantization import ENCODE_BLOCK_ROWS, RERANK_FACTOR, ProductQuantizer
+from text_index import replace_json
+from vector_store import top_k_indices
+
+# Defaults for the recall/latency trade-off
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 10
+TRAINING_POINTS_PER_LIST = 64
+
+# Rows assigned to lists per block while building
+ASSIGN_BLOCK_ROWS = 8192
+
+# The index directory holds the ivf.json manifest and one generation directory, written whole
+# by a rebuild and appended to by every later save
+MANIFEST_FILE = "ivf.json"
+GENERATION_PREFIX = "gen-"
+LIST_OFFSETS_FILE = "list_offsets.bin"
+LIST_IDS_FILE = "list_ids.bin"
+CODES_FILE = "pq_codes.bin"
+
+# A new generation is written once the appended blocks hold this many times the list ids of
+# the first block, so rewrites cost amortised constant time per row
+COMPACT_RATIO = 1.0
+
+
+def default_nlist(num_vectors):
+    """Number of inverted lists for a corpus of the given size"""
+    return max(1, min(num_vectors, int(4 * math.sqrt(num_vectors))))
+
+
+def read_array(path, dtype, count, offset=0):
+    """``count`` items of an append-only file starting at item ``offset``"""
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.fromfile(path, dtype=dtype, count=count, offset=offset * np.dtype(dtype).itemsize)
+
+
+def map_array(path, dtype, count):
+    """Memory-map the first ``count`` items of an append-only file"""
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+def append_array(path, position, array):
+    """Write an array at byte ``position`` of an append-only file, discarding anything an interrupted save left there
+
+    The data is synced before returning, so a manifest written afterwards
+    never names rows that are not on disk.
+    """
+    with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+        f.truncate(position)
+        f.seek(position)
+        f.write(np.ascontiguousarray(array).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def sync_file(path):
+    """Flush a file written by another writer, such as ``np.save``, to disk"""
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def group_lists(ids, offsets):
+    """Per-list row ids from a run of saved blocks; slices of ``ids`` when there is one block
+
+    Each block holds its rows list by list, with ``offsets`` giving one
+    row of nlist + 1 bounds per block; rows keep their block order.
+    """
+    blocks, width = offsets.shape
+    if blocks == 1:
+        return [ids[offsets[0, i]:offsets[0, i + 1]] for i in range(width - 1)]
+    lengths = np.diff(offsets, axis=1)
+    labels = np.repeat(np.tile(np.arange(width - 1), blocks), lengths.ravel())
+    grouped = np.asarray(ids)[np.argsort(labels, kind="stable")]
+    bounds = np.concatenate([[0], np.cumsum(lengths.sum(axis=0))])
+    return [grouped[bounds[i]:bounds[i + 1]] for i in range(width - 1)]
+
+
+def train_centroids(vectors, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means over unit vectors, returning (nlist, dim) centroids"""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=nlist)
+        # Re-seed empty lists from random points so no centroid is wasted
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = sums / norms
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """Inverted-file (IVF) index over the rows of a VectorStore
+
+    Vectors are clustered around ``nlist`` centroids; a query only scores
+    rows in its ``nprobe`` closest lists, so raising ``nprobe`` trades
+    latency for recall. Rows added after training are assigned to their
+    nearest existing centroid; call ``build`` again once the corpus has
+    grown well past ``trained_rows``.
+
+    With ``pq_subspaces`` set, each row's residual from its list centroid is
+    also product-quantised (IVF-PQ): probed lists are scored from in-memory
+    codes with asymmetric distance computation, and only the best
+    ``k * rerank_factor`` candidates are re-scored exactly from vectors
+    read lazily off the memory-mapped store.
+
+    ``save`` commits through the ``ivf.json`` manifest, replaced atomically:
+    a save after ``build`` writes a new generation directory, and later
+    saves append only the rows indexed since, as one block of list ids and
+    PQ codes, so a commit costs time proportional to its new rows.
+    """
+
+    def __init__(self, store, index_dir, nprobe=DEFAULT_NPROBE, pq_subspaces=None, rerank_factor=RERANK_FACTOR):
+        self.store = store
+        self.index_dir = index_dir
+        self.nprobe = nprobe
+        self.rerank_factor = rerank_factor
+        self.centroids = np.zeros((0, store.dim), dtype=np.float32)
+        self.lists = []
+        self.trained_rows = 0
+        self.indexed_rows = 0
+        self.quantizer = ProductQuantizer(store.dim, pq_subspaces) if pq_subspaces else None
+        self.codes = np.zeros((0, pq_subspaces or 0), dtype=np.uint8)
+        # Saved generation, and how much of it the manifest commits; None until saved and after a rebuild
+        self.generation = None
+        self._blocks = 0
+        self._saved_rows = 0
+        self._saved_ids = 0
+        self._first_block_ids = 0
+        self._mapped_codes = False
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def needs_retrain(self, growth=4.0):
+        """True once the corpus has grown enough that the centroids are stale"""
+        return len(self.store) > growth * max(self.trained_rows, 1)
+
+    def _assign(self, start, stop):
+        """Nearest-centroid list for each store row in [start, stop)"""
+        return self._assign_vectors(self.store.get_vectors(np.arange(start, stop)))
+
+    def _assign_vectors(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def _residuals(self, vectors):
+        """Vectors minus their list centroid, the part product quantisation encodes"""
+        return vectors - self.centroids[self._assign_vectors(vectors)]
+
+    def build(self, nlist=None, seed=0):
+        """Train centroids on a sample of the store and assign every row"""
+        count = len(self.store)
+        if count == 0:
+            raise ValueError("Cannot build an IVF index over an empty vector store")
+        nlist = min(nlist or default_nlist(count), count)
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, nlist * TRAINING_POINTS_PER_LIST)
+        sample_ids = np.sort(rng.choice(count, size=sample_size, replace=False))
+        sample = self.store.get_vectors(sample_ids)
+        self.centroids = train_centroids(sample, nlist, seed=seed)
+        self.lists = [np.zeros(0, dtype=np.int64) for _ in range(nlist)]
+        if self.quantizer is not None:
+            self.quantizer.train(self._residuals(sample), seed=seed)
+            self.codes = np.zeros((0, self.quantizer.subspaces), dtype=np.uint8)
+        self.trained_rows = count
+        self.indexed_rows = 0
+        self.generation = None
+        self.add_rows(count)
+        return self
+
+    def add_rows(self, stop=None):
+        """Assign store rows added since the last call to their lists
+
+        New lists and codes are built aside and swapped in whole, codes
+        first, so a concurrent ``top_k`` never sees a row without its code.
+        """
+        stop = len(self.store) if stop is None else stop
+        parts = [[] for _ in range(self.nlist)]
+        for start in range(self.indexed_rows, stop, ASSIGN_BLOCK_ROWS):
+            block_stop = min(start + ASSIGN_BLOCK_ROWS, stop)
+            assignment = self._assign(start, block_stop)
+            order = np.argsort(assignment, kind="stable")
+            bounds = np.searchsorted(assignment[order], np.arange(self.nlist + 1))
+            for list_id in range(self.nlist):
+                members = order[bounds[list_id]:bounds[list_id + 1]]
+                if len(members):
+                    parts[list_id].append(members + start)
+        lists = [np.concatenate([rows] + new_ids) if new_ids else rows for rows, new_ids in zip(self.lists, parts)]
+        if self.quantizer is not None:
+            new_codes = []
+            for start in range(len(self.codes), stop, ENCODE_BLOCK_ROWS):
+                block = self.store.get_vectors(np.arange(start, min(start + ENCODE_BLOCK_ROWS, stop)))
+                new_codes.append(self.quantizer.encode(self._residuals(block)))
+            self.codes = np.concatenate([self.codes] + new_codes)
+        self.lists = lists
+        self.indexed_rows = stop
+
+    def probe(self, query, nprobe):
+        """Ids of the lists closest to a query"""
+        return top_k_indices(self.centroids @ query, min(nprobe, self.nlist))
+
+    def approximate_scores(self, query, list_ids, candidates, lists=None):
+        """ADC scores of the probed lists' rows: centroid score plus coded residual score"""
+        lists = self.lists if lists is None else lists
+        centroid_scores = self.centroids[list_ids] @ query
+        lengths = [len(lists[list_id]) for list_id in list_ids]
+        residual_scores = self.quantizer.scores(self.quantizer.score_table(query), self.codes[candidates])
+        return np.repeat(centroid_scores, lengths) + residual_scores
+
+    def top_k(self, query, k=10, nprobe=None):
+        """Return approximately the k most similar (row_id, score) pairs"""
+        query = np.asarray(query, dtype=np.float32).reshape(self.store.dim)
+        # Pin one published state; add_rows swaps in new lists, then the row count
+        indexed_rows = self.indexed_rows
+        lists = self.lists
+        list_ids = self.probe(query, nprobe or self.nprobe)
+        candidates = np.concatenate([lists[list_id] for list_id in list_ids])
+        if self.quantizer is not None and len(candidates):
+            approximate = self.approximate_scores(query, list_ids, candidates, lists)
+            if not self.rerank_factor:
+                best = top_k_indices(approximate, k)
+                return [(int(candidates[i]), float(approximate[i])) for i in best]
+            candidates = candidates[top_k_indices(approximate, k * self.rerank_factor)]
+        # Rows committed to the store but not yet assigned are scored exhaustively
+        if indexed_rows < len(self.store):
+            candidates = np.concatenate([candidates, np.arange(indexed_rows, len(self.store))])
+        if len(candidates) == 0:
+            return []
+        # Rows assigned between reading the count and the lists appear twice
+        candidates = np.unique(candidates)
+        scores = self.store.get_vectors(candidates) @ query
+        best = top_k_indices(scores, k)
+        return [(int(candidates[i]), float(scores[i])) for i in best]
+
+    def memory_bytes(self):
+        """Heap bytes of the centroids, inverted lists and PQ codes; memory-mapped arrays are not counted"""
+        arrays = [self.centroids, self.codes] + list(self.lists)
+        size = sum(array.nbytes for array in arrays if not isinstance(array, np.memmap))
+        if self.quantizer is not None:
+            size += self.quantizer.codebooks.nbytes
+        return size
+
+    def memory_usage(self):
+        """Bytes per vector scored from memory, against float32 storage
+
+        The scored bytes are a row's list id plus its PQ code, or its stored
+        vector without product quantisation. With PQ, the store vectors that
+        exact re-ranking reads are reported separately as the re-rank store.
+        """
+        float32_bytes = self.store.dim * 4
+        list_id_bytes = np.dtype(np.int64).itemsize
+        stored = self.store.dim * np.dtype(self.store.dtype).itemsize + (4 if self.store.scales is not None else 0)
+        if self.quantizer is not None:
+            resident = self.quantizer.code_bytes + list_id_bytes
+            rerank = stored
+        else:
+            resident = stored + list_id_bytes
+            rerank = 0
+        return {
+            "vectors": len(self.store),
+            "bytes_per_vector": resident,
+            "list_id_bytes_per_vector": list_id_bytes,
+            "float32_bytes_per_vector": float32_bytes,
+            "compression": round(float32_bytes / resident, 1),
+            "resident_bytes": resident * len(self.store),
+            "rerank_bytes_per_vector": rerank,
+            "rerank_store_bytes": rerank * len(self.store)
+        }
+
+    def search(self, query, k=10, nprobe=None):
+        """Return the top-k metadata records annotated with their similarity score"""
+        hits = self.top_k(query, k, nprobe)
+        records = self.store.get_records([row_id for row_id, _ in hits])
+        for record, (row_id, score) in zip(records, hits):
+            record["row_id"] = row_id
+            record["score"] = round(score, 4)
+        return records
+
+    def save(self):
+        """Commit the index: append the rows indexed since the last save, or write a new generation
+
+        A new generation is written after ``build`` and once the appended
+        blocks outgrow the first one. Readers see either the previous
+        commit or this one, since only the manifest names what is committed.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        appended_ids = self._saved_ids - self._first_block_ids
+        if self.generation is None or appended_ids >= COMPACT_RATIO * max(self._first_block_ids, 1):
+            self._write_generation()
+        elif self.indexed_rows > self._saved_rows:
+            self._append_block()
+        replace_json(os.path.join(self.index_dir, MANIFEST_FILE), {
+            "generation": self.generation,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "pq_subspaces": self.quantizer.subspaces if self.quantizer is not None else None,
+            "trained_rows": self.trained_rows,
+            "indexed_rows": self._saved_rows,
+            "blocks": self._blocks,
+            "list_ids": self._saved_ids,
+            "first_block_ids": self._first_block_ids
+        })
+        self._remove_stale()
+
+    def _new_generation_name(self):
+        numbers = [int(name[len(GENERATION_PREFIX):]) for name in os.listdir(self.index_dir)
+                   if name.startswith(GENERATION_PREFIX) and name[len(GENERATION_PREFIX):].isdigit()]
+        return f"{GENERATION_PREFIX}{max(numbers, default=0) + 1:06d}"
+
+    def _write_generation(self):
+        """Write centroids, codebooks and every row as the first block of a new generation directory"""
+        name = self._new_generation_name()
+        directory = os.path.join(self.index_dir, name)
+        os.makedirs(directory)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        sync_file(os.path.join(directory, "centroids.npy"))
+        ids = np.concatenate(self.lists or [np.zeros(0, dtype=np.int64)]).astype(np.int64)
+        offsets = np.cumsum([0] + [len(list_ids) for list_ids in self.lists]).astype(np.int64)
+        append_array(os.path.join(directory, LIST_OFFSETS_FILE), 0, offsets)
+        append_array(os.path.join(directory, LIST_IDS_FILE), 0, ids)
+        if self.quantizer is not None:
+            self.quantizer.save(directory)
+            sync_file(os.path.join(directory, "pq_codebooks.npy"))
+            append_array(os.path.join(directory, CODES_FILE), 0, self.codes[:self.indexed_rows])
+        self.generation = name
+        self._blocks = 1
+        self._saved_rows = self.indexed_rows
+        self._saved_ids = self._first_block_ids = len(ids)
+
+    def _append_block(self):
+        """Append the rows indexed since the last save to the current generation as one block"""
+        directory = os.path.join(self.index_dir, self.generation)
+        # Lists hold ascending row ids, so each list's new rows are its tail
+        parts = [list_ids[np.searchsorted(list_ids, self._saved_rows):] for list_ids in self.lists]
+        ids = np.concatenate(parts).astype(np.int64)
+        offsets = np.cumsum([0] + [len(part) for part in parts]).astype(np.int64)
+        append_array(os.path.join(directory, LIST_OFFSETS_FILE), self._blocks * offsets.nbytes, offsets)
+        append_array(os.path.join(directory, LIST_IDS_FILE), self._saved_ids * 8, ids)
+        if self.quantizer is not None:
+            append_array(os.path.join(directory, CODES_FILE), self._saved_rows * self.quantizer.subspaces,
+                         self.codes[self._saved_rows:self.indexed_rows])
+        self._blocks += 1
+        self._saved_rows = self.indexed_rows
+        self._saved_ids += len(ids)
+
+    def _remove_stale(self):
+        """Delete generations the manifest no longer names
+
+        Where the OS refuses because a reader still maps them, the next save retries.
+        """
+        for name in os.listdir(self.index_dir):
+            if name.startswith(GENERATION_PREFIX) and name != self.generation:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+    def _codes(self, directory, rows):
+        path = os.path.join(directory, CODES_FILE)
+        subspaces = self.quantizer.subspaces
+        if self._mapped_codes:
+            return map_array(path, np.uint8, rows * subspaces).reshape(rows, subspaces)
+        return read_array(path, np.uint8, rows * subspaces).reshape(rows, subspaces)
+
+    def extend(self, meta):
+        """Read the blocks a writer appended to this index's generation, as committed by manifest ``meta``
+
+        New lists and codes are swapped in like ``add_rows`` does, so
+        concurrent queries keep working.
+        """
+        directory = os.path.join(self.index_dir, self.generation)
+        width = self.nlist + 1
+        blocks = meta["blocks"] - self._blocks
+        if blocks <= 0:
+            return
+        offsets = read_array(os.path.join(directory, LIST_OFFSETS_FILE), np.int64, blocks * width,
+                             self._blocks * width).reshape(blocks, width)
+        ids = read_array(os.path.join(directory, LIST_IDS_FILE), np.int64, meta["list_ids"] - self._saved_ids,
+                         self._saved_ids)
+        parts = group_lists(ids, offsets)
+        lists = [np.concatenate([rows, part]) if len(part) else rows for rows, part in zip(self.lists, parts)]
+        if self.quantizer is not None:
+            self.codes = self._codes(directory, meta["indexed_rows"])
+        self.lists = lists
+        self.indexed_rows = self._saved_rows = meta["indexed_rows"]
+        self.trained_rows = meta["trained_rows"]
+        self._blocks = meta["blocks"]
+        self._saved_ids = meta["list_ids"]
+
+    @classmethod
+    def load(cls, store, index_dir, map_codes=False):
+        """Open a saved index over the given store
+
+        ``map_codes`` memory-maps the PQ codes instead of reading them, for
+        read-only processes that should share one copy through the page cache.
+        """
+        with open(os.path.join(index_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(store, index_dir, nprobe=meta["nprobe"])
+        index.trained_rows = meta["trained_rows"]
+        index.indexed_rows = meta["indexed_rows"]
+        index._mapped_codes = map_codes
+        directory = os.path.join(index_dir, meta["generation"])
+        index.centroids = np.load(os.path.join(directory, "centroids.npy"))
+        width = meta["nlist"] + 1
+        offsets = read_array(os.path.join(directory, LIST_OFFSETS_FILE), np.int64,
+                             meta["blocks"] * width).reshape(meta["blocks"], width)
+        index.lists = group_lists(map_array(os.path.join(directory, LIST_IDS_FILE), np.int64, meta["list_ids"]),
+                                  offsets)
+        if meta.get("pq_subspaces"):
+            index.quantizer = ProductQuantizer.load(directory, store.dim)
+            # Codes are the in-memory working set, so a writer reads them fully rather than mapping them
+            index.codes = index._codes(directory, meta["indexed_rows"])
+        index.generation = meta["generation"]
+        index._blocks = meta["blocks"]
+        index._saved_rows = meta["indexed_rows"]
+        index._saved_ids = meta["list_ids"]
+        index._first_block_ids = meta["first_block_ids"]
+        return index
+
+
+def open_ivf_index(store, index_dir, nprobe=DEFAULT_NPROBE, pq_subspaces=None):
+    """Load a saved index, building it first and catching up on new store rows
+
+    A saved index whose product quantisation setting differs from
+    ``pq_subspaces`` is rebuilt.
+    """
+    index = None
+    if os.path.exists(os.path.join(index_dir, MANIFEST_FILE)):
+        index = IVFIndex.load(store, index_dir)
+        index.nprobe = nprobe
+        if (index.quantizer.subspaces if index.quantizer is not None else None) != pq_subspaces:
+            index = None
+    if index is None:
+        index = IVFIndex(store, index_dir, nprobe=nprobe, pq_subspaces=pq_subspaces).build()
+        index.save()
+    if index.indexed_rows < len(store):
+        if index.needs_retrain():
+            index.build()
+        else:
+            index.add_rows()
+        index.save()
+    return index
@@ -1,19 +1,29 @@
 import streamlit as st
-import time
+import os
 import random
 from datetime import datetime
 import base64
 from io import BytesIO
 from PIL import Image, ImageDraw
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import json
+import uuid
 from demo_data import (
     EXTENDED_DEMO_RESULTS, 
     EXTENDED_CITATION_DATA, 
     SAMPLE_QUERIES, 
-    SYSTEM_METRICS,
     create_demo_chart_image,
     create_demo_diagram_image
 )
+from text_index import SEARCH_STAGES
+from progress import PipelineProgress
+from image_assets import get_rendered_image
+from audio_segments import AudioClipError, clip_for_record
+from ingest import IngestManager
+from search_service import get_service
+from memory import session_value, set_session_value, start_governor
+from tracing import latency, snapshot, span, start_exporter
+from ui_panels import show_ingest_progress, show_memory_usage, submit_uploads
 # Page configuration
 
 st.set_page_config(
@@ -88,17 +98,38 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize session state
-if 'search_results' not in st.session_state:
-    st.session_state.search_results = []
+# Search results live in the memory governor's session store, which can spill them to disk;
+# keying them by Streamlit's own session id lets the store drop them when the tab closes
+if 'session_id' not in st.session_state:
+    context = get_script_run_ctx()
+    st.session_state.session_id = context.session_id if context is not None else uuid.uuid4().hex
 if 'recent_queries' not in st.session_state:
     st.session_state.recent_queries = []
 if 'uploaded_files' not in st.session_state:
     st.session_state.uploaded_files = []
+if 'ingest_jobs' not in st.session_state:
+    st.session_state.ingest_jobs = {}
 
 # Demo data
 DEMO_RESULTS = EXTENDED_DEMO_RESULTS
 CITATION_DATA = EXTENDED_CITATION_DATA
 
+# Number of hits returned per search
+TOP_K = 10
+
+# Recent queries remembered per session
+MAX_RECENT_QUERIES = 20
+
+@st.cache_resource
+def load_search_service():
+    """The process-wide BM25 search service, built from demo data on first run"""
+    return get_service("demo")
+
+@st.cache_resource
+def load_ingest_manager():
+    """Start the background ingestion workers once per server process"""
+    return IngestManager(load_search_service().writer)
+
 def create_placeholder_image(width=300, height=200, text="Sample Image", image_type="generic"):
     """Create a placeholder image"""
     if image_type == "chart":
@@ -113,32 +144,67 @@ def create_placeholder_image(width=300, height=200, text="Sample Image", image_t
         draw.text((width//2 - 50, height//2 - 10), text, fill='#666')
         return img
 
-def simulate_processing():
-    """Simulate AI processing with loading animation"""
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+def run_search(query):
+    """Search the index with a progress bar driven by its real stage events"""
+    service = load_search_service()
+    cached = service.cached(query, k=TOP_K)
+    if cached is not None:
+        return cached
     
-    steps = [
-        "Analyzing uploaded documents...",
-        "Extracting text and metadata...",
-        "Processing images with CLIP...",
-        "Transcribing audio with Whisper...",
-        "Generating embeddings...",
-        "Performing semantic search...",
-        "Ranking results by relevance..."
-    ]
+    progress_bar = st.progress(0.0, text=SEARCH_STAGES[0])
     
-    for i, step in enumerate(steps):
-        status_text.text(step)
-        progress_bar.progress((i + 1) / len(steps))
-        time.sleep(0.5)
+    def on_stage(stage, completed, total):
+        next_stage = SEARCH_STAGES[completed] if completed < total else "Search complete!"
+        progress_bar.progress(completed / total, text=next_stage)
     
-    status_text.text("Search complete!")
-    time.sleep(0.5)
+    results = service.search(query, k=TOP_K, progress=PipelineProgress(SEARCH_STAGES, on_stage), check_cache=False)
     progress_bar.empty()
-    status_text.empty()
+    return results
+
+def format_latency(seconds):
+    """Human-readable duration for the status panel"""
+    return f"{seconds * 1000:.0f} ms" if seconds < 1 else f"{seconds:.2f} s"
+
+def show_system_status(container):
+    """Fill the System Status panel from the live index and tracing counters"""
+    service = load_search_service()
+    text_index = service.writer.text_index
+    search = latency("search")
+    cache_stats = service.query_cache.stats()
+    spans = snapshot()["spans"]
+    with container:
+        st.success("🟢 All Systems Online")
+        st.info(f"📊 {len(text_index):,} documents indexed in {len(text_index.segments)} segment(s)")
+        if service.read_only:
+            st.info("🔗 Read-only copy following the index writer's updates")
+        st.info(f"🖼️ {text_index.type_counts.get('image', 0):,} images processed")
+        st.info(f"🎵 {text_index.type_counts.get('audio', 0)} audio files transcribed")
+        if search:
+            st.info(f"⚡ Response p50 {format_latency(search['p50'])} / p95 {format_latency(search['p95'])} "
+                    f"over {search['count']} queries")
+        else:
+            st.info("⚡ Response time: no queries yet")
+        st.info(f"🗄️ Query cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits / {cache_stats['misses']} misses")
+        show_memory_usage()
+        if spans:
+            with st.expander("⏱️ Stage latency"):
+                st.dataframe([
+                    {
+                        "Stage": name,
+                        "Count": summary["count"],
+                        "p50 (ms)": round(summary["p50"] * 1000, 2),
+                        "p95 (ms)": round(summary["p95"] * 1000, 2),
+                        "p99 (ms)": round(summary["p99"] * 1000, 2)
+                    }
+                    for name, summary in spans.items()
+                ], hide_index=True)
 
 def display_search_results(results):
+    """Display search results, timed as the render stage"""
+    with span("render"):
+        render_search_results(results)
+
+def render_search_results(results):
     """Display multimodal search results"""
     st.markdown("### 🔍 Search Results")
     
@@ -169,7 +235,11 @@ def display_search_results(results):
                 elif "diagram" in result['content'].lower() or "architecture" in result['content'].lower():
                     image_type = "diagram"
                 
-                placeholder_img = create_placeholder_image(text=result['content'], image_type=image_type)
+                # Drawn and encoded once per process, then served from the image cache
+                placeholder_img = get_rendered_image(
+                    ("placeholder", image_type, result['content']),
+                    lambda: create_placeholder_image(text=result['content'], image_type=image_type)
+                )
                 st.image(placeholder_img, caption=f"From {result['source']}, Page {result['page']}")
                 
                 # Show description if available
@@ -178,6 +248,8 @@ def display_search_results(results):
             elif result['type'] == 'audio':
                 st.write(f"**{result['content']}**")
                 st.markdown(f"🎵 Audio clip at {result['timestamp']} from {result['source']}")
+                if st.button("▶️ Play clip", key=f"play_clip_{i}"):
+                    show_audio_clip(result)
                 
                 # Show transcript if available
                 if 'transcript' in result:
@@ -197,6 +269,18 @@ def display_search_results(results):
             
             st.markdown('</div>', unsafe_allow_html=True)
 
+def show_audio_clip(result):
+    """Play only the matched part of a recording, read by frame or byte range"""
+    try:
+        clip = clip_for_record(result, search_dirs=(os.path.dirname(os.path.abspath(__file__)),))
+    except AudioClipError as e:
+        st.error(f"❌ {e}")
+        return
+    if clip is None:
+        st.info(f"🎵 {result['source']} is not available offline")
+    else:
+        st.audio(clip[0], format=clip[1])
+
 def show_citation_modal(citation_num):
     """Show citation details in a modal-like format"""
     if citation_num in CITATION_DATA:
@@ -265,11 +349,8 @@ def main():
         
         st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
         st.markdown("### ⚙️ System Status")
-        st.success("🟢 All Systems Online")
-        st.info(f"📊 {SYSTEM_METRICS['documents_indexed']:,} documents indexed")
-        st.info(f"🖼️ {SYSTEM_METRICS['images_processed']:,} images processed")
-        st.info(f"🎵 {SYSTEM_METRICS['audio_files_transcribed']} audio files transcribed")
-        st.info(f"⚡ Avg Response: {SYSTEM_METRICS['average_response_time']}")
+        # Filled after the main area so this run's search is already counted
+        status_box = st.container()
         st.markdown('</div>', unsafe_allow_html=True)
         
         st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
@@ -308,8 +389,11 @@ def main():
         )
         
         if uploaded_files:
-            st.session_state.uploaded_files = uploaded_files
+            # Only names are kept; the uploader widget already holds the bytes
+            st.session_state.uploaded_files = [uploaded_file.name for uploaded_file in uploaded_files]
             st.success(f"✅ {len(uploaded_files)} file(s) uploaded")
+            submit_uploads(load_search_service(), load_ingest_manager, uploaded_files)
+        show_ingest_progress(load_ingest_manager)
     
     # Search button
     if st.button("🔍 Search", type="primary", use_container_width=True):
@@ -317,39 +401,30 @@ def main():
             # Add to recent queries
             if query not in st.session_state.recent_queries:
                 st.session_state.recent_queries.append(query)
+                del st.session_state.recent_queries[:-MAX_RECENT_QUERIES]
             
-            # Simulate processing
-            simulate_processing()
+            # Retrieve the best matching chunks from the BM25 index
+            results = run_search(query)
+            if not results:
+                st.warning("No matching content found. Try different keywords.")
             
-            # Get demo results
-            results = []
-            query_lower = query.lower()
-            
-            # Check for specific keywords to match demo scenarios
-            if any(word in query_lower for word in ["financial", "revenue", "quarterly", "earnings"]):
-                results = DEMO_RESULTS["financial report"]
-            elif any(word in query_lower for word in ["product", "specification", "processor", "architecture", "benchmark"]):
-                results = DEMO_RESULTS["product specifications"]
-            elif any(word in query_lower for word in ["market", "analysis", "trend", "growth", "industry"]):
-                results = DEMO_RESULTS["market analysis"]
-            elif any(word in query_lower for word in ["research", "paper", "model", "multimodal", "learning"]):
-                results = DEMO_RESULTS["research paper"]
-            else:
-                # Default to financial report for any other query
-                results = DEMO_RESULTS["financial report"]
-            
-            st.session_state.search_results = results
+            set_session_value(st.session_state.session_id, "search_results", results)
     
     # Display results
-    if st.session_state.search_results:
-        display_search_results(st.session_state.search_results)
+    search_results = session_value(st.session_state.session_id, "search_results", [])
+    if search_results:
+        display_search_results(search_results)
         
         # Show citation modals for clicked citations
-        for result in st.session_state.search_results:
+        for result in search_results:
             for citation_num in result['citations']:
                 if st.button(f"View Citation [{citation_num}]", key=f"cite_{citation_num}"):
                     show_citation_modal(citation_num)
     
+    show_system_status(status_box)
+    start_exporter()
+    start_governor()
+    
     # Footer
     st.markdown("---")
     st.markdown("""
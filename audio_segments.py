@@ -0,0 +1,279 @@
+# Timestamped Audio Segments and Clip Reads for the Multimodal RAG System
+
+import io
+import os
+import re
+import struct
+import wave
+
+AUDIO_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_data", "audio")
+
+# Target length of one indexed transcript segment
+SEGMENT_SECONDS = 30
+
+# Typical speaking rate, used when a transcript has no timings or duration
+WORDS_PER_SECOND = 2.5
+
+# Longest slice served by a single Play click
+MAX_CLIP_SECONDS = 300
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+# MPEG audio layer III bitrates in kbps, by MPEG-1 and MPEG-2/2.5
+MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+# Bytes read when searching for the next MP3 frame header
+MP3_SYNC_WINDOW = 8192
+
+
+class AudioClipError(Exception):
+    """Raised when a clip cannot be cut from a recording"""
+
+
+def parse_timestamp(value):
+    """Seconds from an "H:MM:SS", "M:SS" or plain seconds string"""
+    seconds = 0.0
+    for part in str(value).split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def format_timestamp(seconds):
+    """Format seconds as M:SS, or H:MM:SS past an hour"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    if hours:
+        return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+    return f"{rest // 60}:{rest % 60:02d}"
+
+
+def format_range(start, end):
+    return f"{format_timestamp(start)}–{format_timestamp(end)}"
+
+
+def segment_transcript(transcript, start=0.0, end=None, segment_seconds=SEGMENT_SECONDS):
+    """Split a transcript without word timings into timed segments
+
+    Words are spread evenly over [start, end], or at a typical speaking
+    rate when the end is unknown, and grouped into sentence-aligned
+    segments of about ``segment_seconds``. Returns dicts with start, end
+    and text.
+    """
+    sentences = [s for s in SENTENCE_BOUNDARY.split(transcript.strip()) if s]
+    total_words = sum(len(sentence.split()) for sentence in sentences)
+    if not total_words:
+        return []
+    if end is None or end <= start:
+        end = start + total_words / WORDS_PER_SECOND
+    seconds_per_word = (end - start) / total_words
+
+    segments = []
+    current = []
+    segment_start = start
+    words_so_far = 0
+    for sentence in sentences:
+        current.append(sentence)
+        words_so_far += len(sentence.split())
+        segment_end = start + words_so_far * seconds_per_word
+        if segment_end - segment_start >= segment_seconds:
+            segments.append({"start": segment_start, "end": segment_end, "text": " ".join(current)})
+            current = []
+            segment_start = segment_end
+    if current:
+        segments.append({"start": segment_start, "end": end, "text": " ".join(current)})
+    return segments
+
+
+def segment_records(record, segments):
+    """One indexable record per transcript segment, pointing at its time range"""
+    return [
+        dict(record, transcript=segment["text"], start=round(segment["start"], 2), end=round(segment["end"], 2),
+             timestamp=format_range(segment["start"], segment["end"]))
+        for segment in segments
+    ]
+
+
+def store_recording(name, data, store_dir=AUDIO_STORE_DIR):
+    """Keep an uploaded recording on disk so clips can be cut from it later"""
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def resolve_audio_path(record, search_dirs=()):
+    """Path of the recording behind an audio record, or None when it is not on disk"""
+    path = record.get("audio_path")
+    if path and os.path.exists(path):
+        return path
+    for directory in search_dirs:
+        candidate = os.path.join(directory, record.get("source", ""))
+        if record.get("source") and os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def read_wav_clip(path, start, end):
+    """Cut [start, end) seconds out of a WAV file, reading only those frames"""
+    with wave.open(path, "rb") as recording:
+        rate = recording.getframerate()
+        first = min(int(start * rate), recording.getnframes())
+        count = max(min(int(end * rate), recording.getnframes()) - first, 0)
+        recording.setpos(first)
+        frames = recording.readframes(count)
+        params = recording.getparams()
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as clip:
+        clip.setparams(params)
+        clip.writeframes(frames)
+    return buffer.getvalue()
+
+
+def parse_mp3_header(header):
+    """(frame bytes, samples per frame, sample rate, bitrate bps) for a layer III header, or None"""
+    if len(header) < 4:
+        return None
+    value = struct.unpack(">I", header[:4])[0]
+    if value >> 21 != 0x7FF:
+        return None
+    version = (value >> 19) & 0x3
+    layer = (value >> 17) & 0x3
+    bitrate_index = (value >> 12) & 0xF
+    rate_index = (value >> 10) & 0x3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    samples = 1152 if version == 3 else 576
+    padding = (value >> 9) & 0x1
+    frame_bytes = samples // 8 * bitrate // sample_rate + padding
+    return frame_bytes, samples, sample_rate, bitrate
+
+
+def sync_mp3_frame(f, position):
+    """Offset of the first valid frame header at or after ``position``"""
+    f.seek(position)
+    window = f.read(MP3_SYNC_WINDOW)
+    for i in range(len(window) - 3):
+        if window[i] != 0xFF:
+            continue
+        frame = parse_mp3_header(window[i:i + 4])
+        # Require the following header to be valid too, so stray 0xFF bytes are skipped
+        if frame and (i + frame[0] + 4 > len(window) or parse_mp3_header(window[i + frame[0]:i + frame[0] + 4])):
+            return position + i
+    return None
+
+
+def mp3_info(path):
+    """Audio start, audio byte count, duration and seek table of an MP3 file
+
+    Uses the Xing/Info header's frame count and table of contents when
+    present (VBR files) and the first frame's bitrate otherwise.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(10)
+        audio_start = 0
+        if head[:3] == b"ID3":
+            tag_size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+            audio_start = 10 + tag_size + (10 if head[5] & 0x10 else 0)
+        audio_start = sync_mp3_frame(f, audio_start)
+        if audio_start is None:
+            raise AudioClipError(f"No MPEG audio frames found in {os.path.basename(path)}")
+        f.seek(audio_start)
+        first_frame = f.read(200)
+
+    frame_bytes, samples, sample_rate, bitrate = parse_mp3_header(first_frame)
+    audio_bytes = size - audio_start
+    info = {"audio_start": audio_start, "audio_bytes": audio_bytes, "bitrate": bitrate, "toc": None,
+            "duration": audio_bytes * 8 / bitrate}
+
+    for tag in (b"Xing", b"Info"):
+        offset = first_frame.find(tag)
+        if offset < 0:
+            continue
+        flags = struct.unpack(">I", first_frame[offset + 4:offset + 8])[0]
+        position = offset + 8
+        if flags & 0x1:
+            frames = struct.unpack(">I", first_frame[position:position + 4])[0]
+            info["duration"] = frames * samples / sample_rate
+            position += 4
+        if flags & 0x2:
+            info["audio_bytes"] = struct.unpack(">I", first_frame[position:position + 4])[0]
+            position += 4
+        if flags & 0x4 and len(first_frame) >= position + 100:
+            info["toc"] = first_frame[position:position + 100]
+        break
+    return info
+
+
+def mp3_offset(info, seconds):
+    """Approximate byte offset of a time position"""
+    seconds = min(max(seconds, 0.0), info["duration"])
+    if info["toc"] and info["duration"]:
+        percent = min(seconds / info["duration"] * 100, 99.999)
+        index = int(percent)
+        low = info["toc"][index]
+        high = info["toc"][index + 1] if index < 99 else 256
+        fraction = low + (high - low) * (percent - index)
+        return info["audio_start"] + int(fraction / 256 * info["audio_bytes"])
+    return info["audio_start"] + int(seconds * info["bitrate"] / 8)
+
+
+def read_mp3_clip(path, start, end):
+    """Cut [start, end) seconds out of an MP3 file by byte range, aligned to frames"""
+    info = mp3_info(path)
+    with open(path, "rb") as f:
+        first = sync_mp3_frame(f, mp3_offset(info, start))
+        if first is None:
+            raise AudioClipError(f"No audio at {format_timestamp(start)} in {os.path.basename(path)}")
+        last = info["audio_start"] + info["audio_bytes"]
+        if end < info["duration"]:
+            last = sync_mp3_frame(f, mp3_offset(info, end)) or last
+        f.seek(first)
+        return f.read(max(last - first, 0))
+
+
+def audio_duration(path):
+    """Length in seconds of a WAV or MP3 file, or None for other formats"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".wav":
+        with wave.open(path, "rb") as recording:
+            return recording.getnframes() / recording.getframerate()
+    if extension == ".mp3":
+        return mp3_info(path)["duration"]
+    return None
+
+
+def read_clip(path, start, end, max_seconds=MAX_CLIP_SECONDS):
+    """(bytes, MIME type) of a recording slice, without reading the whole file
+
+    Clips longer than ``max_seconds`` are truncated.
+    """
+    end = min(end, start + max_seconds)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".wav":
+        return read_wav_clip(path, start, end), "audio/wav"
+    if extension == ".mp3":
+        return read_mp3_clip(path, start, end), "audio/mpeg"
+    raise AudioClipError(f"Cannot cut clips from {extension or 'extensionless'} files")
+
+
+def clip_for_record(record, search_dirs=()):
+    """(bytes, MIME type) of the segment an audio record points at, or None without a recording"""
+    path = resolve_audio_path(record, search_dirs)
+    if path is None:
+        return None
+    start = record.get("start", 0.0)
+    end = record.get("end", start + MAX_CLIP_SECONDS)
+    try:
+        return read_clip(path, start, end)
+    except (wave.Error, EOFError, struct.error) as e:
+        raise AudioClipError(f"Unreadable recording {os.path.basename(path)}: {e}")
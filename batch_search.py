@@ -0,0 +1,182 @@
+# Parallel Batch Queries for the Multimodal RAG System
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from search_service import DEFAULT_TOP_K, INDEX_DATA_DIR, open_service
+
+# Queries sent to a worker per task; amortises inter-process overhead
+CHUNK_SIZE = 32
+
+# Tasks in flight per worker; bounds memory held by out-of-order results
+PENDING_PER_WORKER = 4
+
+# Service opened once in each worker process
+_service = None
+
+
+def read_requests(lines):
+    """Yield (line_number, query, k, request_id, error) from plain or JSONL query lines
+
+    A line is either the query text itself or a JSON object with a
+    ``query`` and optional ``k`` and ``id``. Blank lines are skipped. A
+    line that cannot be parsed is yielded with its ``error`` set, so it is
+    reported in output order instead of aborting the batch.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith("{"):
+            yield line_number, line, None, None, None
+            continue
+        try:
+            request = json.loads(line)
+            yield line_number, request["query"], request.get("k"), request.get("id"), None
+        except json.JSONDecodeError as e:
+            yield line_number, None, None, None, f"invalid JSON: {e}"
+        except KeyError as e:
+            yield line_number, None, None, None, f"missing field {e}"
+        except TypeError as e:
+            yield line_number, None, None, None, f"invalid request: {e}"
+
+
+def iter_chunks(items, size):
+    """Split an iterable into lists of at most ``size`` items, lazily"""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _init_worker(profile, data_dir):
+    """Open the read-only index in a worker; its files are memory-mapped and shared"""
+    global _service
+    _service = open_service(profile, data_dir, use_cache=False, read_only=True)
+
+
+def _run_chunk(chunk, default_k):
+    """Run a chunk of queries; returns (json line, seconds, failed) in input order
+
+    Lines that failed to parse are passed through with ``seconds`` None.
+    """
+    output = []
+    for line_number, query, k, request_id, error in chunk:
+        if error is not None:
+            output.append((json.dumps({"line": line_number, "error": error}), None, True))
+            continue
+        record = {"line": line_number, "query": query}
+        if request_id is not None:
+            record["id"] = request_id
+        start = time.perf_counter()
+        failed = False
+        try:
+            record["results"] = _service.search(query, k or default_k)
+        except Exception as e:
+            record["error"] = str(e)
+            failed = True
+        seconds = time.perf_counter() - start
+        record["latency_ms"] = round(seconds * 1000, 3)
+        output.append((json.dumps(record), seconds, failed))
+    return output
+
+
+def run_batch(requests, output, profile="demo", k=DEFAULT_TOP_K, workers=None, chunk_size=CHUNK_SIZE,
+              data_dir=INDEX_DATA_DIR):
+    """Run requests across a process pool, writing JSONL to ``output`` in input order
+
+    Only a bounded window of chunks is in flight at a time, so memory stays
+    flat however long the input is. Returns a summary dict.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Build any missing index here once, so workers only ever open it read-only
+    open_service(profile, data_dir, use_cache=False)
+
+    latencies = array("d")
+    count = 0
+    errors = 0
+    started = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(profile, data_dir)) as executor:
+        chunks = iter_chunks(requests, chunk_size)
+        pending = deque(executor.submit(_run_chunk, chunk, k)
+                        for chunk in islice(chunks, workers * PENDING_PER_WORKER))
+        while pending:
+            for line, seconds, failed in pending.popleft().result():
+                output.write(line + "\n")
+                count += 1
+                errors += failed
+                if seconds is not None:
+                    latencies.append(seconds)
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(executor.submit(_run_chunk, chunk, k))
+    output.flush()
+    return summarize(latencies, errors, time.perf_counter() - started, workers, count)
+
+
+def summarize(latencies, errors, elapsed, workers, count=None):
+    """Throughput and latency percentiles for a finished batch
+
+    ``count`` is the number of requests, including lines that failed to
+    parse and so have no latency; it defaults to ``len(latencies)``.
+    """
+    count = len(latencies) if count is None else count
+    summary = {
+        "queries": count,
+        "errors": errors,
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "queries_per_second": round(count / elapsed, 1) if elapsed else 0.0
+    }
+    if latencies:
+        values = np.frombuffer(latencies, dtype=np.float64) * 1000
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        summary["latency_ms"] = {
+            "mean": round(float(values.mean()), 3),
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "max": round(float(values.max()), 3)
+        }
+    return summary
+
+
+def format_summary(summary):
+    """Human-readable batch summary"""
+    lines = [
+        f"Queries: {summary['queries']} ({summary['errors']} failed) on {summary['workers']} workers",
+        f"Elapsed: {summary['seconds']} s, throughput {summary['queries_per_second']} queries/s"
+    ]
+    latency = summary.get("latency_ms")
+    if latency:
+        lines.append(
+            f"Latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  "
+            f"mean {latency['mean']}  max {latency['max']}"
+        )
+    return "\n".join(lines)
+
+
+def run_batch_files(input_path, output_path="-", **options):
+    """Run a query file ('-' for stdin) into a JSONL file ('-' for stdout) and return the summary"""
+    source = sys.stdin if input_path == "-" else open(input_path, encoding="utf-8")
+    target = sys.stdout if output_path == "-" else open(output_path, "w", encoding="utf-8")
+    try:
+        return run_batch(read_requests(source), target, **options)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
@@ -0,0 +1,329 @@
+# Retrieval and Rendering Benchmarks for the Multimodal RAG System
+
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from ann_index import open_ivf_index
+from demo_data import SAMPLE_QUERIES, create_demo_chart_image, create_demo_diagram_image
+from embeddings import HashingEncoder
+from hybrid import HybridRetriever
+from image_assets import encode_image, get_thumbnail, make_thumbnail
+from quantization import evaluate_recall
+from search_service import RESEARCH_NPROBE, RESEARCH_PQ_SUBSPACES
+from text_index import build_text_index
+from tracing import latency
+from vector_store import open_vector_store
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Kept with the other machine-local data, so local runs neither dirty the tree nor get committed as a baseline
+DEFAULT_HISTORY_PATH = os.path.join(APP_DIR, "index_data", "benchmark_history.json")
+
+# Corpus sizes the index and query benchmarks run at
+DEFAULT_SIZES = (1000, 5000, 20000)
+QUICK_SIZES = (500, 2000)
+
+# Synthetic fixtures: vocabulary size, Zipf exponent of word frequencies and words per chunk
+VOCABULARY_SIZE = 20000
+ZIPF_EXPONENT = 1.1
+CHUNK_WORDS = 60
+QUERY_WORDS = 3
+QUERIES = 200
+SEED = 0
+
+# Results compared per query for recall@k
+RECALL_K = 10
+
+# Timings are the best of several repetitions, which is far less noisy than any single one
+BUILD_REPEATS = 3
+QUERY_PASSES = 3
+
+# Timed repetitions of each rendering benchmark
+RENDER_REPEATS = 20
+APP_RENDER_REPEATS = 5
+
+# Repository images used for thumbnail throughput
+THUMBNAIL_IMAGES = ("Q4 Revenue Table.jpg", "Q4_Rev Analysis.jpg")
+
+# A metric fails the gate when it is this much worse than the median of the
+# last BASELINE_RUNS comparable runs: relatively for timings and throughput,
+# absolutely for recall. Timing changes under MIN_TIMING_CHANGE_MS are noise
+TIMING_TOLERANCE = 0.25
+RECALL_TOLERANCE = 0.02
+MIN_TIMING_CHANGE_MS = 0.5
+BASELINE_RUNS = 5
+
+# Runs kept in the history file
+HISTORY_LIMIT = 500
+
+
+def synthetic_corpus(size, seed=SEED):
+    """Deterministic result records shaped like the demo data, with Zipf-distributed words"""
+    rng = np.random.default_rng(seed)
+    words = rng.zipf(ZIPF_EXPONENT, size=(size, CHUNK_WORDS)) % VOCABULARY_SIZE
+    types = rng.choice(["text", "image", "audio"], size=size, p=[0.7, 0.2, 0.1])
+    return [{
+        "id": f"bench-{row}",
+        "type": str(types[row]),
+        "content": " ".join(f"w{word}" for word in words[row]),
+        "source": f"document_{row // 50}.pdf",
+        "page": int(row % 50) + 1,
+        "confidence": 0.9,
+        "citations": [1]
+    } for row in range(size)]
+
+
+def synthetic_queries(count=QUERIES, seed=SEED + 1):
+    """Deterministic queries over the synthetic vocabulary, plus the demo sample queries"""
+    rng = np.random.default_rng(seed)
+    words = rng.zipf(ZIPF_EXPONENT, size=(count, QUERY_WORDS)) % VOCABULARY_SIZE
+    return [" ".join(f"w{word}" for word in row) for row in words] + list(SAMPLE_QUERIES)
+
+
+def percentiles_ms(seconds):
+    values = np.array(seconds) * 1000
+    p50, p95 = np.percentile(values, [50, 95])
+    return round(float(p50), 3), round(float(p95), 3)
+
+
+def bench_index(records, work_dir, repeats=BUILD_REPEATS):
+    """Build the BM25 index, vector store and IVF-PQ index over a corpus; returns (metrics, indexes of the last build)"""
+    size = len(records)
+    encoder = HashingEncoder()
+    timings = {"bm25": [], "vectors": [], "ivf": []}
+    for repeat in range(repeats):
+        build_dir = os.path.join(work_dir, str(repeat))
+        started = time.perf_counter()
+        text_index = build_text_index(records, os.path.join(build_dir, "text"))
+        timings["bm25"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        store = open_vector_store(os.path.join(build_dir, "vectors"), encoder, records=records)
+        timings["vectors"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        ivf_index = open_ivf_index(store, os.path.join(build_dir, "ivf"), nprobe=RESEARCH_NPROBE,
+                                   pq_subspaces=RESEARCH_PQ_SUBSPACES)
+        timings["ivf"].append(time.perf_counter() - started)
+        if repeat < repeats - 1:
+            text_index.close()
+
+    metrics = {f"index_build.{name}_seconds@{size}": round(min(seconds), 4) for name, seconds in timings.items()}
+    metrics[f"index_build.bm25_docs_per_second@{size}"] = round(size / min(timings["bm25"]), 1)
+    return metrics, (text_index, ivf_index, encoder)
+
+
+def bench_queries(text_index, ivf_index, encoder, queries, passes=QUERY_PASSES):
+    """BM25 and hybrid query latency, including loading the returned records, from the best of ``passes`` passes"""
+    size = len(text_index)
+    metrics = {}
+    retriever = HybridRetriever(text_index, ivf_index, encoder)
+    for name, search in (("bm25", text_index.search), ("hybrid", retriever.search)):
+        # One untimed pass pages in the mapped files, so every size is measured warm
+        for query in queries:
+            search(query, 10)
+        results = []
+        for _ in range(passes):
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                search(query, 10)
+                timings.append(time.perf_counter() - started)
+            results.append(percentiles_ms(timings))
+        metrics[f"query.{name}.p50_ms@{size}"] = min(p50 for p50, _ in results)
+        metrics[f"query.{name}.p95_ms@{size}"] = min(p95 for _, p95 in results)
+    return metrics
+
+
+def bench_recall(ivf_index, encoder, queries, k=RECALL_K):
+    """Recall@k of the IVF-PQ index against brute-force search over the same vectors"""
+    size = len(ivf_index.store)
+    report = evaluate_recall(ivf_index, encoder.encode(queries), k)
+    return {
+        f"recall.reranked@{size}": report["recall_reranked"],
+        f"recall.approximate@{size}": report["recall_approximate"]
+    }
+
+
+def bench_images(repeats=RENDER_REPEATS):
+    """Thumbnail throughput, cold and cached, and generated chart and diagram rendering time"""
+    paths = [os.path.join(APP_DIR, name) for name in THUMBNAIL_IMAGES if os.path.exists(os.path.join(APP_DIR, name))]
+    metrics = {}
+    if paths:
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            for path in paths:
+                encode_image(make_thumbnail(path))
+            timings.append(time.perf_counter() - started)
+        metrics["thumbnail.cold_images_per_second"] = round(len(paths) / min(timings), 2)
+        for path in paths:
+            get_thumbnail(path)
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            for _ in range(100):
+                for path in paths:
+                    get_thumbnail(path)
+            timings.append(time.perf_counter() - started)
+        metrics["thumbnail.cached_images_per_second"] = round(100 * len(paths) / min(timings), 1)
+
+    for name, draw in (("chart", create_demo_chart_image), ("diagram", create_demo_diagram_image)):
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            encode_image(draw(300, 200))
+            timings.append(time.perf_counter() - started)
+        metrics[f"render.{name}_image_ms"] = round(1000 * min(timings), 3)
+    return metrics
+
+
+def _render_seconds():
+    summary = latency("render")
+    return (summary["count"], summary["sum"]) if summary else (0, 0.0)
+
+
+def bench_cards(repeats=APP_RENDER_REPEATS):
+    """Result card rendering time of app.py and clapp.py, run headlessly through AppTest
+
+    The "render" span wraps ``display_search_results`` in app.py and the
+    result list loop of ``show_results`` in clapp.py. Each app is rerun
+    ``repeats`` times on one query after a warm-up run, so searches come
+    from the query cache and only rendering varies.
+    """
+    from streamlit.testing.v1 import AppTest
+    metrics = {}
+    for name, script in (("app", "app.py"), ("clapp", "clapp.py")):
+        app = AppTest.from_file(os.path.join(APP_DIR, script), default_timeout=120)
+        app.run()
+        if name == "app":
+            app.text_input(key="main_query").input(SAMPLE_QUERIES[0])
+            next(button for button in app.button if "Search" in button.label).click()
+        else:
+            app.session_state["query"] = SAMPLE_QUERIES[0]
+            app.session_state["search_done"] = True
+        app.run()
+        count, total = _render_seconds()
+        run_timings = []
+        for _ in range(repeats):
+            if name == "app":
+                next(button for button in app.button if "Search" in button.label).click()
+            started = time.perf_counter()
+            app.run()
+            run_timings.append(time.perf_counter() - started)
+        if app.exception:
+            raise RuntimeError(f"{script} failed while benchmarking: {app.exception[0].message}")
+        new_count, new_total = _render_seconds()
+        metrics[f"render.{name}_cards_ms"] = round(1000 * (new_total - total) / max(new_count - count, 1), 3)
+        metrics[f"render.{name}_script_run_ms"] = round(1000 * min(run_timings), 3)
+    return metrics
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, apps=True):
+    """Run every benchmark on fresh fixtures and return {metric: value}"""
+    metrics = {}
+    queries = synthetic_queries()
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as work_dir:
+        for size in sizes:
+            size_dir = os.path.join(work_dir, str(size))
+            build_metrics, (text_index, ivf_index, encoder) = bench_index(synthetic_corpus(size), size_dir)
+            metrics.update(build_metrics)
+            metrics.update(bench_queries(text_index, ivf_index, encoder, queries))
+            metrics.update(bench_recall(ivf_index, encoder, queries))
+            text_index.close()
+    metrics.update(bench_images())
+    if apps:
+        metrics.update(bench_cards())
+    return metrics
+
+
+def environment():
+    """What makes two runs comparable: the host, its CPUs and the Python version"""
+    return {
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version()
+    }
+
+
+def higher_is_better(metric):
+    return "per_second" in metric or metric.startswith("recall.")
+
+
+def load_history(path=DEFAULT_HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_history(history, path=DEFAULT_HISTORY_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(history[-HISTORY_LIMIT:], f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def find_regressions(metrics, history, env, timing_tolerance=TIMING_TOLERANCE, recall_tolerance=RECALL_TOLERANCE):
+    """Metrics worse than the median of their last BASELINE_RUNS values from comparable runs"""
+    comparable = [run for run in history if run.get("environment") == env]
+    regressions = []
+    for metric, value in sorted(metrics.items()):
+        previous = [run["metrics"][metric] for run in comparable if metric in run["metrics"]][-BASELINE_RUNS:]
+        if not previous:
+            continue
+        baseline = statistics.median(previous)
+        if metric.startswith("recall."):
+            regressed = value < baseline - recall_tolerance
+        elif higher_is_better(metric):
+            regressed = value < baseline * (1 - timing_tolerance)
+        else:
+            change_ms = (value - baseline) * (1000 if "_seconds" in metric else 1)
+            regressed = value > baseline * (1 + timing_tolerance) and change_ms >= MIN_TIMING_CHANGE_MS
+        if regressed:
+            change = (value - baseline) / baseline if baseline else float("inf")
+            regressions.append({"metric": metric, "baseline": baseline, "value": value,
+                                "change": round(change, 4)})
+    return regressions
+
+
+def run_suite(sizes=DEFAULT_SIZES, history_path=DEFAULT_HISTORY_PATH, apps=True, record=True,
+              timing_tolerance=TIMING_TOLERANCE, recall_tolerance=RECALL_TOLERANCE):
+    """Run the benchmarks, gate them against the history and append this run to it
+
+    Returns the run entry with its ``regressions``; the run is recorded
+    even when it regresses, so the history shows the change.
+    """
+    env = environment()
+    history = load_history(history_path)
+    metrics = run_benchmarks(sizes, apps)
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": env,
+        "sizes": list(sizes),
+        "metrics": metrics,
+        "regressions": find_regressions(metrics, history, env, timing_tolerance, recall_tolerance)
+    }
+    if record:
+        save_history(history + [run], history_path)
+    return run
+
+
+def format_report(run):
+    """Human-readable benchmark report"""
+    lines = [f"{metric:<45} {value}" for metric, value in sorted(run["metrics"].items())]
+    if run["regressions"]:
+        lines.append(f"{len(run['regressions'])} regression(s):")
+        lines += [f"  {item['metric']}: {item['value']} vs baseline {item['baseline']} ({item['change']:+.1%})"
+                  for item in run["regressions"]]
+    else:
+        lines.append("No regressions")
+    return "\n".join(lines)
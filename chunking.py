@@ -0,0 +1,73 @@
+# Sentence-Aware Text Chunking for the Multimodal RAG System
+
+import re
+
+# Default window and overlap, in whitespace-delimited tokens
+CHUNK_TOKENS = 120
+CHUNK_OVERLAP = 20
+
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*(?=\s)")
+TOKEN = re.compile(r"\S+")
+
+
+class Chunker:
+    """Packs page text into overlapping token windows with character offsets
+
+    With ``sentence_boundaries`` a chunk only breaks between sentences,
+    unless a single sentence is longer than the window, and the overlap is
+    made of whole trailing sentences. Otherwise the window slides over
+    tokens. Pages are chunked one at a time, so only the current page's
+    text is ever held.
+    """
+
+    def __init__(self, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP, sentence_boundaries=True):
+        if max_tokens < 1 or not 0 <= overlap < max_tokens:
+            raise ValueError("Chunker needs max_tokens >= 1 and 0 <= overlap < max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.sentence_boundaries = sentence_boundaries
+
+    def units(self, text):
+        """(start, end, token count) spans the chunker never breaks inside"""
+        tokens = [match.span() for match in TOKEN.finditer(text)]
+        if not self.sentence_boundaries:
+            return [(start, end, 1) for start, end in tokens]
+        units = []
+        sentence = []
+        sentence_ends = {match.end() for match in SENTENCE_END.finditer(text)}
+        for start, end in tokens:
+            sentence.append((start, end))
+            if end in sentence_ends or len(sentence) == self.max_tokens:
+                units.append((sentence[0][0], sentence[-1][1], len(sentence)))
+                sentence = []
+        if sentence:
+            units.append((sentence[0][0], sentence[-1][1], len(sentence)))
+        return units
+
+    def split(self, text):
+        """Yield (start, end, chunk text) for one page"""
+        units = self.units(text)
+        first = 0
+        while first < len(units):
+            last = first
+            tokens = units[first][2]
+            while last + 1 < len(units) and tokens + units[last + 1][2] <= self.max_tokens:
+                last += 1
+                tokens += units[last][2]
+            start, end = units[first][0], units[last][1]
+            yield start, end, " ".join(text[start:end].split())
+            if last + 1 >= len(units):
+                return
+            # Step back over trailing units that fit in the overlap, always moving forward
+            next_first = last + 1
+            carried = 0
+            while next_first - 1 > first and carried + units[next_first - 1][2] <= self.overlap:
+                next_first -= 1
+                carried += units[next_first][2]
+            first = next_first
+
+    def chunks(self, pages):
+        """Yield {page, char_start, char_end, content} from (page number, text) pairs, lazily"""
+        for page, text in pages:
+            for start, end, content in self.split(text):
+                yield {"page": page, "char_start": start, "char_end": end, "content": content}
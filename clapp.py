@@ -1,7 +1,21 @@
 import streamlit as st
-import time
+import os
 import base64
+import html
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from demo_data import MOCK_RESULTS, RECENT_QUERIES
+from progress import PipelineProgress
+from image_assets import get_thumbnail
+from audio_segments import AudioClipError, clip_for_record
+from ingest import IngestManager
+from search_service import get_service
+from generation import Citation, ExtractiveAnswerGenerator
+from memory import start_governor
+from tracing import record, span, start_exporter
+from ui_panels import NO_ICONS, show_ingest_progress, show_memory_usage, submit_uploads
 
 # Page config
 st.set_page_config(
@@ -200,58 +214,79 @@ if 'show_citation' not in st.session_state:
     st.session_state.show_citation = None
 if 'selected_sidebar_query' not in st.session_state:
     st.session_state.selected_sidebar_query = None
+if 'ingest_jobs' not in st.session_state:
+    st.session_state.ingest_jobs = {}
 if 'recent_queries' not in st.session_state:
-    st.session_state.recent_queries = [
-        {"query": "Revenue analysis Q4", "timestamp": "2 hours ago", "results": 5},
-        {"query": "Product roadmap 2025", "timestamp": "1 day ago", "results": 8},
-        {"query": "Customer feedback summary", "timestamp": "3 days ago", "results": 12},
-        {"query": "Market research findings", "timestamp": "1 week ago", "results": 15}
-    ]
-
-# Mock data for demo
-MOCK_RESULTS = {
-    "text": [
-        {
-            "id": 1,
-            "content": "The quarterly financial report indicates a 23% increase in revenue compared to Q3 2024. Operating expenses remained stable at 15.2 million, while net profit margins improved to 18.5%. The growth was primarily driven by expanded market presence in Southeast Asian regions.",
-            "source": "Q4_Financial_Report_2024.pdf",
-            "page": 12,
-            "relevance": 0.94
-        },
-        {
-            "id": 2,
-            "content": "Market analysis shows strong consumer demand for sustainable products, with 67% of surveyed customers indicating willingness to pay premium prices for eco-friendly alternatives. This trend aligns with our strategic pivot towards green technology solutions.",
-            "source": "Market_Research_Summary.docx",
-            "page": 5,
-            "relevance": 0.89
-        }
-    ],
-    "images": [
-        {
-            "id": 3,
-            "description": "Revenue growth chart showing Q1-Q4 2024 performance metrics with projections for 2025",
-            "source": "Financial_Presentation.png",
-            "page": 1,
-            "relevance": 0.92
-        },
-        {
-            "id": 4,
-            "description": "Product roadmap diagram illustrating development timeline and key milestones",
-            "source": "Strategy_Document.jpg",
-            "page": 1,
-            "relevance": 0.85
-        }
-    ],
-    "audio": [
-        {
-            "id": 5,
-            "transcript": "In today's board meeting, we discussed the expansion strategy for Q1 2025. The CEO emphasized focusing on customer retention while exploring new market segments. We're allocating 2.5 million for R&D initiatives and expect to launch three new products by March.",
-            "source": "Board_Meeting_Jan2025.mp3",
-            "duration": "2:45",
-            "relevance": 0.87
-        }
-    ]
-}
+    st.session_state.recent_queries = [dict(entry) for entry in RECENT_QUERIES]
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Number of hits returned per search
+TOP_K = 10
+
+# Minimum interval between answer panel redraws while tokens stream in
+STREAM_FLUSH_SECONDS = 0.05
+
+@st.cache_resource
+def load_search_service():
+    """The process-wide hybrid search service"""
+    return get_service("research")
+
+@st.cache_resource
+def load_generator():
+    """Answer generator for the research analysis panel; any AnswerGenerator can be swapped in"""
+    return ExtractiveAnswerGenerator()
+
+@st.cache_resource
+def load_search_executor():
+    """Worker threads that search while the script thread streams the answer"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="clapp-search")
+
+@st.cache_resource
+def load_ingest_manager():
+    """Start the background ingestion workers once per server process"""
+    return IngestManager(load_search_service().writer)
+
+def group_results(hits):
+    """Group search hits into the MOCK_RESULTS layout"""
+    results = {modality: [] for modality in MOCK_RESULTS}
+    for hit in hits:
+        results[hit.pop("modality")].append(hit)
+    return results
+
+def search_into_queue(service, query, progress, passage_queue):
+    """Search on a worker thread, publishing passages as soon as they are known
+
+    Keyword hits are published when BM25 finishes, before dense search and
+    fusion; the remaining fused hits follow and None ends the stream.
+    """
+    published = set()
+
+    def publish(records):
+        for record in records:
+            if record["doc_id"] not in published:
+                published.add(record["doc_id"])
+                passage_queue.put(dict(record))
+
+    try:
+        hits = service.search(query, k=TOP_K, progress=progress, on_early_results=publish, check_cache=False)
+        publish(hits)
+        return group_results(hits)
+    finally:
+        passage_queue.put(None)
+
+def iter_passages(passage_queue, on_wait=None):
+    """Yield passages from a search thread, calling on_wait while none are ready"""
+    while True:
+        try:
+            passage = passage_queue.get(timeout=STREAM_FLUSH_SECONDS)
+        except queue.Empty:
+            if on_wait is not None:
+                on_wait()
+            continue
+        if passage is None:
+            return
+        yield passage
 
 CITATION_DETAILS = {
     1: {
@@ -291,50 +326,6 @@ CITATION_DETAILS = {
     }
 }
 
-# Mock LLM responses for different queries
-LLM_RESPONSES = {
-    "Revenue analysis Q4": {
-        "response": """Based on the comprehensive analysis of Q4 2024 financial data, the company has demonstrated remarkable growth across multiple key performance indicators. The quarterly financial report reveals a substantial 23% increase in revenue compared to Q3 2024, which significantly exceeds industry benchmarks and internal projections.<sup><a href="#footnote-1" class="citation-badge">1</a></sup>
-
-This growth trajectory is particularly noteworthy when considering the broader market context. The revenue expansion was primarily driven by strategic market penetration in Southeast Asian regions, where the company has successfully capitalized on emerging opportunities.<sup><a href="#footnote-1" class="citation-badge">1</a></sup> The operating expenses remained remarkably stable at 15.2 million, indicating efficient cost management practices that have been maintained despite the significant revenue growth.
-
-The net profit margins improved to 18.5%, representing a substantial enhancement in operational efficiency. This improvement suggests that the company's strategic initiatives, including the focus on sustainable products and green technology solutions, are yielding positive financial returns.<sup><a href="#footnote-2" class="citation-badge">2</a></sup>
-
-From a strategic perspective, the board meeting discussions indicate that the company is well-positioned for continued growth in Q1 2025, with 2.5 million allocated for R&D initiatives and plans to launch three new products by March.<sup><a href="#footnote-5" class="citation-badge">5</a></sup>""",
-        "footnotes": [1, 2, 5]
-    },
-    "Product roadmap 2025": {
-        "response": """The 2025 product roadmap presents a comprehensive strategic vision that aligns with both market demands and the company's commitment to sustainable innovation. The roadmap illustrates a carefully planned development timeline with key milestones that position the company for continued market leadership.<sup><a href="#footnote-4" class="citation-badge">4</a></sup>
-
-The strategic planning document reveals a multi-phase approach to product development, with particular emphasis on green technology solutions. This focus is well-aligned with market research findings that show 67% of surveyed customers are willing to pay premium prices for eco-friendly alternatives.<sup><a href="#footnote-2" class="citation-badge">2</a></sup>
-
-The resource allocation strategy demonstrates prudent financial management, with significant investment in R&D initiatives that support the product development pipeline. The board meeting discussions confirm the allocation of 2.5 million for R&D, with expectations of launching three new products by March 2025.<sup><a href="#footnote-5" class="citation-badge">5</a></sup>
-
-The go-to-market timelines outlined in the roadmap suggest a systematic approach to product launches, ensuring that each release is supported by adequate market research and customer feedback integration. This methodology has proven successful in previous quarters and is expected to drive continued revenue growth.<sup><a href="#footnote-1" class="citation-badge">1</a></sup>""",
-        "footnotes": [4, 2, 5, 1]
-    },
-    "Customer feedback summary": {
-        "response": """The customer feedback analysis reveals significant insights into consumer behavior and preferences that directly inform strategic decision-making. The comprehensive study of customer sentiment demonstrates a clear trend toward sustainability-focused purchasing decisions, with 67% of participants indicating willingness to pay premium prices for eco-friendly alternatives.<sup><a href="#footnote-2" class="citation-badge">2</a></sup>
-
-This consumer behavior pattern aligns perfectly with the company's strategic pivot toward green technology solutions, suggesting that the market is receptive to sustainable product offerings. The feedback data provides strong validation for the product roadmap initiatives planned for 2025.<sup><a href="#footnote-4" class="citation-badge">4</a></sup>
-
-The analysis also reveals important insights about customer retention strategies, which were emphasized in the recent board meeting discussions. The CEO's focus on customer retention while exploring new market segments appears to be well-supported by the feedback data.<sup><a href="#footnote-5" class="citation-badge">5</a></sup>
-
-These findings have significant implications for revenue growth strategies, particularly given the 23% increase in Q4 2024 revenue. The customer feedback suggests that the company's current approach to market expansion and product development is resonating well with target demographics.<sup><a href="#footnote-1" class="citation-badge">1</a></sup>""",
-        "footnotes": [2, 4, 5, 1]
-    },
-    "Market research findings": {
-        "response": """The market research findings provide compelling evidence of shifting consumer preferences and emerging opportunities in the technology sector. The study, conducted across 5,000 participants, reveals a strong consumer demand for sustainable products that aligns with broader environmental consciousness trends.<sup><a href="#footnote-2" class="citation-badge">2</a></sup>
-
-The research demonstrates that 67% of surveyed customers are willing to pay premium prices for eco-friendly alternatives, indicating a significant market opportunity for companies that can effectively position themselves in the sustainability space. This finding directly supports the company's strategic initiatives in green technology solutions.<sup><a href="#footnote-2" class="citation-badge">2</a></sup>
-
-The market analysis also provides valuable insights into the Southeast Asian market expansion that has contributed to the 23% revenue increase in Q4 2024. The research suggests that these regions present continued growth opportunities, particularly for sustainable technology products.<sup><a href="#footnote-1" class="citation-badge">1</a></sup>
-
-These findings have informed the strategic planning outlined in the 2025 product roadmap, ensuring that market research insights are directly integrated into product development and go-to-market strategies.<sup><a href="#footnote-4" class="citation-badge">4</a></sup> The board meeting discussions reflect this integration, with strategic initiatives focused on capitalizing on identified market opportunities.<sup><a href="#footnote-5" class="citation-badge">5</a></sup>""",
-        "footnotes": [2, 1, 4, 5]
-    }
-}
-
 def show_landing_page():
     st.markdown("""
     <div class="main-header">
@@ -366,6 +357,11 @@ def show_landing_page():
     with col3:
         audio_file = st.file_uploader(" Audio", type=['mp3', 'wav', 'ogg'], key="audio")
     
+    uploaded_files = [f for f in (pdf_file, img_file, audio_file) if f is not None]
+    if uploaded_files:
+        submit_uploads(load_search_service(), load_ingest_manager, uploaded_files, icons=NO_ICONS)
+    show_ingest_progress(load_ingest_manager, icons=NO_ICONS)
+    
     st.markdown("<br>", unsafe_allow_html=True)
     
     
@@ -398,140 +394,157 @@ def show_landing_page():
     
     st.markdown("<br>", unsafe_allow_html=True)
 
-def show_loading_animation():
-    with st.spinner(''):
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        stages = [
-            "Analyzing query semantics...",
-            "Generating embeddings...",
-            "Searching vector database...",
-            "Processing multimodal content...",
-            "Ranking results by relevance...",
-            "Preparing citations..."
-        ]
-        
-        for i, stage in enumerate(stages):
-            status_text.text(stage)
-            progress_bar.progress((i + 1) / len(stages))
-            time.sleep(3)
-        
-        progress_bar.empty()
-        status_text.empty()
+def show_research_analysis(query):
+    """Stream the research analysis and return the grouped search results
 
-def show_llm_response(query):
-    """Display LLM-style response with citations"""
-    if query in LLM_RESPONSES:
-        response_data = LLM_RESPONSES[query]
-        
-        st.markdown("""
-        <div class="llm-response">
-            <div class="response-header">
-                <div class="ai-avatar">AI</div>
-                <div>
-                    <h3 style="margin: 0; color: #f9fafb;">Research Analysis</h3>
-                    <p style="margin: 0; color: #9ca3af; font-size: 0.9rem;">Generated by IntelliSearch</p>
-                </div>
+    On a cache miss the search runs on a worker thread, so the answer starts
+    streaming from the keyword hits while dense search and fusion finish.
+    """
+    service = load_search_service()
+    hits = service.cached(query, k=TOP_K)
+    if hits is not None:
+        show_llm_response(query, hits)
+        return group_results(hits)
+
+    progress = PipelineProgress(service.search_stages)
+    progress_bar = st.progress(0.0, text=progress.current_stage)
+
+    def show_progress():
+        progress_bar.progress(progress.completed / progress.total, text=progress.current_stage or "Search complete")
+
+    passage_queue = queue.Queue()
+    future = load_search_executor().submit(search_into_queue, service, query, progress, passage_queue)
+    show_llm_response(query, iter_passages(passage_queue, on_wait=show_progress))
+    results = future.result()
+    progress_bar.empty()
+    return results
+
+def citation_details(passage_id, passage):
+    """Reference details for a cited passage, falling back to its stored metadata"""
+    if passage_id in CITATION_DETAILS:
+        return CITATION_DETAILS[passage_id]
+    location = f"Page {passage['page']}" if passage.get('page') else passage.get('timestamp', '')
+    return {
+        "type": passage.get('type', passage.get('modality', 'Document')),
+        "title": passage.get('source', 'Uploaded file'),
+        "author": "Uploaded content",
+        "date": location,
+        "context": passage.get('content') or passage.get('description') or passage.get('transcript', '')
+    }
+
+def show_llm_response(query, passages):
+    """Stream the generated answer into the panel, citing passages as they are used"""
+    st.markdown("""
+    <div class="llm-response">
+        <div class="response-header">
+            <div class="ai-avatar">AI</div>
+            <div>
+                <h3 style="margin: 0; color: #f9fafb;">Research Analysis</h3>
+                <p style="margin: 0; color: #9ca3af; font-size: 0.9rem;">Generated by IntelliSearch</p>
             </div>
         </div>
-        """, unsafe_allow_html=True)
-        
-        st.markdown(f"""
-        <div class="llm-response">
-            {response_data['response']}
+    </div>
+    """, unsafe_allow_html=True)
+    
+    answer_box = st.empty()
+    answer = ""
+    cited = {}
+    last_flush = 0.0
+    started = time.perf_counter()
+    for token in load_generator().stream(query, passages):
+        if not answer:
+            record("generate.first_token", time.perf_counter() - started)
+        if isinstance(token, Citation):
+            cited.setdefault(token.passage_id, token.passage)
+            answer += f'<sup><a href="#footnote-{token.passage_id}" class="citation-badge">{token.passage_id}</a></sup>'
+        else:
+            answer += html.escape(token)
+        # Redraw at a bounded rate, but always show a citation as soon as it lands
+        now = time.perf_counter()
+        if isinstance(token, Citation) or now - last_flush >= STREAM_FLUSH_SECONDS:
+            answer_box.markdown(f'<div class="llm-response">{answer}</div>', unsafe_allow_html=True)
+            last_flush = now
+    answer_box.markdown(f'<div class="llm-response">{answer}</div>', unsafe_allow_html=True)
+    record("generate", time.perf_counter() - started)
+    
+    # Display footnotes
+    if cited:
+        st.markdown("""
+        <div class="footnote-section">
+            <h4 style="color: #f9fafb; margin-bottom: 1rem;">References</h4>
         </div>
         """, unsafe_allow_html=True)
         
-        # Display footnotes
-        if response_data['footnotes']:
-            st.markdown("""
-            <div class="footnote-section">
-                <h4 style="color: #f9fafb; margin-bottom: 1rem;">References</h4>
+        for footnote_id, passage in cited.items():
+            # Uploaded files supply the title and context, so every field is escaped before it meets the markup
+            details = {name: html.escape(str(value)) for name, value in citation_details(footnote_id, passage).items()}
+            st.markdown(f"""
+            <div class="footnote-item">
+                <p style="margin: 0;"><strong>[{html.escape(str(footnote_id))}]</strong> {details['title']}</p>
+                <p style="margin: 0.25rem 0; color: #64748b; font-size: 0.9rem;">
+                    {details['type']}  {details['author']}  {details['date']}
+                </p>
+                <p style="margin: 0; color: #64748b; font-size: 0.85rem; font-style: italic;">
+                    {details['context']}
+                </p>
             </div>
             """, unsafe_allow_html=True)
-            
-            for footnote_id in response_data['footnotes']:
-                if footnote_id in CITATION_DETAILS:
-                    details = CITATION_DETAILS[footnote_id]
-                    st.markdown(f"""
-                    <div class="footnote-item">
-                        <p style="margin: 0;"><strong>[{footnote_id}]</strong> {details['title']}</p>
-                        <p style="margin: 0.25rem 0; color: #64748b; font-size: 0.9rem;">
-                            {details['type']}  {details['author']}  {details['date']}
-                        </p>
-                        <p style="margin: 0; color: #64748b; font-size: 0.85rem; font-style: italic;">
-                            {details['context']}
-                        </p>
-                    </div>
-                    """, unsafe_allow_html=True)
 
-def show_citation_modal(citation_id):
-    if citation_id in CITATION_DETAILS:
-        details = CITATION_DETAILS[citation_id]
-        
-        st.markdown(f"""
-        <div style="background: #1f2937; padding: 1.5rem; border-radius: 10px; border-left: 4px solid #1e3a8a; margin-top: 1rem;">
-            <h4 style="color: #60a5fa;"> Citation [{citation_id}] Details</h4>
-            <p style="color: #f9fafb;"><strong>Type:</strong> {details['type']}</p>
-            <p style="color: #f9fafb;"><strong>Title:</strong> {details['title']}</p>
-            <p style="color: #f9fafb;"><strong>Author:</strong> {details['author']}</p>
-            <p style="color: #f9fafb;"><strong>Date:</strong> {details['date']}</p>
-            <p style="color: #f9fafb;"><strong>Context:</strong> {details['context']}</p>
-        </div>
-        """, unsafe_allow_html=True)
-
-def show_results():
-    # Check if a sidebar query was selected
-    if st.session_state.selected_sidebar_query:
-        query_to_show = st.session_state.selected_sidebar_query
-    else:
-        query_to_show = st.session_state.query
+def show_citation_modal(citation_id, result=None):
+    """Reference details for a result, from CITATION_DETAILS or the result's own source metadata"""
+    if citation_id not in CITATION_DETAILS and result is None:
+        return
+    details = {name: html.escape(str(value)) for name, value in citation_details(citation_id, result or {}).items()}
 
-    # If the query is not in our predefined responses, use a default one
-    if query_to_show not in LLM_RESPONSES:
-        # Use the first available response as default
-        query_to_show = list(LLM_RESPONSES.keys())[0]
-    
     st.markdown(f"""
-    <div class="main-header">
-        <h1>Research Analysis</h1>
-        <p style="font-size: 1.5rem; margin: 0.5rem 0 0 0;">Query: "{query_to_show}"</p>
+    <div style="background: #1f2937; padding: 1.5rem; border-radius: 10px; border-left: 4px solid #1e3a8a; margin-top: 1rem;">
+        <h4 style="color: #60a5fa;"> Citation [{html.escape(str(citation_id))}] Details</h4>
+        <p style="color: #f9fafb;"><strong>Type:</strong> {details['type']}</p>
+        <p style="color: #f9fafb;"><strong>Title:</strong> {details['title']}</p>
+        <p style="color: #f9fafb;"><strong>Author:</strong> {details['author']}</p>
+        <p style="color: #f9fafb;"><strong>Date:</strong> {details['date']}</p>
+        <p style="color: #f9fafb;"><strong>Context:</strong> {details['context']}</p>
     </div>
     """, unsafe_allow_html=True)
-    
-    # Show loading animation
-    show_loading_animation()
-    
-    # Display LLM response first
-    show_llm_response(query_to_show)
-    
-    st.success(f" Found {len(MOCK_RESULTS['text']) + len(MOCK_RESULTS['images']) + len(MOCK_RESULTS['audio'])} supporting documents across all modalities")
-    
-    # Sidebar for filters and recent queries
-    with st.sidebar:
+
+def show_audio_clip(result):
+    """Play only the matched segment, cut from the recording by frame or byte range"""
+    try:
+        with span("clip"):
+            clip = clip_for_record(result, search_dirs=(ASSET_DIR,))
+    except AudioClipError as e:
+        st.error(str(e))
+        return
+    if clip is None:
+        st.info(f"Recording {result['source']} is not available offline")
+    else:
+        st.audio(clip[0], format=clip[1])
+
+@st.fragment
+def show_result_list(results, filters_box):
+    """Render the filtered result cards; filter changes rerun only this fragment"""
+    with span("render"):
+        render_result_list(results, filters_box)
+
+def render_result_list(results, filters_box):
+    """Filters and result cards for every modality"""
+    with filters_box:
         st.markdown("###  Filters")
         show_text = st.checkbox(" Text Documents", value=True)
         show_images = st.checkbox(" Images", value=True)
         show_audio = st.checkbox(" Audio", value=True)
         
         st.markdown("###  Relevance Threshold")
-        relevance = st.slider("Minimum Score", 0.0, 1.0, 0.8)
-        
-        st.markdown("###  Recent Queries")
-        for i, recent_query in enumerate(st.session_state.recent_queries):
-            if st.button(f" {recent_query['query']}\n{recent_query['timestamp']}  {recent_query['results']} results", 
-                        key=f"sidebar_query_{i}", use_container_width=True):
-                st.session_state.selected_sidebar_query = recent_query['query']
-                st.rerun()
+        relevance = st.slider("Minimum Score", 0.0, 1.0, 0.3)
     
     # Text results
     if show_text:
         st.markdown("##  Supporting Documents")
-        for result in MOCK_RESULTS['text']:
+        for result in results['text']:
             if result['relevance'] >= relevance:
-                # Highlight keywords in content
-                highlighted_content = result['content'].replace(
+                # Uploaded sources and text are escaped before the highlight markup is added
+                source = html.escape(result['source'])
+                highlighted_content = html.escape(result['content']).replace(
                     "quarterly financial report",
                     '<span class="highlight">quarterly financial report</span>'
                 ).replace(
@@ -550,10 +563,10 @@ def show_results():
                     st.markdown(f"""
                     <div class="result-card">
                         <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 0.5rem;">
-                            <h4 style="margin: 0; color: #60a5fa;">{result['source']}</h4>
+                            <h4 style="margin: 0; color: #60a5fa;">{source}</h4>
                             <span class="match-badge">{result["relevance"]*100:.0f}% match</span>
                         </div>
-                        <p class="page-info">Page {result["page"]}</p>
+                        <p class="page-info">Page {html.escape(str(result["page"]))}</p>
                     </div>
                     """, unsafe_allow_html=True)
                     
@@ -565,26 +578,28 @@ def show_results():
                     # Citation and button row
                     col1, col2 = st.columns([1, 5])
                     with col1:
-                        st.markdown(f'<span class="citation-badge">[{result["id"]}]</span>', unsafe_allow_html=True)
+                        st.markdown(f'<span class="citation-badge">[{html.escape(str(result["id"]))}]</span>', unsafe_allow_html=True)
                     with col2:
                         if st.button(f"View Citation Details", key=f"cite_{result['id']}"):
-                            show_citation_modal(result['id'])
+                            show_citation_modal(result['id'], result)
     
     # Image results
     if show_images:
         st.markdown("##  Visual Data")
         cols = st.columns(2)
-        for idx, result in enumerate(MOCK_RESULTS['images']):
+        for idx, result in enumerate(results['images']):
             if result['relevance'] >= relevance:
                 with cols[idx % 2]:
+                    source = html.escape(result['source'])
+                    description = html.escape(result["description"])
                     # Header with title and match badge
                     st.markdown(f"""
                     <div class="result-card">
                         <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 0.5rem;">
-                            <h4 style="margin: 0; color: #60a5fa;">{result['source']}</h4>
+                            <h4 style="margin: 0; color: #60a5fa;">{source}</h4>
                             <span class="match-badge">{result["relevance"]*100:.0f}% match</span>
                         </div>
-                        <p class="page-info">Page {result["page"]}</p>
+                        <p class="page-info">Page {html.escape(str(result["page"]))}</p>
                     </div>
                     """, unsafe_allow_html=True)
                     
@@ -595,46 +610,47 @@ def show_results():
                         #st.image(result['image_path'], use_container_width=True)
                     # Replace the media thumbnail section with actual image display
                     if result['id'] == 3:
-                        st.image("Q4 Revenue Table.jpg", use_container_width=True)
+                        st.image(get_thumbnail(os.path.join(ASSET_DIR, "Q4 Revenue Table.jpg")), use_container_width=True)
                     elif result['id'] == 4:
-                        st.image("Q4_Rev Analysis.jpg", use_container_width=True)
+                        st.image(get_thumbnail(os.path.join(ASSET_DIR, "Q4_Rev Analysis.jpg")), use_container_width=True)
                     else:
                         # For demo purposes with placeholder
                         st.markdown(f"""
                         <div class="media-thumbnail">
                             <div style="text-align: center;">
                                 <p style="color: #60a5fa; font-weight: bold; font-size: 1.1rem; margin-bottom: 0.5rem;">📊 Chart Visualization</p>
-                                <p style="color: #9ca3af; font-size: 0.9rem;">{result["description"]}</p>
+                                <p style="color: #9ca3af; font-size: 0.9rem;">{description}</p>
                             </div>
                         </div>
                         """, unsafe_allow_html=True)
                     
                     # Description content
                     st.markdown(f"""
-                    <div class="content-box">{result["description"]}</div>
+                    <div class="content-box">{description}</div>
                     """, unsafe_allow_html=True)
                     
                     # Citation and button
                     col1, col2 = st.columns([1, 5])
                     with col1:
-                        st.markdown(f'<span class="citation-badge">[{result["id"]}]</span>', unsafe_allow_html=True)
+                        st.markdown(f'<span class="citation-badge">[{html.escape(str(result["id"]))}]</span>', unsafe_allow_html=True)
                     with col2:
                         if st.button(f"View Details", key=f"img_{result['id']}"):
-                            show_citation_modal(result['id'])
+                            show_citation_modal(result['id'], result)
     
     # Audio results
     if show_audio:
         st.markdown("##  Audio Recordings")
-        for result in MOCK_RESULTS['audio']:
+        for result in results['audio']:
             if result['relevance'] >= relevance:
+                source = html.escape(result['source'])
                 # Header with title and match badge
                 st.markdown(f"""
                 <div class="result-card">
                     <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 0.5rem;">
-                        <h4 style="margin: 0; color: #60a5fa;">{result['source']}</h4>
+                        <h4 style="margin: 0; color: #60a5fa;">{source}</h4>
                         <span class="match-badge">{result["relevance"]*100:.0f}% match</span>
                     </div>
-                    <p class="page-info">Duration: {result["duration"]}</p>
+                    <p class="page-info">Segment {html.escape(str(result.get("timestamp", "0:00")))} of {html.escape(str(result["duration"]))}</p>
                 </div>
                 """, unsafe_allow_html=True)
                 
@@ -642,19 +658,53 @@ def show_results():
                 st.markdown(f"""
                 <div class="audio-transcript">
                     <strong> Transcript:</strong><br>
-                    {result["transcript"]}
+                    {html.escape(result["transcript"])}
                 </div>
                 """, unsafe_allow_html=True)
                 
                 # Action buttons
+                # Segments of one recording share its id, so widget keys use the doc id
                 col1, col2, col3 = st.columns([1, 1, 4])
                 with col1:
-                    st.button(" Play Audio", key=f"play_{result['id']}")
+                    play = st.button(" Play Audio", key=f"play_{result['doc_id']}")
                 with col2:
-                    st.markdown(f'<span class="citation-badge">[{result["id"]}]</span>', unsafe_allow_html=True)
+                    st.markdown(f'<span class="citation-badge">[{html.escape(str(result["id"]))}]</span>', unsafe_allow_html=True)
                 with col3:
-                    if st.button(f"View Full Transcript", key=f"audio_{result['id']}"):
-                        show_citation_modal(result['id'])
+                    if st.button(f"View Full Transcript", key=f"audio_{result['doc_id']}"):
+                        show_citation_modal(result['id'], result)
+                if play:
+                    show_audio_clip(result)
+
+def show_results():
+    # Check if a sidebar query was selected
+    if st.session_state.selected_sidebar_query:
+        query_to_show = st.session_state.selected_sidebar_query
+    else:
+        query_to_show = st.session_state.query
+    
+    st.markdown(f"""
+    <div class="main-header">
+        <h1>Research Analysis</h1>
+        <p style="font-size: 1.5rem; margin: 0.5rem 0 0 0;">Query: "{html.escape(query_to_show)}"</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # Stream the answer while the search runs; reruns reuse the cached results
+    results = show_research_analysis(query_to_show)
+    
+    st.success(f" Found {len(results['text']) + len(results['images']) + len(results['audio'])} supporting documents across all modalities")
+    
+    # Filters live in a sidebar container owned by the result list fragment
+    filters_box = st.sidebar.container()
+    with st.sidebar:
+        st.markdown("###  Recent Queries")
+        for i, recent_query in enumerate(st.session_state.recent_queries):
+            if st.button(f" {recent_query['query']}\n{recent_query['timestamp']}  {recent_query['results']} results", 
+                        key=f"sidebar_query_{i}", use_container_width=True):
+                st.session_state.selected_sidebar_query = recent_query['query']
+                st.rerun()
+    
+    show_result_list(results, filters_box)
     
     # New search button
     st.markdown("<br><br>", unsafe_allow_html=True)
@@ -671,6 +721,9 @@ if not st.session_state.search_done:
     show_landing_page()
 else:
     show_results()
+show_memory_usage(in_sidebar=True)
+start_exporter()
+start_governor()
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,251 @@
+# Near-Duplicate Chunk Detection for the Multimodal RAG System
+
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+from text_index import tokenize
+
+# MinHash signature length, split into LSH bands of NUM_PERM / BANDS rows
+NUM_PERM = 64
+BANDS = 16
+
+# Words per shingle; short shingles keep revisions with a few edited figures similar
+SHINGLE_TOKENS = 3
+
+# Estimated Jaccard similarity at or above which a chunk joins an existing cluster
+JACCARD_THRESHOLD = 0.75
+
+SEED = 0x5EED
+
+
+class MinHasher:
+    """Deterministic MinHash signatures over word shingles
+
+    Tokens are hashed with CRC32, so signatures are identical in every
+    process and across restarts. Each of the ``num_perm`` hash functions is
+    a multiply-shift hash of the 64-bit shingle hash.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, shingle_tokens=SHINGLE_TOKENS, seed=SEED):
+        self.num_perm = num_perm
+        self.shingle_tokens = shingle_tokens
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    def shingles(self, text):
+        """64-bit hashes of the text's overlapping word shingles"""
+        tokens = np.array([zlib.crc32(token.encode("utf-8")) for token in tokenize(text)], dtype=np.uint64)
+        if len(tokens) == 0:
+            return tokens
+        width = min(self.shingle_tokens, len(tokens))
+        hashes = tokens[:len(tokens) - width + 1].copy()
+        for offset in range(1, width):
+            hashes = hashes * np.uint64(0x100000001B3) ^ tokens[offset:len(tokens) - width + 1 + offset]
+        return np.unique(hashes)
+
+    def signature(self, text):
+        """uint32 MinHash signature of a text, or None when it has no words"""
+        shingles = self.shingles(text)
+        if len(shingles) == 0:
+            return None
+        values = (self._a[:, None] * shingles[None, :] + self._b[:, None]) >> np.uint64(32)
+        return values.min(axis=1).astype(np.uint32)
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(signature == other))
+
+
+class NearDuplicateIndex:
+    """Persistent MinHash LSH index clustering near-duplicate chunks
+
+    Each cluster representative is stored in one bucket per band, keyed by
+    a hash of that band's rows; a bucket holds every representative that
+    hashes into it. A new chunk's candidates are the
+    representatives sharing any bucket with it, verified against the full
+    signature. Lookups and inserts are B-tree searches in SQLite, so they
+    take logarithmic time and constant memory however many chunks are
+    indexed. Duplicates are recorded as cluster members but never indexed;
+    their signature, record and vector are kept so one can take over as
+    representative when the file it duplicated is replaced.
+    """
+
+    def __init__(self, db_path, bands=BANDS, threshold=JACCARD_THRESHOLD, hasher=None):
+        self.db_path = db_path
+        self.hasher = hasher or MinHasher()
+        if self.hasher.num_perm % bands:
+            raise ValueError(f"{self.hasher.num_perm} permutations cannot be split into {bands} bands")
+        self.bands = bands
+        self.threshold = threshold
+        self._multipliers = np.random.default_rng(SEED + 1).integers(
+            1, 2 ** 63, self.hasher.num_perm // bands, dtype=np.uint64)
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # 64 MB page cache keeps the upper B-tree levels of every table in memory
+        self._db.execute("PRAGMA cache_size=-65536")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS signatures (chunk_id TEXT PRIMARY KEY, signature BLOB) WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "band INTEGER, bucket INTEGER, chunk_id TEXT, PRIMARY KEY (band, bucket, chunk_id)) WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS members ("
+            "chunk_id TEXT PRIMARY KEY, representative TEXT, source TEXT, page INTEGER, similarity REAL, "
+            "signature BLOB, record TEXT, vector BLOB)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS members_representative ON members (representative)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS members_source ON members (source)")
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self):
+        """Number of cluster representatives"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def band_keys(self, signature):
+        """One signed 64-bit bucket key per band"""
+        rows = signature.astype(np.uint64).reshape(self.bands, -1)
+        return (rows * self._multipliers).sum(axis=1, dtype=np.uint64).view(np.int64).tolist()
+
+    def _nearest(self, signature, keys):
+        """(representative id, similarity) of the closest cluster above the threshold, or None"""
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(row[0] for row in self._db.execute(
+                "SELECT chunk_id FROM buckets WHERE band = ? AND bucket = ?", (band, key)))
+        best = None
+        for chunk_id in candidates:
+            stored = self._db.execute("SELECT signature FROM signatures WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            score = similarity(signature, np.frombuffer(stored[0], dtype=np.uint32))
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (chunk_id, score)
+        return best
+
+    def _add_representative(self, chunk_id, signature, keys):
+        self._db.execute("INSERT OR REPLACE INTO signatures VALUES (?, ?)", (chunk_id, signature.tobytes()))
+        self._db.executemany("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)",
+                             [(band, key, chunk_id) for band, key in enumerate(keys)])
+
+    def assign(self, entries, payloads=None):
+        """Cluster (chunk id, source, page, signature) entries; returns representative ids
+
+        An entry's own id is returned when it starts a new cluster and the
+        representative's id when it is a near duplicate. Entries without a
+        signature always start their own cluster and are not stored.
+        Entries are matched against each other as well as earlier batches.
+        ``payloads`` holds a (record, vector) pair per entry, kept for the
+        duplicates so they can be indexed if they are promoted later;
+        without it, duplicates are taken to be indexed already.
+        """
+        representatives = []
+        payloads = iter(payloads) if payloads is not None else None
+        with self._lock:
+            for chunk_id, source, page, signature in entries:
+                record, vector = next(payloads) if payloads is not None else (None, None)
+                if signature is None:
+                    representatives.append(chunk_id)
+                    continue
+                keys = self.band_keys(signature)
+                nearest = self._nearest(signature, keys)
+                kept = (signature.tobytes(), json.dumps(record) if record is not None else None,
+                        np.asarray(vector, dtype=np.float32).tobytes() if vector is not None else None)
+                if nearest is None:
+                    self._add_representative(chunk_id, signature, keys)
+                    nearest = (chunk_id, 1.0)
+                    kept = (None, None, None)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO members "
+                    "(chunk_id, representative, source, page, similarity, signature, record, vector) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (chunk_id, nearest[0], source, page, nearest[1]) + kept
+                )
+                representatives.append(nearest[0])
+            self._db.commit()
+        return representatives
+
+    def remove_source(self, source):
+        """Forget every chunk of a source file, e.g. before a new version of it is indexed
+
+        Members from other files in the clusters it represents are
+        re-clustered, most similar first: each joins the nearest remaining
+        cluster or becomes a representative itself. Returns (record,
+        vector) pairs for the promoted members that were never indexed,
+        which the caller must index for their text to stay searchable.
+        Members recorded before signatures were kept cannot be
+        re-clustered and are dropped with their cluster.
+        """
+        promoted = []
+        with self._lock:
+            representatives = [row[0] for row in self._db.execute(
+                "SELECT chunk_id FROM members WHERE source = ? AND representative = chunk_id", (source,))]
+            for chunk_id in representatives:
+                stored = self._db.execute("SELECT signature FROM signatures WHERE chunk_id = ?", (chunk_id,)).fetchone()
+                if stored is not None:
+                    keys = self.band_keys(np.frombuffer(stored[0], dtype=np.uint32))
+                    self._db.executemany("DELETE FROM buckets WHERE band = ? AND bucket = ? AND chunk_id = ?",
+                                         [(band, key, chunk_id) for band, key in enumerate(keys)])
+                self._db.execute("DELETE FROM signatures WHERE chunk_id = ?", (chunk_id,))
+            # Every old representative is gone before survivors look for a new cluster to join
+            for chunk_id in representatives:
+                survivors = self._db.execute(
+                    "SELECT chunk_id, signature, record, vector FROM members "
+                    "WHERE representative = ? AND source != ? AND signature IS NOT NULL ORDER BY similarity DESC",
+                    (chunk_id, source)
+                ).fetchall()
+                self._db.execute("DELETE FROM members WHERE representative = ? AND signature IS NULL", (chunk_id,))
+                for member, stored, record, vector in survivors:
+                    signature = np.frombuffer(stored, dtype=np.uint32)
+                    keys = self.band_keys(signature)
+                    nearest = self._nearest(signature, keys)
+                    if nearest is not None:
+                        self._db.execute("UPDATE members SET representative = ?, similarity = ? WHERE chunk_id = ?",
+                                         (nearest[0], nearest[1], member))
+                        continue
+                    self._add_representative(member, signature, keys)
+                    self._db.execute(
+                        "UPDATE members SET representative = chunk_id, similarity = 1.0, "
+                        "signature = NULL, record = NULL, vector = NULL WHERE chunk_id = ?", (member,))
+                    if record is not None:
+                        promoted.append((json.loads(record), np.frombuffer(vector, dtype=np.float32)))
+            self._db.execute("DELETE FROM members WHERE source = ?", (source,))
+            self._db.commit()
+        return promoted
+
+    def cluster(self, chunk_id):
+        """Members of the cluster a chunk belongs to, representative first"""
+        with self._lock:
+            row = self._db.execute("SELECT representative FROM members WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if row is None:
+                return []
+            rows = self._db.execute(
+                "SELECT chunk_id, source, page, similarity FROM members WHERE representative = ? "
+                "ORDER BY similarity DESC", (row[0],)
+            ).fetchall()
+        return [{"chunk_id": member, "source": source, "page": page, "similarity": score}
+                for member, source, page, score in rows]
+
+
+def chunk_label(record, row):
+    """Cluster id of an indexed record: its id, or source and row for seed records without one"""
+    return record.get("id") or f"{record.get('source', '')}#{row}"
+
+
+def is_deduplicated(record):
+    """Only document text is clustered; images and audio segments describe distinct media"""
+    return record.get("modality", "text") == "text" and record.get("type", "text") == "text"
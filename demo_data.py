@@ -4,6 +4,7 @@ import json
 import base64
 from PIL import Image, ImageDraw, ImageFont
 import io
+from audio_segments import format_range, parse_timestamp, segment_records, segment_transcript
 
 # Extended demo results with more variety
 EXTENDED_DEMO_RESULTS = {
@@ -268,6 +269,85 @@ def create_demo_diagram_image(width=400, height=300):
     
     return img
 
+def get_demo_corpus():
+    """Flatten the demo results into a list of indexable chunks
+
+    Audio clips get the start/end offsets of their transcript excerpt.
+    """
+    corpus = []
+    for scenario_results in EXTENDED_DEMO_RESULTS.values():
+        for result in scenario_results:
+            result = dict(result)
+            if result["type"] == "audio":
+                segment = segment_transcript(result.get("transcript", ""), parse_timestamp(result["timestamp"]))
+                if segment:
+                    start, end = segment[0]["start"], segment[-1]["end"]
+                    result.update(start=start, end=round(end, 2), timestamp=format_range(start, end))
+            corpus.append(result)
+    return corpus
+
+# Mock research results for the IntelliSearch demo (clapp.py)
+MOCK_RESULTS = {
+    "text": [
+        {
+            "id": 1,
+            "content": "The quarterly financial report indicates a 23% increase in revenue compared to Q3 2024. Operating expenses remained stable at 15.2 million, while net profit margins improved to 18.5%. The growth was primarily driven by expanded market presence in Southeast Asian regions.",
+            "source": "Q4_Financial_Report_2024.pdf",
+            "page": 12,
+            "relevance": 0.94
+        },
+        {
+            "id": 2,
+            "content": "Market analysis shows strong consumer demand for sustainable products, with 67% of surveyed customers indicating willingness to pay premium prices for eco-friendly alternatives. This trend aligns with our strategic pivot towards green technology solutions.",
+            "source": "Market_Research_Summary.docx",
+            "page": 5,
+            "relevance": 0.89
+        }
+    ],
+    "images": [
+        {
+            "id": 3,
+            "description": "Revenue growth chart showing Q1-Q4 2024 performance metrics with projections for 2025",
+            "source": "Financial_Presentation.png",
+            "page": 1,
+            "relevance": 0.92
+        },
+        {
+            "id": 4,
+            "description": "Product roadmap diagram illustrating development timeline and key milestones",
+            "source": "Strategy_Document.jpg",
+            "page": 1,
+            "relevance": 0.85
+        }
+    ],
+    "audio": [
+        {
+            "id": 5,
+            "transcript": "In today's board meeting, we discussed the expansion strategy for Q1 2025. The CEO emphasized focusing on customer retention while exploring new market segments. We're allocating 2.5 million for R&D initiatives and expect to launch three new products by March.",
+            "source": "Board_Meeting_Jan2025.mp3",
+            "duration": "2:45",
+            "relevance": 0.87
+        }
+    ]
+}
+
+def get_mock_corpus():
+    """Flatten MOCK_RESULTS into indexable records tagged with their modality
+
+    Audio transcripts are split into time-stamped segments so a hit points
+    at the part of the recording that matched.
+    """
+    corpus = []
+    for modality, results in MOCK_RESULTS.items():
+        for result in results:
+            record = dict(result, modality=modality)
+            if modality == "audio":
+                segments = segment_transcript(record["transcript"], 0.0, parse_timestamp(record["duration"]))
+                corpus.extend(segment_records(record, segments))
+            else:
+                corpus.append(record)
+    return corpus
+
 # Sample queries for demo
 SAMPLE_QUERIES = [
     "Show me the financial performance for Q3",
@@ -280,12 +360,10 @@ SAMPLE_QUERIES = [
     "Find benchmark results for machine learning workloads"
 ]
 
-# System metrics for demo
-SYSTEM_METRICS = {
-    "documents_indexed": 1247,
-    "images_processed": 3456,
-    "audio_files_transcribed": 89,
-    "total_queries": 15678,
-    "average_response_time": "1.2s",
-    "system_uptime": "99.9%"
-}
+# Recent queries pre-filled in the clapp.py sidebar
+RECENT_QUERIES = [
+    {"query": "Revenue analysis Q4", "timestamp": "2 hours ago", "results": 5},
+    {"query": "Product roadmap 2025", "timestamp": "1 day ago", "results": 8},
+    {"query": "Customer feedback summary", "timestamp": "3 days ago", "results": 12},
+    {"query": "Market research findings", "timestamp": "1 week ago", "results": 15}
+]
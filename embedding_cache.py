@@ -0,0 +1,164 @@
+# Content-Addressed Embedding Cache for the Multimodal RAG System
+
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_data", "embedding_cache.sqlite")
+
+# Roughly 1 GB of float32 vectors at 256 dimensions
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH = 500
+
+# Least recently used entries deleted per statement while evicting
+EVICT_BATCH = 256
+
+# Triggers keep the byte total in the meta table current for every writer process
+TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS embeddings_bytes_insert AFTER INSERT ON embeddings BEGIN "
+    "UPDATE meta SET value = value + LENGTH(NEW.vector) WHERE key = 'bytes'; END",
+    "CREATE TRIGGER IF NOT EXISTS embeddings_bytes_delete AFTER DELETE ON embeddings BEGIN "
+    "UPDATE meta SET value = value - LENGTH(OLD.vector) WHERE key = 'bytes'; END",
+    "CREATE TRIGGER IF NOT EXISTS embeddings_bytes_update AFTER UPDATE OF vector ON embeddings BEGIN "
+    "UPDATE meta SET value = value + LENGTH(NEW.vector) - LENGTH(OLD.vector) WHERE key = 'bytes'; END"
+)
+
+
+def content_hash(text):
+    """SHA-256 of a chunk's text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk cache of embeddings keyed by chunk content hash and encoder id
+
+    Backed by SQLite in WAL mode, so several ingestion worker processes
+    can read and write the same file concurrently. Entries are evicted
+    least recently used first once the stored vectors exceed ``max_bytes``.
+    The byte total is kept in a meta row by triggers, so neither inserts
+    nor eviction ever scan the whole table.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model_id TEXT, content_hash TEXT, dim INTEGER, vector BLOB, last_used REAL, "
+            "PRIMARY KEY (model_id, content_hash))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+        self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('bytes', 0)")
+        for trigger in TRIGGERS:
+            self._db.execute(trigger)
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def get_many(self, model_id, hashes):
+        """Return {content_hash: vector} for the hashes that are cached"""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), LOOKUP_BATCH):
+            batch = unique[start:start + LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._db.execute(
+                f"SELECT content_hash, dim, vector FROM embeddings "
+                f"WHERE model_id = ? AND content_hash IN ({placeholders})",
+                [model_id] + batch
+            ).fetchall()
+            for key, dim, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32, count=dim)
+        if found:
+            now = time.time()
+            self._db.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model_id = ? AND content_hash = ?",
+                [(now, model_id, key) for key in found]
+            )
+            self._db.commit()
+        self.hits += sum(1 for key in hashes if key in found)
+        self.misses += sum(1 for key in hashes if key not in found)
+        return found
+
+    def put_many(self, model_id, hashes, vectors):
+        """Store vectors under their content hashes and enforce the size bound"""
+        now = time.time()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # An upsert rather than INSERT OR REPLACE, whose implicit delete would not fire the byte trigger
+        self._db.executemany(
+            "INSERT INTO embeddings (model_id, content_hash, dim, vector, last_used) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (model_id, content_hash) DO UPDATE SET "
+            "dim = excluded.dim, vector = excluded.vector, last_used = excluded.last_used",
+            [(model_id, key, vector.shape[0], vector.tobytes(), now) for key, vector in zip(hashes, vectors)]
+        )
+        self._db.commit()
+        self.evict()
+
+    def size_bytes(self):
+        """Total bytes of cached vectors"""
+        return self._db.execute("SELECT value FROM meta WHERE key = 'bytes'").fetchone()[0]
+
+    def evict(self):
+        """Drop least recently used entries, at most EVICT_BATCH at a time, until the cache fits in max_bytes"""
+        while True:
+            excess = self.size_bytes() - self.max_bytes
+            if excess <= 0:
+                return
+            oldest = self._db.execute("SELECT LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1").fetchone()
+            if oldest is None:
+                return
+            # Vectors of one encoder share a size, so the oldest one tells how many rows cover the excess
+            count = min(EVICT_BATCH, -(-excess // max(oldest[0], 1)))
+            self._db.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (count,)
+            )
+            self._db.commit()
+
+
+class CachedEncoder:
+    """Wraps an encoder so unchanged chunks are never re-encoded"""
+
+    def __init__(self, encoder, cache):
+        self.encoder = encoder
+        self.cache = cache
+
+    @property
+    def dim(self):
+        return self.encoder.dim
+
+    @property
+    def model_id(self):
+        return self.encoder.model_id
+
+    def encode_one(self, text):
+        return self.encode([text])[0]
+
+    def encode(self, texts):
+        """Encode a batch, computing only the texts missing from the cache"""
+        hashes = [content_hash(text) for text in texts]
+        cached = self.cache.get_many(self.model_id, hashes)
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            fresh = self.encoder.encode(list(missing.values()))
+            self.cache.put_many(self.model_id, list(missing), fresh)
+            cached.update(zip(missing, fresh))
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([cached[key] for key in hashes])
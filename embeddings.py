@@ -0,0 +1,54 @@
+# Local Embedding Encoder for the Multimodal RAG System
+
+import zlib
+
+import numpy as np
+
+from text_index import tokenize
+
+DEFAULT_DIM = 256
+
+
+class HashingEncoder:
+    """Deterministic offline stand-in for the CLIP / sentence encoders
+
+    Word unigrams and character trigrams are hashed into a fixed number of
+    signed buckets and the result is L2-normalised, so cosine similarity is
+    a plain dot product.
+    """
+
+    model_name = "hashing-encoder"
+    version = "1"
+
+    def __init__(self, dim=DEFAULT_DIM):
+        self.dim = dim
+
+    @property
+    def model_id(self):
+        """Identifier that changes whenever encoded vectors would change"""
+        return f"{self.model_name}-v{self.version}-d{self.dim}"
+
+    def _features(self, text):
+        """Yield the hashed features of a piece of text"""
+        for term in tokenize(text):
+            yield term, 1.0
+            padded = f"#{term}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.5
+
+    def encode_one(self, text):
+        """Encode a single string into a unit-length float32 vector"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def encode(self, texts):
+        """Encode a batch of strings into an (n, dim) float32 matrix"""
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self.encode_one(text) for text in texts])
@@ -0,0 +1,83 @@
+# Streaming Answer Generation for the Multimodal RAG System
+
+import abc
+import re
+from collections import namedtuple
+
+from text_index import TEXT_FIELDS, tokenize
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+# Citation marker yielded between text tokens; ``passage`` is the cited record
+Citation = namedtuple("Citation", ["passage_id", "passage"])
+
+
+class AnswerGenerator(abc.ABC):
+    """Interface for generators that stream an answer as it is produced
+
+    ``stream(query, passages)`` yields text tokens and ``Citation`` markers.
+    ``passages`` is any iterable of retrieved records and may still be
+    filling while retrieval runs, so implementations should consume it
+    lazily and start yielding as soon as the first passage arrives.
+    """
+
+    model_name = "base"
+
+    @abc.abstractmethod
+    def stream(self, query, passages):
+        """Yield text tokens and Citation markers for the answer"""
+
+
+def passage_text(passage):
+    """Readable text of a retrieved record, excluding its source name"""
+    return " ".join(str(passage[field]) for field in TEXT_FIELDS
+                    if field not in ("source", "highlighted_text") and passage.get(field))
+
+
+class ExtractiveAnswerGenerator(AnswerGenerator):
+    """Deterministic local stand-in for the LLM
+
+    For each passage, in the order retrieval delivers them, it picks the
+    sentence sharing the most terms with the query and emits it word by
+    word, followed by a citation to that passage. Passages sharing no
+    terms with the query are skipped.
+    """
+
+    model_name = "extractive-v1"
+
+    def __init__(self, max_sentences=5):
+        self.max_sentences = max_sentences
+
+    def best_sentence(self, query_terms, passage):
+        """The passage sentence with the highest query term overlap, or None without any"""
+        best, best_overlap = None, 0
+        for sentence in SENTENCE_BOUNDARY.split(passage_text(passage).strip()):
+            overlap = len(query_terms & set(tokenize(sentence)))
+            if overlap > best_overlap:
+                best, best_overlap = sentence, overlap
+        if best and best[-1] not in ".!?":
+            best += "."
+        return best
+
+    def stream(self, query, passages):
+        query_terms = set(tokenize(query))
+        used = set()
+        emitted = 0
+        for passage in passages:
+            if emitted >= self.max_sentences:
+                break
+            sentence = self.best_sentence(query_terms, passage)
+            if not sentence or sentence in used:
+                continue
+            used.add(sentence)
+            if emitted == 0:
+                yield "Based on the indexed sources: "
+            elif emitted % 2 == 0:
+                yield "\n\n"
+            for word in sentence.split():
+                yield word + " "
+            yield Citation(passage.get("id", passage.get("doc_id")), passage)
+            yield " "
+            emitted += 1
+        if emitted == 0:
+            yield f'No indexed content matched "{query}". Try rephrasing the query or uploading related files.'
@@ -0,0 +1,154 @@
+# Hybrid Lexical + Dense Retrieval for the Multimodal RAG System
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from progress import report
+from text_index import score_to_confidence
+from tracing import span
+
+FUSION_METHODS = ("rrf", "weighted")
+
+# Standard reciprocal rank fusion damping constant
+RRF_K = 60
+
+# Cosine similarities of the local encoder mapped onto 0-1 relevance
+DENSE_FLOOR = 0.0
+DENSE_CEILING = 0.5
+
+# Stages reported by HybridRetriever.search
+SEARCH_STAGES = (
+    "Searching keyword index...",
+    "Searching vector database...",
+    "Ranking results by relevance...",
+    "Loading matched chunks..."
+)
+
+# Hits fetched from each retriever before fusion
+CANDIDATES_PER_RETRIEVER = 50
+
+
+def calibrate_dense(score, floor=DENSE_FLOOR, ceiling=DENSE_CEILING):
+    """Map a cosine similarity onto the 0-1 relevance scale"""
+    return min(max((score - floor) / (ceiling - floor), 0.0), 1.0)
+
+
+def calibrate_lexical(score):
+    """Map a BM25 score onto the 0-1 relevance scale"""
+    return score_to_confidence(max(score, 0.0))
+
+
+class HybridRetriever:
+    """Run BM25 and dense search concurrently and fuse the two rankings
+
+    Both indexes must be built from the same records in the same order so
+    that BM25 document ids and vector store row ids refer to the same chunk.
+    Ranking uses reciprocal rank fusion (``fusion="rrf"``) or the weighted
+    calibrated score (``fusion="weighted"``); the reported relevance is
+    always the weighted calibrated score so that thresholds are comparable
+    across queries.
+    """
+
+    def __init__(self, text_index, vector_index, encoder, lexical_weight=0.5, dense_weight=0.5,
+                 fusion="rrf", candidates=CANDIDATES_PER_RETRIEVER, workers=None):
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method {fusion!r}, expected one of {FUSION_METHODS}")
+        self.text_index = text_index
+        self.vector_index = vector_index
+        self.encoder = encoder
+        self.lexical_weight = lexical_weight
+        self.dense_weight = dense_weight
+        self.fusion = fusion
+        self.candidates = candidates
+        # Two tasks per query, so concurrent callers need more than two threads
+        self._executor = ThreadPoolExecutor(max_workers=workers or 2 * (os.cpu_count() or 1),
+                                            thread_name_prefix="hybrid-search")
+
+    def lexical_hits(self, query, text_index=None):
+        """BM25 (doc_id, calibrated score) pairs, best first"""
+        text_index = text_index or self.text_index
+        return [(doc_id, calibrate_lexical(score)) for doc_id, score in text_index.top_k(query, self.candidates)]
+
+    def dense_hits(self, query, text_index=None):
+        """Vector (row_id, calibrated score) pairs, best first, limited to live rows of a BM25 snapshot"""
+        with span("embed.query"):
+            query_vector = self.encoder.encode_one(query)
+        with span("retrieve.vector"):
+            hits = self.vector_index.top_k(query_vector, self.candidates)
+        if text_index is not None:
+            hits = [(row_id, score) for row_id, score in hits
+                    if row_id < text_index.num_rows and row_id not in text_index.deleted_rows]
+        return [(row_id, calibrate_dense(score)) for row_id, score in hits]
+
+    def fuse(self, lexical_hits, dense_hits):
+        """Combine two ranked hit lists into [(doc_id, fused_score, relevance)]"""
+        weights = (self.lexical_weight, self.dense_weight)
+        total_weight = sum(weights) or 1.0
+        ranked_lists = (lexical_hits, dense_hits)
+
+        fused = {}
+        for weight, hits in zip(weights, ranked_lists):
+            for rank, (doc_id, _) in enumerate(hits, start=1):
+                fused[doc_id] = fused.get(doc_id, 0.0) + weight / (RRF_K + rank)
+
+        # A document missing from a truncated list scored at most that list's last hit;
+        # missing from a complete list means it did not match at all
+        defaults = [hits[-1][1] if len(hits) >= self.candidates else 0.0 for hits in ranked_lists]
+        score_maps = [dict(hits) for hits in ranked_lists]
+        relevance = {}
+        for doc_id in fused:
+            combined = sum(
+                weight * scores.get(doc_id, default)
+                for weight, scores, default in zip(weights, score_maps, defaults)
+            )
+            relevance[doc_id] = combined / total_weight
+
+        key = fused if self.fusion == "rrf" else relevance
+        order = sorted(fused, key=lambda doc_id: (-key[doc_id], -relevance[doc_id], doc_id))
+        return [(doc_id, fused[doc_id], relevance[doc_id]) for doc_id in order]
+
+    def top_k(self, query, k=10, progress=None, on_lexical_hits=None):
+        """Return the k best (doc_id, relevance) pairs for a query
+
+        ``on_lexical_hits`` is called with the k best BM25 (doc_id, score)
+        pairs as soon as keyword search finishes, while dense search and
+        fusion may still be running.
+        """
+        # Both retrievers read one snapshot; vectors of deleted rows, or stored for a snapshot
+        # still being published, are skipped
+        text_index = self.text_index
+        lexical_future = self._executor.submit(self.lexical_hits, query, text_index)
+        dense_future = self._executor.submit(self.dense_hits, query, text_index)
+        lexical_hits = lexical_future.result()
+        report(progress, SEARCH_STAGES[0])
+        if on_lexical_hits is not None:
+            on_lexical_hits(lexical_hits[:k])
+        dense_hits = dense_future.result()
+        report(progress, SEARCH_STAGES[1])
+        with span("rank.fusion"):
+            fused = self.fuse(lexical_hits, dense_hits)
+        report(progress, SEARCH_STAGES[2])
+        return [(doc_id, relevance) for doc_id, _, relevance in fused[:k]]
+
+    def get_records(self, hits):
+        """Stored records for (doc_id, relevance) pairs, annotated with both"""
+        with span("load"):
+            records = self.vector_index.store.get_records([doc_id for doc_id, _ in hits])
+        for record, (doc_id, relevance) in zip(records, hits):
+            record["doc_id"] = doc_id
+            record["relevance"] = round(relevance, 2)
+        return records
+
+    def search(self, query, k=10, progress=None, on_early_results=None):
+        """Return the top-k stored records with a calibrated ``relevance`` field
+
+        ``progress`` is an optional PipelineProgress over SEARCH_STAGES.
+        ``on_early_results`` receives the keyword-only top-k records before
+        fusion finishes, so answer generation can start on them early.
+        """
+        on_lexical_hits = None
+        if on_early_results is not None:
+            on_lexical_hits = lambda hits: on_early_results(self.get_records(hits))
+        records = self.get_records(self.top_k(query, k, progress, on_lexical_hits))
+        report(progress, SEARCH_STAGES[3])
+        return records
@@ -0,0 +1,130 @@
+# Image Thumbnails and Encoded Assets for the Multimodal RAG System
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, features
+
+from memory import register_component
+
+THUMBNAIL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_data", "thumbnails")
+
+# Largest thumbnail edge sizes; two-column result cards never need more
+THUMBNAIL_SIZE = (800, 600)
+
+# Encoded images kept in memory per process
+MEMORY_ENTRIES = 256
+
+IMAGE_FORMAT = "WEBP" if features.check("webp") else "PNG"
+
+
+class _EncodedImageCache:
+    """Thread-safe LRU of encoded image bytes"""
+
+    def __init__(self, max_entries=MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def size_bytes(self):
+        with self._lock:
+            return sum(len(data) for data in self._entries.values())
+
+    def shrink(self, bytes_to_free):
+        """Evict least recently used entries; thumbnails are re-read from disk on next use"""
+        freed = 0
+        with self._lock:
+            while self._entries and freed < bytes_to_free:
+                freed += len(self._entries.popitem(last=False)[1])
+        return freed
+
+
+_cache = _EncodedImageCache()
+register_component("image cache", _cache.size_bytes, _cache.shrink, priority=20)
+
+
+def encode_image(img, image_format=IMAGE_FORMAT):
+    """Encode a PIL image to WebP (or PNG) bytes"""
+    buffer = io.BytesIO()
+    if image_format == "WEBP":
+        img.save(buffer, format="WEBP", quality=85, method=4)
+    else:
+        img.save(buffer, format=image_format, optimize=True)
+    return buffer.getvalue()
+
+
+def make_thumbnail(path, max_size=THUMBNAIL_SIZE):
+    """Decode and downscale an image file into an RGB thumbnail"""
+    with Image.open(path) as img:
+        # Let JPEG decode at a reduced scale instead of decoding full size and resizing
+        img.draft("RGB", max_size)
+        img = img.convert("RGB")
+        img.thumbnail(max_size, Image.LANCZOS)
+        return img
+
+
+def get_thumbnail(path, max_size=THUMBNAIL_SIZE):
+    """Encoded thumbnail bytes for an image file
+
+    Keyed by path, modification time and file size, so an edited file gets
+    a fresh thumbnail. Thumbnails are kept in memory and on disk, so each
+    source image is decoded and resized at most once.
+    """
+    stat = os.stat(path)
+    fingerprint = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{max_size[0]}x{max_size[1]}"
+    key = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()
+
+    data = _cache.get(key)
+    if data is not None:
+        return data
+
+    disk_path = os.path.join(THUMBNAIL_CACHE_DIR, f"{key}.{IMAGE_FORMAT.lower()}")
+    if os.path.exists(disk_path):
+        with open(disk_path, "rb") as f:
+            data = f.read()
+    else:
+        data = encode_image(make_thumbnail(path, max_size))
+        os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{disk_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, disk_path)
+    _cache.put(key, data)
+    return data
+
+
+def get_rendered_image(key, draw):
+    """Encoded bytes of a generated image, drawn by ``draw()`` only on first use"""
+    cache_key = ("rendered",) + tuple(key)
+    data = _cache.get(cache_key)
+    if data is None:
+        data = encode_image(draw())
+        _cache.put(cache_key, data)
+    return data
+
+
+def cache_stats():
+    """Hit/miss counters and memory held by the encoded image cache"""
+    return {"hits": _cache.hits, "misses": _cache.misses, "bytes": _cache.size_bytes()}
@@ -0,0 +1,588 @@
+# Background Ingestion Pipeline for the Multimodal RAG System
+
+import io
+import itertools
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+import uuid
+import wave
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from xml.etree import ElementTree
+
+import numpy as np
+
+from audio_segments import (AudioClipError, audio_duration, format_range, format_timestamp, segment_records,
+                            store_recording)
+from chunking import Chunker
+from dedup import MinHasher, NearDuplicateIndex, chunk_label, is_deduplicated
+from embedding_cache import DEFAULT_CACHE_PATH, CachedEncoder, EmbeddingCache
+from embeddings import DEFAULT_DIM, HashingEncoder
+from progress import PipelineProgress
+from segment_merge import SegmentMerger
+from text_index import SEGMENTS_DIR, record_text, write_segment
+import tracing
+from transcription import PENDING_PER_WORKER, StandInTranscriber, is_streamable, transcribe_recording
+
+DOCUMENT_EXTENSIONS = (".pdf", ".doc", ".docx", ".txt", ".md")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg")
+
+# Chunks in the first index commit of a document; later commits double up to the maximum,
+# so early pages are searchable quickly without rebuilding the index once per page
+INDEX_BATCH_CHUNKS = 16
+INDEX_BATCH_MAX_CHUNKS = 1024
+
+JOB_STATES = ("queued", "processing", "indexing", "done", "failed")
+
+# Stages reported for every ingestion job; the first two run in the worker process
+INGEST_STAGES = ("Extracting content...", "Generating embeddings...", "Indexing chunks...")
+
+# Recordings streamed through the transcription pool at once; each one keeps the pool busy
+AUDIO_STREAMS = 2
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+class IngestError(Exception):
+    """Raised when an uploaded file cannot be processed"""
+
+
+def file_kind(file_name):
+    """Classify an upload as document, image or audio by extension"""
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in DOCUMENT_EXTENSIONS:
+        return "document"
+    if extension in IMAGE_EXTENSIONS:
+        return "image"
+    if extension in AUDIO_EXTENSIONS:
+        return "audio"
+    raise IngestError(f"Unsupported file type: {file_name}")
+
+
+def iter_pages(file_name, data):
+    """Yield (page_number, text) for a document upload, one page at a time"""
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == ".pdf":
+        try:
+            import pypdf
+        except ImportError:
+            raise IngestError("PDF ingestion requires the 'pypdf' package")
+        reader = pypdf.PdfReader(io.BytesIO(data))
+        for number, page in enumerate(reader.pages, start=1):
+            yield number, page.extract_text() or ""
+    elif extension == ".docx":
+        yield from iter_docx_pages(data)
+    elif extension == ".doc":
+        # Legacy binary Word files: recover the readable text runs
+        runs = re.findall(rb"[\x20-\x7e]{4,}", data)
+        yield 1, " ".join(run.decode("ascii") for run in runs)
+    else:
+        # Form feeds separate pages; 0x0C never occurs inside a multi-byte UTF-8 sequence
+        start = 0
+        for number in itertools.count(1):
+            end = data.find(b"\f", start)
+            yield number, data[start:end if end >= 0 else len(data)].decode("utf-8", errors="replace")
+            if end < 0:
+                return
+            start = end + 1
+
+
+def iter_docx_pages(data):
+    """Yield a .docx body page by page, split at explicit and rendered page breaks
+
+    The document XML is parsed incrementally and each paragraph is freed
+    once read, so only the current page is held in memory.
+    """
+    page_break_tags = (f"{WORD_NAMESPACE}lastRenderedPageBreak", f"{WORD_NAMESPACE}br")
+    with zipfile.ZipFile(io.BytesIO(data)) as archive, archive.open("word/document.xml") as document:
+        number = 1
+        lines = []
+        words = []
+        for _, node in ElementTree.iterparse(document, events=("end",)):
+            if node.tag == f"{WORD_NAMESPACE}t":
+                if node.text:
+                    words.append(node.text)
+            elif node.tag in page_break_tags and (
+                node.tag != f"{WORD_NAMESPACE}br" or node.get(f"{WORD_NAMESPACE}type") == "page"
+            ):
+                lines.append("".join(words))
+                words = []
+                yield number, "\n".join(lines)
+                number += 1
+                lines = []
+            elif node.tag == f"{WORD_NAMESPACE}p":
+                lines.append("".join(words))
+                words = []
+                node.clear()
+        yield number, "\n".join(lines)
+
+
+def format_duration(seconds):
+    """Format seconds as M:SS"""
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def document_records(file_name, data, chunker=None):
+    """Yield text chunk records for a document upload, page by page"""
+    for chunk in (chunker or Chunker()).chunks(iter_pages(file_name, data)):
+        yield dict(chunk, type="text", modality="text", source=file_name, citations=[])
+
+
+def image_records(file_name, data):
+    """A single descriptive record for an image upload"""
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        image_format = img.format
+    title = os.path.splitext(file_name)[0].replace("_", " ")
+    return [{
+        "type": "image",
+        "modality": "images",
+        "content": title,
+        "description": f"{title} ({width}x{height} {image_format} image)",
+        "source": file_name,
+        "page": 1,
+        "citations": []
+    }]
+
+
+def audio_records(file_name, data, audio_path=None):
+    """A single record spanning an audio upload, pointing at its stored copy"""
+    seconds = None
+    if audio_path:
+        try:
+            seconds = audio_duration(audio_path)
+        except (AudioClipError, wave.Error, EOFError):
+            seconds = None
+    elif file_name.lower().endswith(".wav"):
+        with wave.open(io.BytesIO(data)) as recording:
+            seconds = recording.getnframes() / recording.getframerate()
+    title = os.path.splitext(file_name)[0].replace("_", " ")
+    record = {
+        "type": "audio",
+        "modality": "audio",
+        "content": title,
+        "transcript": "",
+        "source": file_name,
+        "timestamp": "0:00",
+        "duration": format_duration(seconds) if seconds is not None else "unknown",
+        "citations": []
+    }
+    if seconds is not None:
+        record.update(start=0.0, end=round(seconds, 2), timestamp=format_range(0, seconds))
+    if audio_path:
+        record["audio_path"] = audio_path
+    return [record]
+
+
+def process_upload(job_id, file_name, data, progress_queue, dim=DEFAULT_DIM, embedding_cache_path=None):
+    """Extract, chunk and embed one upload; runs inside a worker process
+
+    Returns the records, their vectors, their MinHash signatures and
+    {span name: seconds} timings for the parent process to record, since
+    worker spans never reach its tracer.
+    Documents send most of their chunks ahead as batches on
+    ``progress_queue`` and return only the last one.
+    """
+    kind = file_kind(file_name)
+    if kind == "document":
+        return process_document(job_id, file_name, data, progress_queue, dim, embedding_cache_path)
+
+    progress = PipelineProgress(
+        INGEST_STAGES,
+        lambda stage, completed, total: progress_queue.put(("stage", job_id, completed))
+    )
+    timings = {}
+    started = time.perf_counter()
+    if kind == "image":
+        records = image_records(file_name, data)
+    else:
+        audio_path = store_recording(f"{job_id}{os.path.splitext(file_name)[1].lower()}", data)
+        records = audio_records(file_name, data, audio_path)
+    timings[f"parse.{kind}"] = time.perf_counter() - started
+    progress.done(INGEST_STAGES[0])
+
+    started = time.perf_counter()
+    with ingest_encoder(dim, embedding_cache_path) as encoder:
+        vectors = embed_records(job_id, records, encoder)
+    timings["embed.ingest"] = time.perf_counter() - started
+    started = time.perf_counter()
+    signatures = sign_records(records)
+    timings["dedup.minhash"] = time.perf_counter() - started
+    progress.done(INGEST_STAGES[1])
+    return records, vectors, signatures, timings
+
+
+def process_document(job_id, file_name, data, progress_queue, dim=DEFAULT_DIM, embedding_cache_path=None,
+                     chunker=None):
+    """Chunk and embed a document page by page, sending chunk batches ahead as they fill
+
+    The first batch goes out as soon as ``INDEX_BATCH_CHUNKS`` chunks are
+    ready or the first page ends, so the start of a long document is
+    searchable long before its last page is parsed. Only the batch being
+    filled is held in memory. Returns the final batch like process_upload.
+    """
+    timings = {"parse.document": 0.0, "embed.ingest": 0.0, "dedup.minhash": 0.0}
+    batch = []
+    batch_limit = INDEX_BATCH_CHUNKS
+    sent = 0
+    hasher = MinHasher()
+    with ingest_encoder(dim, embedding_cache_path) as encoder:
+        def embed_batch():
+            started = time.perf_counter()
+            vectors = embed_records(job_id, batch, encoder, first_number=sent)
+            timings["embed.ingest"] += time.perf_counter() - started
+            started = time.perf_counter()
+            signatures = sign_records(batch, hasher)
+            timings["dedup.minhash"] += time.perf_counter() - started
+            return vectors, signatures
+
+        started = time.perf_counter()
+        current_page = None
+        for record in document_records(file_name, data, chunker):
+            if record["page"] != current_page:
+                current_page = record["page"]
+                progress_queue.put(("page", job_id, current_page))
+                page_done = bool(batch) and sent == 0
+            else:
+                page_done = False
+            if len(batch) >= batch_limit or page_done:
+                timings["parse.document"] += time.perf_counter() - started
+                progress_queue.put(("batch", job_id, batch, *embed_batch()))
+                sent += len(batch)
+                batch = []
+                batch_limit = min(batch_limit * 2, INDEX_BATCH_MAX_CHUNKS)
+                started = time.perf_counter()
+            batch.append(record)
+        timings["parse.document"] += time.perf_counter() - started
+        progress_queue.put(("stage", job_id, 1))
+        vectors, signatures = embed_batch()
+    progress_queue.put(("stage", job_id, 2))
+    return batch, vectors, signatures, timings
+
+
+@contextmanager
+def ingest_encoder(dim=DEFAULT_DIM, embedding_cache_path=None):
+    """The ingestion text encoder, backed by the shared embedding cache when a path is given"""
+    if not embedding_cache_path:
+        yield HashingEncoder(dim)
+        return
+    cache = EmbeddingCache(embedding_cache_path)
+    try:
+        yield CachedEncoder(HashingEncoder(dim), cache)
+    finally:
+        cache.close()
+
+
+def embed_records(job_id, records, encoder, first_number=0):
+    """Assign record ids from the job id and encode the records' text"""
+    for number, record in enumerate(records, start=first_number):
+        record["id"] = f"{job_id}-{number}"
+    return encoder.encode([record_text(record) for record in records])
+
+
+def sign_records(records, hasher=None):
+    """MinHash signatures of document chunks, None for records exempt from deduplication"""
+    hasher = hasher or MinHasher()
+    return [hasher.signature(record_text(record)) if is_deduplicated(record) else None for record in records]
+
+
+class IndexWriter:
+    """Appends ingested chunks to the live search indexes
+
+    The BM25 index, vector store and IVF index are kept row-aligned, so
+    every call appends the same records to all of them. Each call writes
+    one new BM25 segment and publishes it with an atomic manifest swap
+    after the vectors are stored, so the manifest is the commit point for
+    all three: rows stored by an ingest that crashed before publishing
+    are discarded on the next start. ``text_index`` is replaced, never
+    mutated, and readers pin whichever snapshot they read first without
+    taking ``_lock``. Listeners are called with the writer after each
+    commit so readers can pick up the new snapshot.
+    """
+
+    def __init__(self, text_index, store=None, ivf_index=None):
+        self.text_index = text_index
+        self.store = store
+        self.ivf_index = ivf_index
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._recover()
+
+    def _recover(self):
+        """Drop vector rows that were stored but never published in a BM25 snapshot"""
+        if self.store is None or len(self.store) <= self.text_index.num_rows:
+            return
+        self.store.truncate(self.text_index.num_rows)
+        if self.ivf_index is not None and self.ivf_index.indexed_rows > len(self.store):
+            self.ivf_index.build()
+            self.ivf_index.save()
+
+    def subscribe(self, callback):
+        """Register a callback invoked after every commit"""
+        self._listeners.append(callback)
+
+    def add(self, records, vectors, deleted_rows=()):
+        """Append records and their vectors to every index, deleting ``deleted_rows`` in the same snapshot"""
+        if not records and not deleted_rows:
+            return
+        with self._lock:
+            snapshot = self.text_index
+            segments = []
+            if records:
+                segments.append(write_segment(snapshot.index_dir, records, first_row=snapshot.num_rows))
+                if self.store is not None:
+                    self.store.add(vectors, records)
+                if self.ivf_index is not None:
+                    self.ivf_index.add_rows()
+                    self.ivf_index.save()
+            self.text_index = snapshot.publish(segments, deleted_rows)
+        self._notify()
+
+    def commit_merge(self, replaced, merged_name):
+        """Publish a merged segment in place of the run it replaces and delete the old directories
+
+        Deleted vector rows stay in the store so row ids remain stable;
+        only the BM25 segments are compacted.
+        """
+        with self._lock:
+            self.text_index = self.text_index.publish(merged=(replaced, merged_name))
+        # Pinned snapshots keep their mappings; where the OS refuses, orphan cleanup retries later
+        for name in replaced:
+            shutil.rmtree(os.path.join(self.text_index.index_dir, SEGMENTS_DIR, name), ignore_errors=True)
+        self._notify()
+
+    def _notify(self):
+        for callback in self._listeners:
+            callback(self)
+
+
+class IngestManager:
+    """Processes uploads on a process pool and indexes them on a background thread
+
+    ``submit`` returns immediately with a job id; ``status`` can be polled
+    from the Streamlit script thread to render progress. Documents are
+    indexed in batches while later pages are still being parsed. WAV
+    recordings are decoded on a local thread instead, which fans their
+    utterances out to the same pool for transcription. Document chunks that
+    near-duplicate an indexed chunk are clustered with it and not indexed
+    again, unless ``deduplicate`` is off. Uploading a file under the name
+    of an indexed one replaces it: the earlier chunks are deleted in the
+    snapshot that adds the first new ones. With ``merge`` on, the small
+    BM25 segments each commit leaves are merged in the background.
+    """
+
+    def __init__(self, writer, max_workers=None, dim=DEFAULT_DIM, embedding_cache_path=DEFAULT_CACHE_PATH,
+                 transcriber=None, deduplicate=True, merge=True):
+        self.writer = writer
+        self.dim = dim
+        self.embedding_cache_path = embedding_cache_path
+        self.transcriber = transcriber or StandInTranscriber()
+        # Kept beside the BM25 directory, which is replaced wholesale on every rebuild
+        self.duplicates = (NearDuplicateIndex(f"{writer.text_index.index_dir}.minhash.sqlite")
+                           if deduplicate else None)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        self._audio_executor = ThreadPoolExecutor(max_workers=AUDIO_STREAMS, thread_name_prefix="ingest-audio")
+        self._manager = context.Manager()
+        self._progress = self._manager.Queue()
+        self._index_queue = queue.Queue()
+        self._jobs = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.merger = SegmentMerger(writer).start() if merge else None
+        threading.Thread(target=self._collect_progress, name="ingest-progress", daemon=True).start()
+        threading.Thread(target=self._index_loop, name="ingest-indexer", daemon=True).start()
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            job = self._jobs[job_id]
+            # Late worker events must not move a finished job backwards
+            if job["state"] in ("indexing", "done", "failed") and changes.get("state") == "processing":
+                return
+            job.update(changes)
+
+    def submit(self, file_name, data):
+        """Queue an upload for ingestion and return its job id"""
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id,
+                "file_name": file_name,
+                "state": "queued",
+                "stage": INGEST_STAGES[0],
+                "progress": 0.0,
+                "chunks": 0,
+                "duplicates": 0,
+                "replaced": None,
+                "error": None,
+                "submitted_at": time.time(),
+                "finished_at": None
+            }
+        if is_streamable(file_name):
+            future = self._audio_executor.submit(self._process_recording, job_id, file_name, data)
+        else:
+            future = self._executor.submit(process_upload, job_id, file_name, data, self._progress, self.dim,
+                                           self.embedding_cache_path)
+        self._futures[job_id] = future
+        # Completion travels through the progress queue too, so it arrives after every batch the job sent
+        future.add_done_callback(lambda done: self._progress.put(("finished", job_id)))
+        return job_id
+
+    def _process_recording(self, job_id, file_name, data):
+        """Transcribe a recording on the worker pool as it is decoded; same result as process_upload"""
+        started = time.perf_counter()
+        audio_path = store_recording(f"{job_id}{os.path.splitext(file_name)[1].lower()}", data)
+        record = audio_records(file_name, None, audio_path)[0]
+        total = record.get("end") or 0.0
+
+        def on_utterance(utterance):
+            tracing.record("transcribe.utterance", utterance["seconds"])
+            stage = f"Transcribing audio... {format_timestamp(utterance['end'])} of {format_timestamp(total)}"
+            self._update(job_id, state="processing", stage=stage,
+                         progress=min(utterance["end"] / total, 1.0) / len(INGEST_STAGES) if total else 0.0)
+
+        segments = list(transcribe_recording(audio_path, self.transcriber, self._executor,
+                                             self.max_workers * PENDING_PER_WORKER, on_utterance))
+        # Silent recordings keep a single record so the file still shows up in search
+        records = segment_records(record, segments) or [record]
+        timings = {"parse.audio": time.perf_counter() - started}
+
+        self._update(job_id, state="processing", stage=INGEST_STAGES[1], progress=1 / len(INGEST_STAGES))
+        started = time.perf_counter()
+        with ingest_encoder(self.dim, self.embedding_cache_path) as encoder:
+            vectors = embed_records(job_id, records, encoder)
+        timings["embed.ingest"] = time.perf_counter() - started
+        return records, vectors, sign_records(records), timings
+
+    def status(self, job_id):
+        """Snapshot of a job's progress, or None for an unknown job"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def jobs(self):
+        """Snapshots of every job, oldest first"""
+        with self._lock:
+            return sorted((dict(job) for job in self._jobs.values()), key=lambda job: job["submitted_at"])
+
+    def active_jobs(self):
+        """Jobs that have not finished yet"""
+        return [job for job in self.jobs() if job["state"] not in ("done", "failed")]
+
+    def _collect_progress(self):
+        """Apply events reported by worker processes, forwarding chunk batches to the indexer"""
+        while True:
+            try:
+                event, job_id, *payload = self._progress.get()
+            except (EOFError, OSError):
+                return
+            if event == "stage":
+                completed = payload[0]
+                self._update(job_id, state="processing", stage=INGEST_STAGES[completed],
+                             progress=completed / len(INGEST_STAGES))
+            elif event == "page":
+                self._update(job_id, state="processing", stage=f"Extracting page {payload[0]}...")
+            elif event == "batch":
+                self._index_queue.put((job_id, payload, None))
+            elif event == "finished":
+                self._index_queue.put((job_id, None, self._futures.pop(job_id)))
+
+    def _seed_duplicates(self):
+        """Cluster the chunks already indexed, the first time the duplicate index is opened"""
+        if self.duplicates is None or len(self.duplicates):
+            return
+        hasher = self.duplicates.hasher
+        self.duplicates.assign(
+            (chunk_label(record, row), record.get("source"), record.get("page"), hasher.signature(record_text(record)))
+            for row, record in self.writer.text_index.iter_rows() if is_deduplicated(record)
+        )
+
+    def _replaced_rows(self, job_id):
+        """Rows of an earlier upload with the same file name, on a job's first commit only
+
+        Returns the rows with the records and vectors of other files' chunks
+        promoted out of the old version's clusters, which were never indexed.
+        """
+        with self._lock:
+            job = self._jobs[job_id]
+            if job["replaced"] is not None:
+                return [], []
+            file_name = job["file_name"]
+        rows = self.writer.text_index.rows_for_source(file_name)
+        promoted = []
+        # Forget the old version's clusters so its replacement is not merged into chunks being deleted
+        if rows and self.duplicates is not None:
+            promoted = self.duplicates.remove_source(file_name)
+        with self._lock:
+            job["replaced"] = len(rows)
+        return rows, promoted
+
+    def _commit(self, job_id, records, vectors, signatures):
+        """Index the records that do not near-duplicate an indexed chunk"""
+        replaced, promoted = self._replaced_rows(job_id)
+        duplicates = 0
+        if self.duplicates is not None:
+            with tracing.span("dedup.lookup"):
+                representatives = self.duplicates.assign(
+                    ((record["id"], record.get("source"), record.get("page"), signature)
+                     for record, signature in zip(records, signatures)),
+                    payloads=zip(records, vectors)
+                )
+            keep = [number for number, record in enumerate(records) if representatives[number] == record["id"]]
+            duplicates = len(records) - len(keep)
+            if duplicates:
+                tracing.increment("duplicate_chunks", duplicates)
+                records = [records[number] for number in keep]
+                vectors = vectors[keep]
+        indexed = len(records)
+        # Promoted chunks are indexed in the snapshot that deletes the old version, so they are never missing
+        if promoted:
+            records = records + [record for record, _ in promoted]
+            vectors = np.concatenate([vectors, np.stack([vector for _, vector in promoted])])
+        with tracing.span("index"):
+            self.writer.add(records, vectors, deleted_rows=replaced)
+        with self._lock:
+            self._jobs[job_id]["chunks"] += indexed
+            self._jobs[job_id]["duplicates"] += duplicates
+
+    def _index_loop(self):
+        """Commit document batches and finished worker results to the indexes in arrival order"""
+        try:
+            self._seed_duplicates()
+        except Exception:
+            # Deduplication is an optimisation; ingestion carries on without it
+            self.duplicates = None
+        while True:
+            job_id, batch, future = self._index_queue.get()
+            if self.status(job_id)["state"] == "failed":
+                continue
+            try:
+                if batch is not None:
+                    self._commit(job_id, *batch)
+                    continue
+                records, vectors, signatures, timings = future.result()
+                for name, seconds in timings.items():
+                    tracing.record(name, seconds)
+                self._update(job_id, state="indexing", stage=INGEST_STAGES[2], progress=2 / len(INGEST_STAGES))
+                self._commit(job_id, records, vectors, signatures)
+                tracing.increment("files_ingested")
+                self._update(job_id, state="done", stage="Indexed", progress=1.0, finished_at=time.time())
+            except Exception as e:
+                tracing.increment("ingest_failures")
+                self._update(job_id, state="failed", stage="Failed", error=str(e), finished_at=time.time())
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        self._audio_executor.shutdown(wait=False, cancel_futures=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._manager.shutdown()
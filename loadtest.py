@@ -0,0 +1,196 @@
+# Concurrent Session Load Testing for the Multimodal RAG System
+
+import os
+import random
+import threading
+import time
+import uuid
+from array import array
+
+from batch_search import summarize
+from demo_data import RECENT_QUERIES, SAMPLE_QUERIES
+from memory import end_session, format_bytes, memory_usage, process_rss, set_session_value
+from search_service import DEFAULT_TOP_K, get_service
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Streamlit script driven for each profile in app mode
+APP_SCRIPTS = {
+    "demo": "app.py",
+    "research": "clapp.py"
+}
+
+DEFAULT_SESSIONS = 8
+DEFAULT_QUERIES_PER_SESSION = 10
+
+# Longest a single AppTest script run may take before the session counts it as failed
+APP_RUN_TIMEOUT_SECONDS = 120
+
+
+def query_mix(extra_queries=()):
+    """Queries the simulated sessions replay: SAMPLE_QUERIES, clapp.py's recent queries and any extra ones"""
+    return list(SAMPLE_QUERIES) + [entry["query"] for entry in RECENT_QUERIES] + list(extra_queries)
+
+
+class ServiceSession:
+    """A simulated analyst calling the search path the apps share, without rendering
+
+    Results are kept in the session store under the same name app.py uses,
+    so per-session memory grows as it would in the app.
+    """
+
+    def __init__(self, profile, k=DEFAULT_TOP_K):
+        self.service = get_service(profile)
+        self.session_id = uuid.uuid4().hex
+        self.k = k
+
+    def search(self, query):
+        results = self.service.search(query, self.k)
+        set_session_value(self.session_id, "search_results", results)
+
+    def close(self):
+        end_session(self.session_id)
+
+
+class AppSession:
+    """A simulated analyst running app.py or clapp.py headlessly through Streamlit's AppTest
+
+    Each session has its own script run and session state, like a browser
+    tab. app.py is driven through its query box and Search button; clapp.py
+    through the session state its Search button sets, since its results
+    page replaces the landing page's query box.
+    """
+
+    def __init__(self, profile):
+        from streamlit.testing.v1 import AppTest
+        self.profile = profile
+        self.app = AppTest.from_file(os.path.join(APP_DIR, APP_SCRIPTS[profile]),
+                                     default_timeout=APP_RUN_TIMEOUT_SECONDS)
+        self._run()
+
+    def close(self):
+        # app.py keeps its results in the session store under the Streamlit session id
+        if "session_id" in self.app.session_state:
+            end_session(self.app.session_state["session_id"])
+
+    def _run(self):
+        self.app.run()
+        if self.app.exception:
+            raise RuntimeError(self.app.exception[0].message)
+
+    def search(self, query):
+        if self.profile == "demo":
+            self.app.text_input(key="main_query").input(query)
+            next(button for button in self.app.button if "Search" in button.label).click()
+        else:
+            self.app.session_state["query"] = query
+            self.app.session_state["selected_sidebar_query"] = None
+            self.app.session_state["search_done"] = True
+        self._run()
+
+
+SESSION_TYPES = {
+    "service": ServiceSession,
+    "app": AppSession
+}
+
+
+def run_load_test(profile="demo", sessions=DEFAULT_SESSIONS, queries_per_session=DEFAULT_QUERIES_PER_SESSION,
+                  mode="service", think_seconds=0.0, extra_queries=(), seed=0):
+    """Drive concurrent simulated sessions and return a summary dict
+
+    Each session runs on its own thread, as Streamlit runs each browser
+    session's script, and replays ``queries_per_session`` queries drawn
+    from ``query_mix`` with ``think_seconds`` between them. The summary
+    has throughput and latency percentiles over all searches, per-session
+    counts, and process memory before the sessions open, once they are
+    open, and after the run, with the growth divided per session.
+    """
+    if mode not in SESSION_TYPES:
+        raise ValueError(f"Unknown load test mode {mode!r}, expected one of {sorted(SESSION_TYPES)}")
+    if sessions < 1:
+        raise ValueError(f"A load test needs at least one session, got {sessions}")
+    mix = query_mix(extra_queries)
+    # A throwaway session first, so imports and opening the index are not charged to the measured ones
+    SESSION_TYPES[mode](profile).close()
+    rss_start = process_rss()
+
+    simulated = [SESSION_TYPES[mode](profile) for _ in range(sessions)]
+    rss_open = process_rss()
+
+    latencies = array("d")
+    per_session = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(sessions)
+
+    def run_session(number, session):
+        rng = random.Random(seed + number)
+        queries = [rng.choice(mix) for _ in range(queries_per_session)]
+        session_latencies = []
+        errors = 0
+        last_error = None
+        start_barrier.wait()
+        for query in queries:
+            started = time.perf_counter()
+            try:
+                session.search(query)
+            except Exception as e:
+                errors += 1
+                last_error = str(e)
+            session_latencies.append(time.perf_counter() - started)
+            if think_seconds:
+                time.sleep(rng.uniform(0, 2 * think_seconds))
+        with lock:
+            latencies.extend(session_latencies)
+            per_session.append({
+                "session": number,
+                "queries": len(session_latencies),
+                "errors": errors,
+                "last_error": last_error,
+                "mean_ms": round(1000 * sum(session_latencies) / max(len(session_latencies), 1), 3)
+            })
+
+    threads = [threading.Thread(target=run_session, args=(number, session), name=f"loadtest-session-{number}")
+               for number, session in enumerate(simulated)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    rss_end = process_rss()
+    for session in simulated:
+        session.close()
+
+    summary = summarize(latencies, sum(session["errors"] for session in per_session), elapsed, sessions)
+    summary["sessions"] = summary.pop("workers")
+    summary.update(profile=profile, mode=mode, query_mix=len(mix))
+    summary["per_session"] = sorted(per_session, key=lambda session: session["session"])
+    usage = memory_usage()
+    summary["memory"] = {
+        "rss_start": rss_start,
+        "rss_sessions_open": rss_open,
+        "rss_end": rss_end,
+        "growth_per_session": (rss_end - rss_start) // sessions if rss_start is not None else None,
+        "components": usage["components"]
+    }
+    return summary
+
+
+def format_load_report(summary):
+    """Human-readable load test report"""
+    lines = [
+        f"Sessions: {summary['sessions']} ({summary['mode']} mode, {summary['profile']} profile), "
+        f"{summary['queries']} searches, {summary['errors']} failed",
+        f"Elapsed: {summary['seconds']} s, throughput {summary['queries_per_second']} searches/s"
+    ]
+    latency = summary.get("latency_ms")
+    if latency:
+        lines.append(f"Latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  "
+                     f"mean {latency['mean']}  max {latency['max']}")
+    memory = summary["memory"]
+    lines.append(f"Memory: RSS {format_bytes(memory['rss_start'])} before, "
+                 f"{format_bytes(memory['rss_sessions_open'])} with sessions open, "
+                 f"{format_bytes(memory['rss_end'])} after; {format_bytes(memory['growth_per_session'])} per session")
+    lines += [f"  {name}: {format_bytes(size)}" for name, size in memory["components"].items()]
+    return "\n".join(lines)
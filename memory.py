@@ -0,0 +1,371 @@
+# Memory Budget Governor for the Multimodal RAG System
+
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from tracing import increment
+
+MB = 1024 * 1024
+
+# Budget in MB for this process and its ingestion workers; overrides the default below
+BUDGET_ENV_VAR = "RAG_MEMORY_BUDGET_MB"
+
+# Without an override, half of physical memory up to 4 GB, leaving an 8 GB
+# laptop room for the OS and browser instead of swapping
+DEFAULT_BUDGET_BYTES = 4096 * MB
+DEFAULT_BUDGET_FRACTION = 0.5
+
+# Once over budget, components are shrunk until usage is back under this fraction,
+# so the next check does not immediately trip again
+TARGET_FRACTION = 0.85
+
+CHECK_INTERVAL_SECONDS = 5.0
+
+# Session values written to disk under memory pressure, one directory per server process
+SPILL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_data", "session_spill")
+
+# Session values are dropped once their session has ended, or has been idle this long
+SESSION_IDLE_SECONDS = 3600
+
+# Bound on session values held in memory and spilled to disk together; least recently used go first
+MAX_SESSION_BYTES = 512 * MB
+
+try:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+
+def physical_memory():
+    """Installed RAM in bytes, or None where the OS does not report it"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_budget():
+    """Budget in bytes from RAG_MEMORY_BUDGET_MB, or derived from physical memory"""
+    configured = os.environ.get(BUDGET_ENV_VAR)
+    if configured:
+        return int(float(configured) * MB)
+    physical = physical_memory()
+    if physical is None:
+        return DEFAULT_BUDGET_BYTES
+    return min(DEFAULT_BUDGET_BYTES, int(physical * DEFAULT_BUDGET_FRACTION))
+
+
+def process_rss(pid="self"):
+    """Resident set size of a process in bytes, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def workers_rss():
+    """Combined resident set size of this process's child processes, e.g. the ingestion pool"""
+    sizes = [process_rss(child.pid) for child in multiprocessing.active_children()]
+    return sum(size for size in sizes if size)
+
+
+def format_bytes(size):
+    """Human-readable byte count for the sidebar"""
+    if size is None:
+        return "n/a"
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GB"
+
+
+class MemoryGovernor:
+    """Keeps the process and its workers under a memory budget
+
+    Components register a ``size_fn`` returning the bytes they hold and,
+    when they can give memory back, a ``shrink_fn(bytes)`` that evicts or
+    spills to disk and returns the bytes it freed. When the measured RSS
+    (or, without /proc, the tracked total) exceeds the budget, shrinkable
+    components are shrunk in ascending ``priority`` until usage is back
+    under ``TARGET_FRACTION`` of it. Indexes are reported but never shrunk.
+    """
+
+    def __init__(self, budget=None):
+        self.budget = budget or default_budget()
+        self._components = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, size_fn, shrink_fn=None, priority=50):
+        """Track a component under ``name``, replacing any earlier one"""
+        with self._lock:
+            self._components[name] = (priority, size_fn, shrink_fn)
+
+    def unregister(self, name):
+        with self._lock:
+            self._components.pop(name, None)
+
+    def usage(self):
+        """Budget, measured RSS and bytes held per component"""
+        with self._lock:
+            components = dict(self._components)
+        sizes = {name: int(size_fn()) for name, (_, size_fn, _) in sorted(components.items())}
+        rss = process_rss()
+        workers = workers_rss()
+        total = rss + workers if rss is not None else None
+        tracked = sum(sizes.values())
+        used = total if total is not None else tracked
+        return {
+            "budget": self.budget,
+            "rss": rss,
+            "workers_rss": workers,
+            "total": total,
+            "tracked": tracked,
+            "over_budget": used > self.budget,
+            "components": sizes
+        }
+
+    def enforce(self):
+        """Shrink components while over budget; returns the bytes freed"""
+        usage = self.usage()
+        used = usage["total"] if usage["total"] is not None else usage["tracked"]
+        if used <= self.budget:
+            return 0
+        to_free = used - int(self.budget * TARGET_FRACTION)
+        with self._lock:
+            shrinkable = sorted((priority, name, shrink_fn)
+                                for name, (priority, _, shrink_fn) in self._components.items() if shrink_fn)
+        freed = 0
+        for _, name, shrink_fn in shrinkable:
+            if freed >= to_free:
+                break
+            freed += shrink_fn(to_free - freed)
+        increment("memory_budget_exceeded")
+        increment("memory_freed_bytes", freed)
+        return freed
+
+
+def ended_sessions(session_ids):
+    """Ids among ``session_ids`` that the running Streamlit server no longer knows
+
+    Outside a Streamlit server, e.g. in the HTTP API or the load test,
+    nothing is known to have ended and only the idle limit applies.
+    """
+    try:
+        from streamlit import runtime
+    except ImportError:
+        return set()
+    if not runtime.exists():
+        return set()
+    # The session manager is not public API; without it only the idle limit applies
+    manager = getattr(runtime.get_instance(), "_session_mgr", None)
+    get_session_info = getattr(manager, "get_session_info", None)
+    if get_session_info is None:
+        return set()
+    return {session_id for session_id in session_ids if get_session_info(session_id) is None}
+
+
+def process_alive(pid):
+    """False only where /proc shows the process has exited"""
+    return not os.path.isdir("/proc/self") or os.path.isdir(f"/proc/{pid}")
+
+
+class SessionStore:
+    """Per-session values kept in memory and spilled to disk under pressure
+
+    Streamlit holds ``st.session_state`` in memory for as long as a tab is
+    open, so larger per-session values such as search results live here
+    instead, keyed by session id and name. Values are stored as JSON text,
+    which makes their size exact; ``spill`` moves the least recently used
+    ones to disk and ``get`` reads them back transparently. ``prune``
+    drops the values of sessions that have ended or gone idle, and values
+    in memory and on disk together are held under ``max_bytes`` by
+    dropping the least recently used.
+    """
+
+    def __init__(self, spill_dir=SPILL_DIR, max_bytes=MAX_SESSION_BYTES, idle_seconds=SESSION_IDLE_SECONDS):
+        self.spill_root = spill_dir
+        self.spill_dir = os.path.join(spill_dir, str(os.getpid()))
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        # Spilled keys and their sizes, least recently used first
+        self._spilled = OrderedDict()
+        self._spilled_bytes = 0
+        self._last_used = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        digest = hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.json")
+
+    def _drop(self, key):
+        """Forget one value, in memory or on disk; the caller holds the lock"""
+        text = self._entries.pop(key, None)
+        if text is not None:
+            self._memory_bytes -= len(text)
+        elif key in self._spilled:
+            self._spilled_bytes -= self._spilled.pop(key)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _enforce_cap(self):
+        """Drop least recently used values, spilled ones first, until under max_bytes"""
+        while self._memory_bytes + self._spilled_bytes > self.max_bytes and (self._spilled or self._entries):
+            self._drop(next(iter(self._spilled or self._entries)))
+            increment("session_values_dropped")
+
+    def put(self, session_id, name, value):
+        key = (session_id, name)
+        text = json.dumps(value)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = text
+            self._memory_bytes += len(text)
+            self._last_used[session_id] = time.monotonic()
+            self._enforce_cap()
+
+    def get(self, session_id, name, default=None):
+        key = (session_id, name)
+        with self._lock:
+            self._last_used[session_id] = time.monotonic()
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+            elif key in self._spilled:
+                with open(self._path(key), encoding="utf-8") as f:
+                    text = f.read()
+                # Read back into memory as the most recently used value; the governor may spill it again
+                self._drop(key)
+                self._entries[key] = text
+                self._memory_bytes += len(text)
+            else:
+                return default
+        return json.loads(text)
+
+    def end_session(self, session_id):
+        """Drop every value of a session"""
+        with self._lock:
+            for key in [key for key in list(self._entries) + list(self._spilled) if key[0] == session_id]:
+                self._drop(key)
+            self._last_used.pop(session_id, None)
+
+    def prune(self):
+        """Drop the values of sessions that have ended or been idle for idle_seconds; returns how many"""
+        now = time.monotonic()
+        with self._lock:
+            sessions = dict(self._last_used)
+        ended = ended_sessions(sessions) | {session_id for session_id, last_used in sessions.items()
+                                             if now - last_used > self.idle_seconds}
+        for session_id in ended:
+            self.end_session(session_id)
+        if ended:
+            increment("sessions_pruned", len(ended))
+        return len(ended)
+
+    def clear_spill(self):
+        """Delete files spilled by this process and by server processes that have exited"""
+        with self._lock:
+            for key in list(self._spilled):
+                self._drop(key)
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        if not os.path.isdir(self.spill_root):
+            return
+        for name in os.listdir(self.spill_root):
+            if name.isdigit() and not process_alive(int(name)):
+                shutil.rmtree(os.path.join(self.spill_root, name), ignore_errors=True)
+
+    def size_bytes(self):
+        with self._lock:
+            return self._memory_bytes
+
+    def spill(self, bytes_to_free):
+        """Write least recently used values to disk; returns the bytes released from memory"""
+        freed = 0
+        with self._lock:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            while self._entries and freed < bytes_to_free:
+                key, text = self._entries.popitem(last=False)
+                self._memory_bytes -= len(text)
+                path = self._path(key)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp_path, path)
+                self._spilled[key] = len(text)
+                self._spilled_bytes += len(text)
+                freed += len(text)
+        return freed
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._last_used), "memory_entries": len(self._entries),
+                    "spilled_entries": len(self._spilled), "spilled_bytes": self._spilled_bytes}
+
+
+# Process-wide governor and session store shared by every component
+_governor = MemoryGovernor()
+_sessions = SessionStore()
+_governor.register("session state", _sessions.size_bytes, _sessions.spill, priority=30)
+_enforcer = None
+_enforcer_lock = threading.Lock()
+
+
+def register_component(name, size_fn, shrink_fn=None, priority=50):
+    _governor.register(name, size_fn, shrink_fn, priority)
+
+
+def memory_usage():
+    return _governor.usage()
+
+
+def enforce_budget():
+    return _governor.enforce()
+
+
+def session_value(session_id, name, default=None):
+    return _sessions.get(session_id, name, default)
+
+
+def set_session_value(session_id, name, value):
+    _sessions.put(session_id, name, value)
+
+
+def end_session(session_id):
+    _sessions.end_session(session_id)
+
+
+def start_governor(interval=CHECK_INTERVAL_SECONDS):
+    """Enforce the budget and prune ended sessions periodically from a daemon thread; safe to call repeatedly
+
+    The first call also deletes session values left on disk by this
+    process id and by server processes that have exited.
+    """
+    global _enforcer
+    with _enforcer_lock:
+        if _enforcer is not None:
+            return
+        _sessions.clear_spill()
+
+        def enforce_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    _sessions.prune()
+                    enforce_budget()
+                except Exception:
+                    # The governor must outlive a bad pass; the next interval retries
+                    increment("memory_governor_failures")
+
+        _enforcer = threading.Thread(target=enforce_loop, name="memory-governor", daemon=True)
+        _enforcer.start()
@@ -0,0 +1,44 @@
+# Pipeline Progress Events for the Multimodal RAG System
+
+import threading
+
+
+class PipelineProgress:
+    """Reports pipeline stages to a listener as they actually finish
+
+    A pipeline declares its stage names up front and calls ``done`` when
+    each one completes. The listener is called as
+    ``listener(stage, completed, total)`` from the thread that finished
+    the stage.
+    """
+
+    def __init__(self, stages, listener=None):
+        self.stages = tuple(stages)
+        self.listener = listener
+        self.completed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return len(self.stages)
+
+    @property
+    def current_stage(self):
+        """Name of the stage now running, or None once all are finished"""
+        return self.stages[self.completed] if self.completed < self.total else None
+
+    def done(self, stage):
+        """Mark a stage as finished and notify the listener"""
+        if stage not in self.stages:
+            raise ValueError(f"Unknown pipeline stage {stage!r}")
+        with self._lock:
+            self.completed = min(self.completed + 1, self.total)
+            completed = self.completed
+        if self.listener is not None:
+            self.listener(stage, completed, self.total)
+
+
+def report(progress, stage):
+    """Mark a stage as finished on an optional progress tracker"""
+    if progress is not None:
+        progress.done(stage)
@@ -0,0 +1,148 @@
+# Two-Tier Query Result Cache for the Multimodal RAG System
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_DISK_ENTRIES = 10000
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+# Writes between trims of the disk tier back to its entry bound
+TRIM_INTERVAL = 64
+
+QUERY_TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def normalize_query(query):
+    """Lowercase a query and strip punctuation and extra whitespace"""
+    return " ".join(QUERY_TERM_PATTERN.findall(query.lower()))
+
+
+def cache_key(query, filters, index_version):
+    """Stable key for a query, its filters and the index it ran against"""
+    payload = json.dumps([normalize_query(query), filters or {}, index_version], sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class QueryCache:
+    """In-memory LRU/TTL cache backed by a persistent SQLite tier
+
+    Keys include the index version, so results computed against an older
+    index are never served; ``purge_stale`` drops them from disk. Values
+    must be JSON-serialisable.
+    """
+
+    def __init__(self, db_path, memory_entries=DEFAULT_MEMORY_ENTRIES, disk_entries=DEFAULT_DISK_ENTRIES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._writes = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # A crash may lose the latest entries but never corrupts the file; fine for a cache
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, index_version TEXT, created REAL, value TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+        self._db.commit()
+
+    def _expired(self, created):
+        return time.time() - created > self.ttl_seconds
+
+    def get(self, query, filters, index_version):
+        """Return cached results or None on a miss"""
+        key = cache_key(query, filters, index_version)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[0]):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(entry[1])
+
+            row = self._db.execute("SELECT created, value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and not self._expired(row[0]):
+                self._remember(key, row[0], row[1])
+                self.disk_hits += 1
+                return json.loads(row[1])
+
+            self.misses += 1
+            return None
+
+    def put(self, query, filters, index_version, results):
+        """Store results in both tiers"""
+        key = cache_key(query, filters, index_version)
+        created = time.time()
+        value = json.dumps(results)
+        with self._lock:
+            self._remember(key, created, value)
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, index_version, created, value) VALUES (?, ?, ?, ?)",
+                (key, index_version, created, value)
+            )
+            # Keep the disk tier bounded by periodically dropping the oldest entries
+            self._writes += 1
+            if self._writes % TRIM_INTERVAL == 0:
+                self._db.execute(
+                    "DELETE FROM results WHERE key IN ("
+                    "SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                    (self.disk_entries,)
+                )
+            self._db.commit()
+
+    def _remember(self, key, created, value):
+        """Insert into the memory tier, evicting least recently used entries"""
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def memory_bytes(self):
+        """Bytes of JSON held by the memory tier"""
+        with self._lock:
+            return sum(len(value) for _, value in self._memory.values())
+
+    def shrink(self, bytes_to_free):
+        """Evict least recently used memory entries; they stay on disk, so hits become disk hits"""
+        freed = 0
+        with self._lock:
+            while self._memory and freed < bytes_to_free:
+                freed += len(self._memory.popitem(last=False)[1][1])
+        return freed
+
+    def purge_stale(self, index_version):
+        """Drop every entry computed against a different index version"""
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM results WHERE index_version != ?", (index_version,))
+            self._db.commit()
+
+    def stats(self):
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            disk_entries = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries
+            }
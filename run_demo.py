@@ -1,9 +1,21 @@
 #!/usr/bin/env python3
 """
 Multimodal RAG System - SIH 2025 Demo Launcher
-Simple script to launch the Streamlit application
+Simple script to launch the Streamlit application, or to query the
+search engine headlessly:
+
+    python run_demo.py                          launch the Streamlit app
+    python run_demo.py search "revenue growth"  print results as JSON
+    python run_demo.py serve --port 8600        run the HTTP search API
+    python run_demo.py batch queries.txt -o results.jsonl
+                                                run a query file on a process pool
+    python run_demo.py recall                   report vector recall and compression
+    python run_demo.py loadtest --sessions 20   simulate concurrent sessions and report load
+    python run_demo.py bench --quick            benchmark and fail on regressions
 """
 
+import argparse
+import json
 import subprocess
 import sys
 import os
@@ -40,5 +52,147 @@ def launch_app():
         print(f"❌ Error launching the app: {e}")
         print("Make sure you're in the correct directory with app.py")
 
+def search(args):
+    """Run one query and print the results as JSON"""
+    # Imported here so launching the UI does not load the indexes twice
+    from search_service import open_service
+    service = open_service(args.profile)
+    print(json.dumps(service.search_response(args.query, args.k), indent=2 if args.pretty else None))
+
+def serve(args):
+    """Serve the search engine over HTTP until interrupted"""
+    from search_api import run_server
+    from search_service import open_service
+    service = open_service(args.profile)
+    
+    def ready(address):
+        print(f"🔎 Search API ({args.profile}) listening on http://{address[0]}:{address[1]}/search?q=...")
+        print("⏹️  Press Ctrl+C to stop the server")
+    
+    try:
+        run_server(service, args.host, args.port, args.workers, ready=ready)
+    except KeyboardInterrupt:
+        print("\n👋 Search API stopped.")
+
+def batch(args):
+    """Run a file of queries in parallel and print a throughput summary"""
+    from batch_search import format_summary, run_batch_files
+    summary = run_batch_files(args.queries, args.output, profile=args.profile, k=args.k,
+                              workers=args.workers, chunk_size=args.chunk_size)
+    # Results may be going to stdout, so the summary goes to stderr
+    print(format_summary(summary), file=sys.stderr)
+
+def recall(args):
+    """Report recall@k of the research vector index against exact search"""
+    from demo_data import SAMPLE_QUERIES
+    from quantization import evaluate_recall
+    from search_service import open_service
+    service = open_service("research", use_cache=False)
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = SAMPLE_QUERIES
+    vectors = service.retriever.encoder.encode(queries)
+    print(json.dumps(evaluate_recall(service.retriever.vector_index, vectors, args.k), indent=2))
+
+def loadtest(args):
+    """Drive concurrent simulated sessions and report throughput, latency and memory"""
+    from loadtest import format_load_report, run_load_test
+    extra_queries = []
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            extra_queries = [line.strip() for line in f if line.strip()]
+    summary = run_load_test(args.profile, args.sessions, args.queries_per_session, args.mode,
+                            args.think_ms / 1000, extra_queries, args.seed)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(format_load_report(summary))
+
+def bench(args):
+    """Run the benchmark suite and exit non-zero when a metric regresses"""
+    from benchmark import DEFAULT_HISTORY_PATH, DEFAULT_SIZES, QUICK_SIZES, format_report, run_suite
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    run = run_suite(sizes, args.history or DEFAULT_HISTORY_PATH, apps=not args.no_apps, record=not args.no_record,
+                    timing_tolerance=args.tolerance)
+    print(json.dumps(run, indent=2) if args.json else format_report(run))
+    if run["regressions"]:
+        sys.exit(1)
+
+def positive_int(value):
+    """argparse type for counts that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a number of at least 1, got {value}")
+    return number
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Multimodal RAG System launcher and headless search")
+    commands = parser.add_subparsers(dest="command")
+    
+    search_parser = commands.add_parser("search", help="Run one query and print JSON results")
+    search_parser.add_argument("query", help="Search query text")
+    search_parser.add_argument("-k", type=int, default=None, help="Number of results (default 10)")
+    search_parser.add_argument("--profile", default="demo", choices=("demo", "research"),
+                               help="demo: app.py keyword index, research: clapp.py hybrid index")
+    search_parser.add_argument("--pretty", action="store_true", help="Indent the JSON output")
+    
+    serve_parser = commands.add_parser("serve", help="Run the asyncio HTTP search API")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8600)
+    serve_parser.add_argument("--workers", type=int, default=None, help="Search threads (default 4 per CPU)")
+    serve_parser.add_argument("--profile", default="demo", choices=("demo", "research"))
+    
+    batch_parser = commands.add_parser("batch", help="Run a file of queries on a process pool, writing JSONL")
+    batch_parser.add_argument("queries", help="One query per line, or JSONL with query/k/id ('-' for stdin)")
+    batch_parser.add_argument("-o", "--output", default="-", help="JSONL output path (default stdout)")
+    batch_parser.add_argument("-k", type=int, default=10, help="Results per query unless a line sets k")
+    batch_parser.add_argument("--workers", type=int, default=None, help="Worker processes (default CPU count)")
+    batch_parser.add_argument("--chunk-size", type=int, default=32, help="Queries per worker task")
+    batch_parser.add_argument("--profile", default="demo", choices=("demo", "research"))
+    
+    recall_parser = commands.add_parser("recall", help="Measure research vector recall against exact search")
+    recall_parser.add_argument("--queries", default=None, help="Query file, one per line (default sample queries)")
+    recall_parser.add_argument("-k", type=int, default=10, help="Results compared per query")
+    
+    load_parser = commands.add_parser("loadtest", help="Simulate concurrent analyst sessions and report load")
+    load_parser.add_argument("--profile", default="demo", choices=("demo", "research"))
+    load_parser.add_argument("--sessions", type=positive_int, default=8, help="Concurrent simulated sessions")
+    load_parser.add_argument("--queries-per-session", type=positive_int, default=10)
+    load_parser.add_argument("--mode", default="service", choices=("service", "app"),
+                             help="service: call the search path, app: run app.py/clapp.py through AppTest")
+    load_parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between a session's queries")
+    load_parser.add_argument("--queries", default=None, help="Extra queries to mix in, one per line, e.g. recent ones")
+    load_parser.add_argument("--seed", type=int, default=0)
+    load_parser.add_argument("--json", action="store_true", help="Print the full summary as JSON")
+    
+    bench_parser = commands.add_parser("bench", help="Benchmark retrieval and rendering, failing on regressions")
+    bench_parser.add_argument("--sizes", type=int, nargs="+", default=None,
+                              help="Corpus sizes for index and query benchmarks (default 1000 5000 20000)")
+    bench_parser.add_argument("--quick", action="store_true", help="Small corpora only, for a fast check")
+    bench_parser.add_argument("--history", default=None,
+                              help="JSON history file to gate against (default index_data/benchmark_history.json)")
+    bench_parser.add_argument("--tolerance", type=float, default=0.25,
+                              help="Allowed relative slowdown against the recent median")
+    bench_parser.add_argument("--no-apps", action="store_true", help="Skip the Streamlit card rendering benchmarks")
+    bench_parser.add_argument("--no-record", action="store_true", help="Gate without appending this run to the history")
+    bench_parser.add_argument("--json", action="store_true", help="Print the full run entry as JSON")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    launch_app()
+    args = parse_args()
+    if args.command == "search":
+        search(args)
+    elif args.command == "serve":
+        serve(args)
+    elif args.command == "batch":
+        batch(args)
+    elif args.command == "recall":
+        recall(args)
+    elif args.command == "loadtest":
+        loadtest(args)
+    elif args.command == "bench":
+        bench(args)
+    else:
+        launch_app()
@@ -0,0 +1,181 @@
+# Asyncio HTTP Search API for the Multimodal RAG System
+
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from memory import memory_usage, start_governor
+from tracing import export_metrics, prometheus_text, start_exporter
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8600
+
+# Largest accepted request body and result count
+MAX_BODY_BYTES = 64 * 1024
+MAX_K = 100
+
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_SECONDS = 30
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    """A client error answered with an HTTP status and a JSON message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_k(value):
+    """Validate a requested result count"""
+    try:
+        k = int(value)
+    except (TypeError, ValueError):
+        raise RequestError(400, f"k must be an integer, got {value!r}")
+    if not 1 <= k <= MAX_K:
+        raise RequestError(400, f"k must be between 1 and {MAX_K}")
+    return k
+
+
+class SearchAPI:
+    """Minimal HTTP/1.1 JSON API over a SearchService
+
+    Endpoints:
+        GET  /search?q=...&k=10        search, returns the service's JSON payload
+        POST /search {"query", "k"}    same, with a JSON body
+        GET  /health                   liveness and index version
+        GET  /metrics                  Prometheus text from the tracer
+        GET  /memory                   RSS, budget and per-component memory
+
+    Searches run on a thread pool, so the event loop keeps accepting and
+    reading requests while queries execute. Connections are kept alive
+    for clients that send several requests.
+    """
+
+    def __init__(self, service, workers=None):
+        self.service = service
+        self._executor = ThreadPoolExecutor(max_workers=workers or 4 * (os.cpu_count() or 1),
+                                            thread_name_prefix="search-api")
+
+    async def read_request(self, reader):
+        """Read one request; returns None when the client closed the connection"""
+        request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_SECONDS)
+        if not request_line.strip():
+            return None
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise RequestError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise RequestError(400, "Invalid Content-Length header")
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, f"Request body larger than {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        return method.upper(), target, body, keep_alive
+
+    async def dispatch(self, method, target, body):
+        """Route a request and return (status, content type, body bytes)"""
+        url = urlsplit(target)
+        if url.path == "/health":
+            payload = {"status": "ok", "mode": self.service.mode, "index_version": self.service.index_version}
+            return 200, "application/json", json.dumps(payload).encode("utf-8")
+        if url.path == "/metrics":
+            return 200, "text/plain; version=0.0.4", prometheus_text().encode("utf-8")
+        if url.path == "/memory":
+            return 200, "application/json", json.dumps(memory_usage()).encode("utf-8")
+        if url.path != "/search":
+            raise RequestError(404, f"Unknown path {url.path}")
+
+        if method == "GET":
+            params = {name: values[0] for name, values in parse_qs(url.query).items()}
+            query = params.get("q") or params.get("query")
+            k = params.get("k")
+        elif method == "POST":
+            try:
+                params = json.loads(body or b"{}")
+            except ValueError:
+                raise RequestError(400, "Request body is not valid JSON")
+            if not isinstance(params, dict):
+                raise RequestError(400, "Request body must be a JSON object")
+            query = params.get("query")
+            k = params.get("k")
+        else:
+            raise RequestError(405, f"Method {method} not allowed on /search")
+
+        if not isinstance(query, str) or not query.strip():
+            raise RequestError(400, "Missing query")
+        k = parse_k(k) if k is not None else None
+
+        loop = asyncio.get_running_loop()
+        payload = await loop.run_in_executor(self._executor, self.service.search_response, query, k)
+        return 200, "application/json", json.dumps(payload).encode("utf-8")
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until the client closes it"""
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, target, body, keep_alive = request
+                    status, content_type, data = await self.dispatch(method, target, body)
+                except RequestError as e:
+                    status, content_type = e.status, "application/json"
+                    data = json.dumps({"error": str(e)}).encode("utf-8")
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    status, content_type = 500, "application/json"
+                    data = json.dumps({"error": str(e)}).encode("utf-8")
+
+                headers = (
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(headers.encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        """Serve forever; ``ready`` is called with the bound (host, port)"""
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[:2])
+        async with server:
+            await server.serve_forever()
+
+
+def run_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, ready=None):
+    """Block serving the HTTP API until interrupted, exporting metrics on exit"""
+    start_exporter()
+    start_governor()
+    try:
+        asyncio.run(SearchAPI(service, workers).serve(host, port, ready))
+    finally:
+        export_metrics()
@@ -0,0 +1,207 @@
+# Headless Search Service for the Multimodal RAG System
+
+import os
+import threading
+
+from ann_index import open_ivf_index
+from demo_data import get_demo_corpus, get_mock_corpus
+from embeddings import HashingEncoder
+from hybrid import SEARCH_STAGES as HYBRID_SEARCH_STAGES, HybridRetriever
+from ingest import IndexWriter
+from memory import register_component
+from query_cache import QueryCache
+from shared_index import IndexFollower, acquire_writer_lock, open_follower
+from text_index import SEARCH_STAGES as KEYWORD_SEARCH_STAGES, open_text_index
+from tracing import increment, span
+from vector_store import open_vector_store
+
+INDEX_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_data")
+
+# Number of hits returned per search
+DEFAULT_TOP_K = 10
+
+# Inverted lists scanned per query in the research profile; raise for recall, lower for latency
+RESEARCH_NPROBE = 8
+
+# Product-quantisation sub-vectors for research embeddings: 32 one-byte codes plus an
+# 8-byte list id per vector, about 25x smaller than float32; None scores the float16 store directly
+RESEARCH_PQ_SUBSPACES = 32
+
+
+class SearchService:
+    """Query engine shared by the Streamlit apps, the CLI and the HTTP API
+
+    Runs hybrid BM25 + dense search when given a retriever and BM25 only
+    otherwise. Results are plain JSON-serialisable record dicts, cached per
+    query, k and index version. Safe to call from many threads at once:
+    every search pins the snapshot it starts with and takes no lock. The
+    ``writer`` is an IndexFollower in a read-only process.
+    """
+
+    def __init__(self, writer, query_cache=None, retriever=None, default_k=DEFAULT_TOP_K):
+        self.writer = writer
+        self.query_cache = query_cache
+        self.retriever = retriever
+        self.default_k = default_k
+        if retriever is not None:
+            writer.subscribe(self._follow)
+        if query_cache is not None:
+            writer.subscribe(lambda updated: query_cache.purge_stale(updated.text_index.version))
+            register_component(f"{self.mode} query cache", query_cache.memory_bytes, query_cache.shrink, priority=10)
+        register_component(f"{self.mode} index", self.index_memory_bytes)
+        register_component(f"{self.mode} index files (mapped, shared)", lambda: self.writer.text_index.mapped_bytes())
+
+    def _follow(self, updated):
+        """Point the retriever at the indexes a commit or refresh published"""
+        self.retriever.text_index = updated.text_index
+        if updated.ivf_index is not None:
+            self.retriever.vector_index = updated.ivf_index
+
+    @property
+    def read_only(self):
+        """True when another process owns the index and this one follows its commits"""
+        return isinstance(self.writer, IndexFollower)
+
+    @property
+    def mode(self):
+        return "hybrid" if self.retriever is not None else "keyword"
+
+    @property
+    def search_stages(self):
+        """Stage names reported to a PipelineProgress passed to ``search``"""
+        return HYBRID_SEARCH_STAGES if self.retriever is not None else KEYWORD_SEARCH_STAGES
+
+    @property
+    def index_version(self):
+        return self.writer.text_index.version
+
+    def index_memory_bytes(self):
+        """Heap bytes held by the live BM25 and IVF indexes"""
+        size = self.writer.text_index.memory_bytes()
+        if self.writer.ivf_index is not None:
+            size += self.writer.ivf_index.memory_bytes()
+        return size
+
+    def _filters(self, k):
+        return {"k": k, "mode": self.mode}
+
+    def cached(self, query, k=None):
+        """Cached results for a query, or None on a miss"""
+        if self.query_cache is None:
+            return None
+        k = k or self.default_k
+        results = self.query_cache.get(query, self._filters(k), self.index_version)
+        if results is not None:
+            increment("queries")
+        return results
+
+    def search(self, query, k=None, progress=None, on_early_results=None, check_cache=True):
+        """Return the top-k result records for a query
+
+        ``progress`` is an optional PipelineProgress over ``search_stages``.
+        ``on_early_results`` receives keyword-only hits before fusion
+        finishes in hybrid mode. Pass ``check_cache=False`` after a miss
+        from ``cached`` so the lookup is not repeated.
+        """
+        k = k or self.default_k
+        if check_cache:
+            results = self.cached(query, k)
+            if results is not None:
+                return results
+
+        increment("queries")
+        index_version = self.index_version
+        with span("search"):
+            if self.retriever is not None:
+                results = self.retriever.search(query, k, progress, on_early_results)
+            else:
+                results = self.writer.text_index.search(query, k, progress)
+        if self.query_cache is not None:
+            self.query_cache.put(query, self._filters(k), index_version, results)
+        return results
+
+    def search_response(self, query, k=None):
+        """JSON payload returned by the CLI and the HTTP API"""
+        k = k or self.default_k
+        results = self.search(query, k)
+        return {
+            "query": query,
+            "k": k,
+            "mode": self.mode,
+            "index_version": self.index_version,
+            "results": results
+        }
+
+
+def open_demo_service(data_dir=INDEX_DATA_DIR, use_cache=True, read_only=False):
+    """BM25 search over the app.py demo corpus"""
+    text_dir = os.path.join(data_dir, "text")
+    if read_only:
+        writer = open_follower(text_dir)
+    else:
+        writer = IndexWriter(open_text_index(text_dir, records=get_demo_corpus()))
+    query_cache = QueryCache(os.path.join(data_dir, "query_cache.sqlite")) if use_cache else None
+    return SearchService(writer, query_cache)
+
+
+def open_research_service(data_dir=INDEX_DATA_DIR, use_cache=True, nprobe=RESEARCH_NPROBE,
+                          pq_subspaces=RESEARCH_PQ_SUBSPACES, read_only=False):
+    """Hybrid BM25 + IVF vector search over the clapp.py research corpus"""
+    encoder = HashingEncoder()
+    text_dir = os.path.join(data_dir, "research_text")
+    store_dir = os.path.join(data_dir, "research_vectors")
+    ivf_dir = os.path.join(data_dir, "research_ivf")
+    if read_only:
+        writer = open_follower(text_dir, store_dir, ivf_dir, nprobe=nprobe)
+    else:
+        corpus = get_mock_corpus()
+        text_index = open_text_index(text_dir, records=corpus)
+        store = open_vector_store(store_dir, encoder, records=corpus)
+        ivf_index = open_ivf_index(store, ivf_dir, nprobe=nprobe, pq_subspaces=pq_subspaces)
+        writer = IndexWriter(text_index, store, ivf_index)
+    retriever = HybridRetriever(writer.text_index, writer.ivf_index, encoder)
+    query_cache = QueryCache(os.path.join(data_dir, "research_query_cache.sqlite")) if use_cache else None
+    return SearchService(writer, query_cache, retriever)
+
+
+# Search profiles selectable from the CLI and the HTTP API
+PROFILES = {
+    "demo": open_demo_service,
+    "research": open_research_service
+}
+
+
+def open_service(profile="demo", data_dir=INDEX_DATA_DIR, use_cache=True, read_only=None):
+    """Open the search service for a named profile
+
+    ``use_cache=False`` skips the query result cache, for callers such as
+    batch runs that must see fresh results and should not write to disk.
+    With ``read_only`` left as None, the first process to open a data
+    directory becomes its writer and any other process follows it.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown search profile {profile!r}, expected one of {sorted(PROFILES)}")
+    if read_only is None:
+        read_only = not acquire_writer_lock(data_dir)
+    return PROFILES[profile](data_dir, use_cache, read_only=read_only)
+
+
+# Services opened by get_service, one per profile and data directory
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_service(profile="demo", data_dir=INDEX_DATA_DIR):
+    """The process-wide search service for a profile, opened on first use
+
+    Every Streamlit session, both apps and the HTTP API in one process
+    share the returned service and a single copy of its index. Across
+    processes, e.g. several Streamlit servers behind a proxy, one writes
+    and the rest map the same files read-only, so the index is held once
+    in the page cache however many servers and sessions read it.
+    """
+    key = (profile, os.path.abspath(data_dir))
+    with _services_lock:
+        if key not in _services:
+            _services[key] = open_service(profile, data_dir)
+        return _services[key]
@@ -0,0 +1,253 @@
+# Background Segment Merging for the Multimodal RAG System
+
+import math
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+import tracing
+from text_index import save_segment
+
+# Adjacent segments merged at once; also the size ratio between tiers
+MERGE_FACTOR = 8
+
+# Segments with up to this many live documents all share the lowest tier
+MIN_SEGMENT_DOCS = 256
+
+# A segment with at least this share of deleted documents is rewritten on its own
+DELETED_RATIO = 0.2
+
+# Merge budget: bytes read per second and share of wall time spent working,
+# so merges never starve the Streamlit script threads of disk or the GIL
+MERGE_IO_BYTES_PER_SECOND = 32 * 1024 * 1024
+MERGE_CPU_FRACTION = 0.25
+
+# Work done between budget checks
+MERGE_BATCH_TERMS = 2048
+MERGE_BATCH_DOCS = 512
+
+# Longest wait between merge checks when no commit wakes the merger
+MERGE_POLL_SECONDS = 30.0
+
+
+class MergeThrottle:
+    """Paces a merge to an I/O rate and a CPU duty cycle
+
+    ``pause(nbytes)`` is called after each unit of work. It sleeps until
+    the bytes processed are within ``io_bytes_per_second`` and the time
+    spent working is within ``cpu_fraction`` of the time elapsed. Sleeping
+    also hands the GIL to search threads.
+    """
+
+    def __init__(self, io_bytes_per_second=MERGE_IO_BYTES_PER_SECOND, cpu_fraction=MERGE_CPU_FRACTION):
+        self.io_bytes_per_second = io_bytes_per_second
+        self.cpu_fraction = cpu_fraction
+        self.started = time.perf_counter()
+        self.bytes = 0
+        self.busy = 0.0
+        self.slept = 0.0
+        self._mark = self.started
+
+    def pause(self, nbytes=0):
+        now = time.perf_counter()
+        self.busy += now - self._mark
+        self.bytes += nbytes
+        target = 0.0
+        if self.cpu_fraction:
+            target = self.busy / self.cpu_fraction
+        if self.io_bytes_per_second:
+            target = max(target, self.bytes / self.io_bytes_per_second)
+        wait = target - (now - self.started)
+        if wait > 0:
+            time.sleep(wait)
+            self.slept += wait
+        self._mark = time.perf_counter()
+
+
+def deleted_mask(segment, deleted_rows):
+    """Boolean mask of a segment's documents that are deleted"""
+    if len(deleted_rows) == 0:
+        return np.zeros(len(segment), dtype=bool)
+    return np.isin(segment.doc_rows, deleted_rows)
+
+
+def tier(live_docs, merge_factor=MERGE_FACTOR, min_docs=MIN_SEGMENT_DOCS):
+    """Size tier of a segment: 0 up to ``min_docs``, one more per ``merge_factor`` times larger"""
+    return int(math.log(max(live_docs, min_docs) / min_docs, merge_factor))
+
+
+def select_merge(snapshot, merge_factor=MERGE_FACTOR, min_docs=MIN_SEGMENT_DOCS, deleted_ratio=DELETED_RATIO):
+    """Names of the next run of adjacent segments to merge, or None when the index is in shape
+
+    A segment dominated by deleted documents is rewritten alone first.
+    Otherwise the oldest run of ``merge_factor`` adjacent segments in the
+    same tier is merged, so the segment count stays logarithmic in the
+    corpus size and each document is rewritten about once per tier.
+    """
+    deleted = np.array(sorted(snapshot.deleted_rows), dtype=np.int64)
+    segments = snapshot.segments
+    live = []
+    for segment in segments:
+        dead = int(deleted_mask(segment, deleted).sum())
+        if len(segment) and dead / len(segment) >= deleted_ratio:
+            return [segment.name]
+        live.append(len(segment) - dead)
+
+    tiers = [tier(count, merge_factor, min_docs) for count in live]
+    run_start = 0
+    for position in range(1, len(tiers) + 1):
+        if position == len(tiers) or tiers[position] != tiers[run_start]:
+            if position - run_start >= merge_factor:
+                return [segment.name for segment in segments[run_start:run_start + merge_factor]]
+            run_start = position
+    return None
+
+
+def merge_segments(index_dir, segments, deleted_rows, throttle=None):
+    """Write the live documents of adjacent segments as one new segment
+
+    Posting lists are concatenated segment by segment with documents
+    renumbered, so nothing is re-tokenised, and stored records are copied
+    as raw lines. Statistics are recomputed over the surviving documents.
+    Returns (new segment name or None when nothing survives, purged rows).
+    """
+    throttle = throttle or MergeThrottle()
+    deleted = np.array(sorted(deleted_rows), dtype=np.int64)
+
+    # New local ids of each segment's documents, -1 for deleted ones
+    mappings = []
+    purged = []
+    dead_types = Counter()
+    base = 0
+    for segment in segments:
+        dead = deleted_mask(segment, deleted)
+        mapping = np.full(len(segment), -1, dtype=np.int64)
+        mapping[~dead] = base + np.arange(int((~dead).sum()))
+        base += int((~dead).sum())
+        mappings.append(mapping)
+        for local in np.flatnonzero(dead):
+            purged.append(int(segment.doc_rows[local]))
+            dead_types[segment.get_document(int(local)).get("type", "unknown")] += 1
+    if base == 0:
+        return None, purged
+
+    lexicon = {}
+    docs_parts = []
+    tfs_parts = []
+    offset = 0
+    paused_at = 0
+    # Mapped lexicons are read once into dicts rather than binary-searched per term
+    lexicons = [dict(segment.lexicon.items()) for segment in segments]
+    terms = sorted(set().union(*lexicons))
+    for number, term in enumerate(terms, start=1):
+        term_docs = []
+        term_tfs = []
+        for segment, segment_lexicon, mapping in zip(segments, lexicons, mappings):
+            entry = segment_lexicon.get(term)
+            if entry is None:
+                continue
+            df, start = entry
+            docs = mapping[segment.posting_docs[start:start + df]]
+            keep = docs >= 0
+            term_docs.append(docs[keep])
+            term_tfs.append(segment.posting_tfs[start:start + df][keep])
+        docs = np.concatenate(term_docs)
+        if len(docs):
+            lexicon[term] = [len(docs), offset]
+            docs_parts.append(docs)
+            tfs_parts.append(np.concatenate(term_tfs))
+            offset += len(docs)
+        if number % MERGE_BATCH_TERMS == 0:
+            # Six bytes per posting: an int32 document and a uint16 frequency
+            throttle.pause(6 * (offset - paused_at))
+            paused_at = offset
+
+    live = [mapping >= 0 for mapping in mappings]
+    doc_lengths = np.concatenate([segment.doc_lengths[keep] for segment, keep in zip(segments, live)])
+    doc_rows = np.concatenate([segment.doc_rows[keep] for segment, keep in zip(segments, live)])
+
+    def doc_lines():
+        copied = 0
+        pending_bytes = 0
+        for segment, keep in zip(segments, live):
+            for local in np.flatnonzero(keep):
+                line = segment.document_line(int(local))
+                copied += 1
+                pending_bytes += len(line)
+                if copied % MERGE_BATCH_DOCS == 0:
+                    throttle.pause(pending_bytes)
+                    pending_bytes = 0
+                yield line
+
+    type_counts = Counter()
+    for segment in segments:
+        type_counts.update(segment.type_counts)
+    type_counts.subtract(dead_types)
+    meta = {
+        "num_docs": base,
+        "total_length": int(doc_lengths.sum()),
+        "type_counts": {name: count for name, count in type_counts.items() if count > 0},
+        "sources": sorted(set().union(*(segment.sources for segment in segments)))
+    }
+    empty = np.zeros(0, dtype=np.int64)
+    name = save_segment(index_dir, lexicon, np.concatenate(docs_parts) if docs_parts else empty,
+                        np.concatenate(tfs_parts) if tfs_parts else empty, doc_lengths, doc_rows, doc_lines(), meta)
+    return name, purged
+
+
+class SegmentMerger:
+    """Merges an IndexWriter's BM25 segments on a background thread
+
+    Wakes after every commit, and at least every ``MERGE_POLL_SECONDS``,
+    merges the run chosen by ``select_merge`` under a ``MergeThrottle``
+    without holding the writer's lock, then hands the result to
+    ``IndexWriter.commit_merge``. Merges run one at a time.
+    """
+
+    def __init__(self, writer, merge_factor=MERGE_FACTOR, min_docs=MIN_SEGMENT_DOCS,
+                 io_bytes_per_second=MERGE_IO_BYTES_PER_SECOND, cpu_fraction=MERGE_CPU_FRACTION):
+        self.writer = writer
+        self.merge_factor = merge_factor
+        self.min_docs = min_docs
+        self.io_bytes_per_second = io_bytes_per_second
+        self.cpu_fraction = cpu_fraction
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the merge thread and wake it after every commit; returns self"""
+        if self._thread is None:
+            self.writer.subscribe(lambda updated: self._wake.set())
+            self._thread = threading.Thread(target=self._run, name="segment-merger", daemon=True)
+            self._thread.start()
+            self._wake.set()
+        return self
+
+    def merge_once(self):
+        """Perform the next merge the policy asks for; returns False when there is none"""
+        snapshot = self.writer.text_index
+        names = select_merge(snapshot, self.merge_factor, self.min_docs)
+        if names is None:
+            return False
+        segments = [segment for segment in snapshot.segments if segment.name in names]
+        throttle = MergeThrottle(self.io_bytes_per_second, self.cpu_fraction)
+        with tracing.span("merge"):
+            merged_name, purged = merge_segments(snapshot.index_dir, segments, snapshot.deleted_rows, throttle)
+        self.writer.commit_merge(names, merged_name)
+        tracing.record("merge.throttled", throttle.slept)
+        tracing.increment("segments_merged", len(names))
+        tracing.increment("deleted_documents_purged", len(purged))
+        return True
+
+    def _run(self):
+        while True:
+            self._wake.wait(MERGE_POLL_SECONDS)
+            self._wake.clear()
+            try:
+                while self.merge_once():
+                    pass
+            except Exception:
+                # A failed merge leaves the published snapshot untouched; the next wake retries
+                tracing.increment("merge_failures")
@@ -0,0 +1,174 @@
+# Shared Read-Only Index Handles for the Multimodal RAG System
+
+import json
+import os
+import threading
+import time
+
+from ann_index import MANIFEST_FILE as IVF_MANIFEST_FILE, IVFIndex
+from text_index import MANIFEST_FILE, TextIndex
+from tracing import increment
+from vector_store import VectorStore
+
+try:
+    import fcntl
+except ImportError:
+    # Windows locks byte ranges instead
+    fcntl = None
+    import msvcrt
+
+# Held for its lifetime by the one process allowed to write an index data directory
+WRITER_LOCK_FILE = "writer.lock"
+
+# How often read-only processes look for snapshots the writer has published
+REFRESH_INTERVAL_SECONDS = 2.0
+
+# How long a read-only process waits for the writer to finish building a new index
+OPEN_TIMEOUT_SECONDS = 120.0
+
+# Lock files held by this process, by path; closing one would release the lock
+_writer_locks = {}
+_writer_locks_guard = threading.Lock()
+
+
+def acquire_writer_lock(data_dir):
+    """Try to become the writing process for an index data directory; True when this process holds the lock
+
+    The lock is non-blocking and released by the OS when the process
+    exits, so a crashed writer never locks out its successor. Calls from
+    a process that already holds it return True.
+    """
+    path = os.path.join(os.path.abspath(data_dir), WRITER_LOCK_FILE)
+    with _writer_locks_guard:
+        if path in _writer_locks:
+            return True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            handle.close()
+            return False
+        _writer_locks[path] = handle
+        return True
+
+
+def wait_for_file(path, timeout=OPEN_TIMEOUT_SECONDS):
+    """Block until the writer has created ``path``"""
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise FileNotFoundError(f"Timed out waiting for the index writer to create {path}")
+        time.sleep(0.5)
+
+
+def read_ivf_meta(index_dir):
+    with open(os.path.join(index_dir, IVF_MANIFEST_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class IndexFollower:
+    """Read-only view of indexes that another process writes
+
+    Offers the reader side of an IndexWriter (``text_index``, ``store``,
+    ``ivf_index`` and ``subscribe``) and polls the writer's commit points
+    instead of making commits: the BM25 manifest, the IVF metadata and
+    the vector store header, read in the reverse of the order the writer
+    commits them, so every row a snapshot or inverted list names is
+    already mapped. Segments, vectors, inverted lists and PQ codes are all
+    memory-mapped, so every follower shares the writer's copy through the
+    page cache rather than holding its own.
+    """
+
+    def __init__(self, text_index, store=None, ivf_index=None, interval=REFRESH_INTERVAL_SECONDS):
+        self.text_index = text_index
+        self.store = store
+        self.ivf_index = ivf_index
+        self.interval = interval
+        self._ivf_meta = read_ivf_meta(ivf_index.index_dir) if ivf_index is not None else None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """Register a callback invoked after every refresh that found new data"""
+        self._listeners.append(callback)
+
+    def _refresh_ivf(self):
+        """Pick up the IVF blocks or generation the writer has committed since the last call"""
+        meta = read_ivf_meta(self.ivf_index.index_dir)
+        if meta == self._ivf_meta:
+            return False
+        if meta.get("generation") is not None and meta["generation"] == self.ivf_index.generation:
+            # Commits append blocks to the current generation, so only the new ones are read
+            self.ivf_index.extend(meta)
+            self._ivf_meta = meta
+            return True
+        ivf_index = IVFIndex.load(self.store, self.ivf_index.index_dir, map_codes=True)
+        # A new generation replaces the old one's directory; a load that straddled two is retried
+        if read_ivf_meta(self.ivf_index.index_dir) != meta:
+            return False
+        ivf_index.nprobe = self.ivf_index.nprobe
+        ivf_index.rerank_factor = self.ivf_index.rerank_factor
+        self.ivf_index = ivf_index
+        self._ivf_meta = meta
+        return True
+
+    def refresh(self):
+        """Pick up whatever the writer has published since the last call; returns True when anything changed"""
+        with self._lock:
+            text_index = self.text_index.refresh()
+            changed = text_index is not self.text_index
+            # The store is remapped after the IVF index, so it covers every row the lists name
+            if self.ivf_index is not None:
+                changed = self._refresh_ivf() or changed
+            if self.store is not None:
+                changed = self.store.refresh() or changed
+            self.text_index = text_index
+        if changed:
+            increment("index_refreshes")
+            for callback in self._listeners:
+                callback(self)
+        return changed
+
+    def start(self):
+        """Refresh from a daemon thread every ``interval`` seconds; returns self"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="index-follower", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except (OSError, ValueError, KeyError):
+                # Files the writer was replacing mid-read; the next poll sees the finished commit
+                increment("index_refresh_failures")
+
+
+def open_follower(text_dir, store_dir=None, ivf_dir=None, nprobe=None):
+    """Open indexes written by another process read-only and start following them
+
+    Waits for the writer to finish building any index that does not
+    exist yet.
+    """
+    wait_for_file(os.path.join(text_dir, MANIFEST_FILE))
+    text_index = TextIndex(text_dir)
+    store = ivf_index = None
+    if store_dir is not None:
+        wait_for_file(os.path.join(store_dir, "store.json"))
+        store = VectorStore(store_dir)
+    if ivf_dir is not None:
+        wait_for_file(os.path.join(ivf_dir, IVF_MANIFEST_FILE))
+        ivf_index = IVFIndex.load(store, ivf_dir, map_codes=True)
+        if nprobe is not None:
+            ivf_index.nprobe = nprobe
+        # Rows the writer added while the lists were loading
+        store.refresh()
+    return IndexFollower(text_index, store, ivf_index).start()
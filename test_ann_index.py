@@ -0,0 +1,136 @@
+# IVF Index Tests for the Multimodal RAG System
+
+import os
+
+import numpy as np
+import pytest
+
+from ann_index import LIST_IDS_FILE, MANIFEST_FILE, IVFIndex
+from quantization import evaluate_recall
+from shared_index import IndexFollower
+from text_index import build_text_index
+from vector_store import VectorStore
+
+DIM = 64
+ROWS = 2000
+NLIST = 64
+
+
+def clustered_vectors(count, seed=0, clusters=40):
+    """Unit vectors around fixed random centres, so nearby rows share inverted lists"""
+    centres = np.random.default_rng(0).standard_normal((clusters, DIM))
+    rng = np.random.default_rng(seed)
+    vectors = centres[rng.integers(clusters, size=count)] + 0.35 * rng.standard_normal((count, DIM))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VectorStore(str(tmp_path / "vectors"), dim=DIM)
+    store.add(clustered_vectors(ROWS), [{"row": row} for row in range(ROWS)])
+    return store
+
+
+@pytest.fixture
+def queries():
+    return clustered_vectors(50, seed=7)
+
+
+def test_probing_every_list_is_exact(store, queries, tmp_path):
+    index = IVFIndex(store, str(tmp_path / "ivf")).build(nlist=NLIST)
+
+    for query in queries[:10]:
+        assert index.top_k(query, 10, nprobe=NLIST) == store.top_k(query, 10)
+
+
+def test_recall_grows_with_nprobe(store, queries, tmp_path):
+    index = IVFIndex(store, str(tmp_path / "ivf")).build(nlist=NLIST)
+    recall = {}
+    for nprobe in (1, 4, 16):
+        index.nprobe = nprobe
+        recall[nprobe] = evaluate_recall(index, queries)["recall_reranked"]
+
+    assert recall[1] < recall[4] <= recall[16]
+    assert recall[16] >= 0.9
+
+
+def test_rows_added_after_training_are_searchable_and_saved(store, queries, tmp_path):
+    index = IVFIndex(store, str(tmp_path / "ivf"), nprobe=16).build(nlist=NLIST)
+    index.save()
+    added = clustered_vectors(100, seed=3)
+    store.add(added, [{"row": row} for row in range(ROWS, ROWS + 100)])
+
+    # Rows not yet assigned to a list are scored exhaustively
+    assert index.top_k(added[0], 1)[0][0] == ROWS
+    index.add_rows()
+    assert index.indexed_rows == ROWS + 100
+    assert index.top_k(added[0], 1)[0][0] == ROWS
+    index.save()
+
+    loaded = IVFIndex.load(store, str(tmp_path / "ivf"))
+    assert loaded.indexed_rows == ROWS + 100
+    for query in queries[:10]:
+        assert loaded.top_k(query, 10) == index.top_k(query, 10)
+
+
+def test_product_quantisation_keeps_recall_after_reranking(store, queries, tmp_path):
+    exact = IVFIndex(store, str(tmp_path / "ivf"), nprobe=16).build(nlist=NLIST)
+    compressed = IVFIndex(store, str(tmp_path / "ivf-pq"), nprobe=16, pq_subspaces=16).build(nlist=NLIST)
+
+    report = evaluate_recall(compressed, queries)
+    assert report["recall_reranked"] >= evaluate_recall(exact, queries)["recall_reranked"] - 0.02
+    assert report["recall_approximate"] < report["recall_reranked"]
+    assert report["recall_approximate"] >= 0.5
+    # 16 one-byte codes plus an int64 list id, against 256 bytes of float32
+    assert report["bytes_per_vector"] == 16 + 8
+    assert report["compression"] == round(DIM * 4 / 24, 1)
+
+
+def test_product_quantised_index_reloads_the_same_codes(store, queries, tmp_path):
+    index = IVFIndex(store, str(tmp_path / "ivf-pq"), nprobe=16, pq_subspaces=16).build(nlist=NLIST)
+    index.save()
+
+    for map_codes in (False, True):
+        loaded = IVFIndex.load(store, str(tmp_path / "ivf-pq"), map_codes=map_codes)
+        assert np.array_equal(loaded.codes, index.codes)
+        assert [loaded.top_k(query, 10) for query in queries[:10]] == [index.top_k(query, 10) for query in queries[:10]]
+
+
+def test_follower_extends_appended_blocks_and_reloads_new_generations(store, queries, tmp_path):
+    ivf_dir = str(tmp_path / "ivf")
+    writer = IVFIndex(store, ivf_dir, nprobe=16, pq_subspaces=16).build(nlist=NLIST)
+    writer.save()
+    follower_store = VectorStore(store.store_dir)
+    follower = IndexFollower(build_text_index([{"content": "unused"}], str(tmp_path / "text")), follower_store,
+                             IVFIndex.load(follower_store, ivf_dir, map_codes=True))
+    followed = follower.ivf_index
+
+    added = clustered_vectors(100, seed=3)
+    store.add(added, [{"row": row} for row in range(ROWS, ROWS + 100)])
+    writer.add_rows()
+    writer.save()
+    # Bytes an interrupted save left past the committed blocks are never read, and the next save overwrites them
+    with open(os.path.join(ivf_dir, writer.generation, LIST_IDS_FILE), "ab") as f:
+        f.write(b"\xff" * 64)
+
+    assert follower.refresh()
+    assert follower.ivf_index is followed
+    assert followed.generation == writer.generation and followed._blocks == 2
+    assert followed.indexed_rows == ROWS + 100
+    for query in list(queries[:10]) + list(added[:5]):
+        assert followed.top_k(query, 10) == writer.top_k(query, 10)
+
+    # Once the appended blocks hold as many list ids as the first one, the next save writes a new generation
+    store.add(clustered_vectors(ROWS, seed=4), [{"row": row} for row in range(ROWS + 100, 2 * ROWS + 100)])
+    writer.add_rows()
+    writer.save()
+    assert writer._blocks == 3
+    writer.save()
+    assert writer._blocks == 1 and writer.generation != followed.generation
+
+    assert follower.refresh()
+    assert follower.ivf_index is not followed
+    assert follower.ivf_index.generation == writer.generation
+    assert sorted(os.listdir(ivf_dir)) == sorted([MANIFEST_FILE, writer.generation])
+    for query in queries[:10]:
+        assert follower.ivf_index.top_k(query, 10) == writer.top_k(query, 10)
@@ -0,0 +1,39 @@
+# Batch Query Tests for the Multimodal RAG System
+
+import io
+import json
+
+from batch_search import read_requests, run_batch
+
+LINES = [
+    "quarterly revenue\n",
+    "\n",
+    '{"query": "processor benchmarks", "k": 2, "id": "q2"}\n',
+    '{"query": "unterminated\n',
+    '{"k": 3}\n',
+    "market trends\n",
+]
+
+
+def test_read_requests_reports_malformed_lines():
+    requests = list(read_requests(LINES))
+
+    assert [request[0] for request in requests] == [1, 3, 4, 5, 6]
+    assert requests[0] == (1, "quarterly revenue", None, None, None)
+    assert requests[1] == (3, "processor benchmarks", 2, "q2", None)
+    assert requests[2][4].startswith("invalid JSON")
+    assert requests[3][4] == "missing field 'query'"
+    assert requests[4] == (6, "market trends", None, None, None)
+
+
+def test_run_batch_keeps_going_past_malformed_lines(tmp_path):
+    output = io.StringIO()
+    summary = run_batch(read_requests(LINES), output, workers=1, chunk_size=2, data_dir=str(tmp_path))
+
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [record["line"] for record in records] == [1, 3, 4, 5, 6]
+    assert "error" in records[2] and "error" in records[3]
+    assert all(record["results"] for index, record in enumerate(records) if index not in (2, 3))
+    assert len(records[1]["results"]) <= 2 and records[1]["id"] == "q2"
+    assert summary["queries"] == 5
+    assert summary["errors"] == 2
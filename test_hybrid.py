@@ -0,0 +1,67 @@
+# Hybrid Retrieval Tests for the Multimodal RAG System
+
+import pytest
+
+from ann_index import open_ivf_index
+from demo_data import get_mock_corpus
+from embeddings import HashingEncoder
+from hybrid import RRF_K, HybridRetriever
+from text_index import build_text_index
+from vector_store import open_vector_store
+
+LEXICAL = [(1, 0.9), (2, 0.8), (3, 0.7)]
+DENSE = [(2, 0.6), (4, 0.5), (1, 0.4)]
+
+
+def retriever(**options):
+    return HybridRetriever(None, None, None, **options)
+
+
+def test_rrf_sums_weighted_reciprocal_ranks():
+    fused = {doc_id: (score, relevance) for doc_id, score, relevance in retriever(candidates=10).fuse(LEXICAL, DENSE)}
+
+    assert fused[1][0] == pytest.approx(0.5 / (RRF_K + 1) + 0.5 / (RRF_K + 3))
+    assert fused[2][0] == pytest.approx(0.5 / (RRF_K + 2) + 0.5 / (RRF_K + 1))
+    assert fused[3][0] == pytest.approx(0.5 / (RRF_K + 3))
+    # Both lists are complete, so a document missing from one scores zero there
+    assert fused[3][1] == pytest.approx(0.35)
+    assert fused[4][1] == pytest.approx(0.25)
+
+
+def test_rrf_ranks_by_position_and_weighted_by_score():
+    rrf = [doc_id for doc_id, _, _ in retriever(candidates=10).fuse(LEXICAL, DENSE)]
+    weighted = [doc_id for doc_id, _, _ in retriever(candidates=10, fusion="weighted").fuse(LEXICAL, DENSE)]
+
+    # Rank alone puts 4 (second in dense) above 3 (third in BM25); its lower score does not
+    assert rrf == [2, 1, 4, 3]
+    assert weighted == [2, 1, 3, 4]
+    heavy_dense = retriever(candidates=10, lexical_weight=0.05, dense_weight=0.95, fusion="weighted")
+    assert [doc_id for doc_id, _, _ in heavy_dense.fuse(LEXICAL, DENSE)][:2] == [2, 4]
+
+
+def test_truncated_list_defaults_to_its_last_score():
+    fused = {doc_id: relevance for doc_id, _, relevance in retriever(candidates=3).fuse(LEXICAL, DENSE)}
+
+    # Document 4 fell outside the truncated BM25 list, so it scored at most 0.7 there
+    assert fused[4] == pytest.approx(0.5 * 0.7 + 0.5 * 0.5)
+
+
+def test_unknown_fusion_method_is_rejected():
+    with pytest.raises(ValueError):
+        retriever(fusion="max")
+
+
+def test_search_streams_keyword_hits_before_fused_results(tmp_path):
+    corpus = get_mock_corpus()
+    encoder = HashingEncoder()
+    store = open_vector_store(str(tmp_path / "vectors"), encoder, records=corpus)
+    hybrid = HybridRetriever(build_text_index(corpus, str(tmp_path / "text")),
+                             open_ivf_index(store, str(tmp_path / "ivf")), encoder)
+    early = []
+
+    results = hybrid.search("quarterly revenue", k=5, on_early_results=early.extend)
+
+    assert early and len(early) <= 5
+    assert 0 < len(results) <= 5
+    assert all(0 <= result["relevance"] <= 1 for result in results)
+    assert {result["doc_id"] for result in early} & {result["doc_id"] for result in results}
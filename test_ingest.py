@@ -0,0 +1,59 @@
+# Ingestion Tests for the Multimodal RAG System
+
+import random
+import time
+
+from ann_index import open_ivf_index
+from demo_data import get_demo_corpus
+from embeddings import HashingEncoder
+from ingest import IndexWriter, IngestManager
+from text_index import build_text_index
+from vector_store import open_vector_store
+
+JOB_TIMEOUT_SECONDS = 120
+
+
+def wait_for_jobs(manager):
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while manager.active_jobs():
+        assert time.monotonic() < deadline, "ingestion did not finish"
+        time.sleep(0.05)
+
+
+def search_sources(writer, query):
+    return {record.get("source") for record in writer.text_index.search(query, 10)}
+
+
+def test_replacing_a_file_keeps_its_near_duplicates_searchable(tmp_path):
+    corpus = get_demo_corpus()
+    encoder = HashingEncoder()
+    store = open_vector_store(str(tmp_path / "vectors"), encoder, records=corpus)
+    writer = IndexWriter(build_text_index(corpus, str(tmp_path / "text")), store,
+                         open_ivf_index(store, str(tmp_path / "ivf")))
+    manager = IngestManager(writer, max_workers=1, embedding_cache_path=None, merge=False)
+    try:
+        rng = random.Random(0)
+        vocabulary = [f"w{number}" for number in range(3000)]
+        original = " ".join(rng.choice(vocabulary) for _ in range(600))
+        # One extra word keeps the copy well above the near-duplicate threshold
+        copy = f"zebra {original}"
+
+        first = manager.submit("A.txt", original.encode())
+        wait_for_jobs(manager)
+        second = manager.submit("B.txt", copy.encode())
+        wait_for_jobs(manager)
+        assert manager.status(first)["state"] == "done"
+        assert manager.status(second)["duplicates"] > 0
+        assert "B.txt" not in search_sources(writer, "zebra")
+
+        changed = " ".join(rng.choice(vocabulary) for _ in range(600))
+        manager.submit("A.txt", changed.encode())
+        wait_for_jobs(manager)
+
+        assert "B.txt" in search_sources(writer, "zebra")
+        assert writer.text_index.rows_for_source("B.txt")
+        promoted = next(record for _, record in writer.text_index.iter_rows() if record.get("source") == "B.txt")
+        assert {member["source"] for member in manager.duplicates.cluster(promoted["id"])} == {"B.txt"}
+        assert len(store) == writer.text_index.num_rows
+    finally:
+        manager.shutdown()
@@ -0,0 +1,65 @@
+# Query Cache Tests for the Multimodal RAG System
+
+import time
+
+from query_cache import TRIM_INTERVAL, QueryCache
+
+FILTERS = {"k": 10}
+RESULTS = [{"doc_id": 3, "source": "report.pdf", "confidence": 0.8}]
+
+
+def test_normalised_queries_share_an_entry(tmp_path):
+    cache = QueryCache(str(tmp_path / "cache.sqlite"))
+    cache.put("Quarterly  revenue?", FILTERS, "v1", RESULTS)
+
+    assert cache.get("quarterly revenue", FILTERS, "v1") == RESULTS
+    assert cache.get("quarterly revenue", {"k": 5}, "v1") is None
+    assert cache.get("quarterly revenue", FILTERS, "v2") is None
+
+
+def test_results_are_returned_as_copies(tmp_path):
+    cache = QueryCache(str(tmp_path / "cache.sqlite"))
+    cache.put("revenue", FILTERS, "v1", RESULTS)
+    cache.get("revenue", FILTERS, "v1")[0]["source"] = "changed"
+
+    assert cache.get("revenue", FILTERS, "v1") == RESULTS
+
+
+def test_memory_misses_fall_back_to_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = QueryCache(path, memory_entries=1)
+    cache.put("first", FILTERS, "v1", RESULTS)
+    cache.put("second", FILTERS, "v1", RESULTS)
+
+    assert cache.get("first", FILTERS, "v1") == RESULTS
+    assert cache.get("first", FILTERS, "v1") == RESULTS
+    assert cache.get("missing", FILTERS, "v1") is None
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["memory_entries"] == 1
+
+    # A new instance, as after a restart, reads the disk tier
+    assert QueryCache(path).get("second", FILTERS, "v1") == RESULTS
+
+
+def test_expired_and_stale_entries_are_not_served(tmp_path):
+    cache = QueryCache(str(tmp_path / "cache.sqlite"), ttl_seconds=0.05)
+    cache.put("revenue", FILTERS, "v1", RESULTS)
+    time.sleep(0.1)
+    assert cache.get("revenue", FILTERS, "v1") is None
+
+    cache.ttl_seconds = 60
+    cache.put("revenue", FILTERS, "v1", RESULTS)
+    cache.put("revenue", FILTERS, "v2", RESULTS)
+    cache.purge_stale("v2")
+    assert cache.stats()["disk_entries"] == 1
+    assert cache.get("revenue", FILTERS, "v2") == RESULTS
+
+
+def test_disk_tier_is_trimmed_to_its_bound(tmp_path):
+    cache = QueryCache(str(tmp_path / "cache.sqlite"), memory_entries=4, disk_entries=10)
+    for number in range(TRIM_INTERVAL):
+        cache.put(f"query {number}", FILTERS, "v1", RESULTS)
+
+    assert cache.stats()["disk_entries"] == 10
+    assert cache.get(f"query {TRIM_INTERVAL - 1}", FILTERS, "v1") == RESULTS
@@ -0,0 +1,88 @@
+# HTTP Search API Tests for the Multimodal RAG System
+
+import asyncio
+import http.client
+import json
+import threading
+
+import pytest
+
+from search_api import MAX_K, SearchAPI
+from search_service import open_service
+
+
+@pytest.fixture(scope="module")
+def address(tmp_path_factory):
+    """Serve the demo profile on an ephemeral port from a daemon thread"""
+    service = open_service("demo", str(tmp_path_factory.mktemp("index_data")), use_cache=False, read_only=False)
+    bound = []
+    ready = threading.Event()
+
+    def on_ready(host_port):
+        bound.append(host_port)
+        ready.set()
+
+    threading.Thread(target=lambda: asyncio.run(SearchAPI(service, workers=2).serve("127.0.0.1", 0, on_ready)),
+                     daemon=True).start()
+    assert ready.wait(30), "server did not start"
+    return bound[0]
+
+
+def request(address, method, path, body=None):
+    connection = http.client.HTTPConnection(*address, timeout=30)
+    try:
+        connection.request(method, path, body=json.dumps(body) if body is not None else None)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def test_get_and_post_search_agree(address):
+    status, body = request(address, "GET", "/search?q=quarterly+revenue&k=3")
+    assert status == 200
+    payload = json.loads(body)
+    assert payload["query"] == "quarterly revenue" and payload["k"] == 3
+    assert 0 < len(payload["results"]) <= 3
+
+    status, body = request(address, "POST", "/search", {"query": "quarterly revenue", "k": 3})
+    assert status == 200
+    assert json.loads(body)["results"] == payload["results"]
+
+
+def test_keep_alive_serves_several_requests(address):
+    connection = http.client.HTTPConnection(*address, timeout=30)
+    try:
+        for path in ("/health", "/search?q=processor", "/metrics"):
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            assert response.status == 200
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize("method, path, body, status", [
+    ("GET", "/search", None, 400),
+    ("GET", f"/search?q=revenue&k={MAX_K + 1}", None, 400),
+    ("GET", "/search?q=revenue&k=ten", None, 400),
+    ("POST", "/search", ["revenue"], 400),
+    ("DELETE", "/search?q=revenue", None, 405),
+    ("GET", "/unknown", None, 404),
+])
+def test_bad_requests_get_json_errors(address, method, path, body, status):
+    answered, data = request(address, method, path, body)
+
+    assert answered == status
+    assert json.loads(data)["error"]
+
+
+def test_invalid_json_body_is_rejected(address):
+    connection = http.client.HTTPConnection(*address, timeout=30)
+    try:
+        connection.request("POST", "/search", body=b"{not json")
+        response = connection.getresponse()
+        assert response.status == 400
+        assert "not valid JSON" in json.loads(response.read())["error"]
+    finally:
+        connection.close()
@@ -0,0 +1,107 @@
+# BM25 Index Tests for the Multimodal RAG System
+
+import math
+import os
+import time
+from collections import Counter
+
+import pytest
+
+from text_index import (BM25_B, BM25_K1, ORPHAN_GRACE_SECONDS, SEGMENTS_DIR, build_text_index, open_text_index,
+                        record_text, remove_orphan_segments, tokenize, write_segment)
+
+RECORDS = [
+    {"type": "text", "source": "a.txt", "content": "quarterly revenue grew across every region"},
+    {"type": "text", "source": "b.txt", "content": "revenue revenue revenue from cloud services"},
+    {"type": "text", "source": "c.txt", "content": "the processor benchmark measured latency and throughput"},
+    {"type": "image", "source": "d.png", "description": "chart of quarterly cloud revenue by segment and region"},
+    {"type": "audio", "source": "e.mp3", "transcript": "the chief executive discussed quarterly performance"},
+]
+
+
+def reference_scores(records, query, k1=BM25_K1, b=BM25_B):
+    """Textbook BM25 over the same tokenisation, one document at a time"""
+    documents = [Counter(tokenize(record_text(record))) for record in records]
+    avg_length = sum(sum(terms.values()) for terms in documents) / len(documents)
+    scores = {}
+    for doc_id, terms in enumerate(documents):
+        length = sum(terms.values())
+        score = 0.0
+        for term in set(tokenize(query)):
+            tf = terms[term]
+            if not tf:
+                continue
+            df = sum(1 for other in documents if term in other)
+            idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+        if score:
+            scores[doc_id] = score
+    return scores
+
+
+@pytest.mark.parametrize("query", ["quarterly revenue", "cloud", "processor latency", "Revenue REGION"])
+def test_scores_match_reference_bm25(tmp_path, query):
+    index = build_text_index(RECORDS, str(tmp_path))
+    doc_ids, scores = index.score(query)
+
+    assert dict(zip(doc_ids.tolist(), scores.tolist())) == pytest.approx(reference_scores(RECORDS, query), rel=1e-5)
+
+
+def test_search_ranks_by_score_with_bounded_confidence(tmp_path):
+    index = build_text_index(RECORDS, str(tmp_path))
+    results = index.search("revenue", k=3)
+
+    expected = sorted(reference_scores(RECORDS, "revenue").items(), key=lambda item: -item[1])[:3]
+    assert [result["doc_id"] for result in results] == [doc_id for doc_id, _ in expected]
+    assert results[0]["source"] == "b.txt"
+    assert all(0 < result["confidence"] < 1 for result in results)
+    assert index.search("zebra") == []
+
+
+def test_segments_score_like_a_single_index(tmp_path):
+    single = build_text_index(RECORDS, str(tmp_path / "single"))
+    segmented = build_text_index(RECORDS[:2], str(tmp_path / "segmented"))
+    segmented = segmented.publish([write_segment(segmented.index_dir, RECORDS[2:], first_row=2)])
+
+    assert len(segmented.segments) == 2
+    for query in ("quarterly revenue", "cloud", "processor latency"):
+        expected_ids, expected_scores = single.score(query)
+        doc_ids, scores = segmented.score(query)
+        assert dict(zip(doc_ids.tolist(), scores.tolist())) == \
+            pytest.approx(dict(zip(expected_ids.tolist(), expected_scores.tolist())), rel=1e-5)
+
+
+def test_published_snapshot_does_not_change_open_ones(tmp_path):
+    index_dir = str(tmp_path)
+    before = build_text_index(RECORDS, index_dir)
+    added = {"type": "text", "source": "f.txt", "content": "zebra quarterly revenue"}
+    after = before.publish([write_segment(index_dir, [added], first_row=len(RECORDS))], deleted_rows=[1])
+
+    assert before.search("zebra") == []
+    assert 1 in {result["doc_id"] for result in before.search("revenue")}
+    assert [result["source"] for result in after.search("zebra")] == ["f.txt"]
+    assert 1 not in {result["doc_id"] for result in after.search("revenue")}
+    assert len(after) == len(before)
+    # A new reader opens whatever the manifest names now
+    reopened = open_text_index(index_dir)
+    assert reopened.version == after.version and before.refresh().version == after.version
+
+
+def test_orphan_segments_are_removed_only_after_the_grace_period(tmp_path):
+    index_dir = str(tmp_path)
+    build_text_index(RECORDS, index_dir)
+    # A write that crashed, or has not published yet, leaves a segment no manifest names
+    orphan = write_segment(index_dir, RECORDS[:1], first_row=len(RECORDS))
+    orphan_path = os.path.join(index_dir, SEGMENTS_DIR, orphan)
+
+    remove_orphan_segments(index_dir)
+    assert os.path.isdir(orphan_path)
+    # Rebuilding respects the grace period too, so a concurrent writer's segment survives
+    index = build_text_index(RECORDS, index_dir)
+    assert os.path.isdir(orphan_path)
+
+    stale = time.time() - ORPHAN_GRACE_SECONDS - 60
+    os.utime(orphan_path, (stale, stale))
+    remove_orphan_segments(index_dir)
+    assert not os.path.exists(orphan_path)
+    assert all(os.path.isdir(os.path.join(index_dir, SEGMENTS_DIR, name)) for name in index.manifest["segments"])
@@ -0,0 +1,74 @@
+# Vector Store Tests for the Multimodal RAG System
+
+import numpy as np
+import pytest
+
+from vector_store import VectorStore
+
+DIM = 32
+
+
+def unit_vectors(count, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def records(first, count):
+    return [{"source": f"doc-{row}.txt", "content": f"chunk {row}"} for row in range(first, first + count)]
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float16", 1e-3), ("int8", 1e-2)])
+def test_vectors_and_records_round_trip(tmp_path, dtype, tolerance):
+    vectors = unit_vectors(50)
+    store = VectorStore(str(tmp_path), dim=DIM, dtype=dtype)
+    assert store.add(vectors[:20], records(0, 20)).tolist() == list(range(20))
+    assert store.add(vectors[20:], records(20, 30)).tolist() == list(range(20, 50))
+
+    reopened = VectorStore(str(tmp_path))
+    assert len(reopened) == 50
+    assert np.abs(reopened.get_vectors(np.arange(50)) - vectors).max() < tolerance
+    assert reopened.get_records([0, 49, 21]) == [records(row, 1)[0] for row in (0, 49, 21)]
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_blocked_top_k_matches_exact_search(tmp_path, dtype):
+    vectors = unit_vectors(500)
+    store = VectorStore(str(tmp_path), dim=DIM, dtype=dtype)
+    store.add(vectors, records(0, 500))
+    query = unit_vectors(1, seed=1)[0]
+
+    exact = np.argsort(-(store.get_vectors(np.arange(500)) @ query), kind="stable")[:10]
+    assert [row for row, _ in store.top_k(query, k=10, block_rows=64)] == exact.tolist()
+    assert [record["row_id"] for record in store.search(query, k=10)] == exact.tolist()
+
+
+def test_uncommitted_bytes_are_ignored_and_overwritten(tmp_path):
+    vectors = unit_vectors(30)
+    store = VectorStore(str(tmp_path), dim=DIM)
+    store.add(vectors[:10], records(0, 10))
+    # An append that crashed before its header write leaves bytes past the committed count
+    with open(store.vectors_path, "ab") as f:
+        f.write(b"\xff" * DIM * 2 * 5)
+    with open(store.meta_path, "ab") as f:
+        f.write(b'{"partial"')
+
+    reopened = VectorStore(str(tmp_path))
+    assert len(reopened) == 10
+    reopened.add(vectors[10:], records(10, 20))
+    assert np.abs(reopened.get_vectors(np.arange(30)) - vectors).max() < 1e-3
+    assert reopened.get_records([10, 29]) == [records(10, 1)[0], records(29, 1)[0]]
+
+
+def test_reader_sees_rows_only_after_refresh(tmp_path):
+    writer = VectorStore(str(tmp_path), dim=DIM)
+    writer.add(unit_vectors(5), records(0, 5))
+    reader = VectorStore(str(tmp_path))
+
+    writer.add(unit_vectors(3, seed=2), records(5, 3))
+    assert len(reader) == 5
+    assert reader.refresh()
+    assert len(reader) == 8
+    assert not reader.refresh()
+
+    writer.truncate(6)
+    assert reader.refresh() and len(reader) == 6
@@ -0,0 +1,589 @@
+# BM25 Inverted Index for the Multimodal RAG System
+
+import bisect
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from progress import report
+from tracing import span
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has",
+    "in", "is", "it", "its", "me", "of", "on", "or", "show", "that", "the",
+    "this", "to", "was", "we", "were", "what", "with"
+])
+
+# Record fields that carry searchable text
+TEXT_FIELDS = ("content", "description", "transcript", "highlighted_text", "source")
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_data", "text")
+
+# The manifest names the segments of the current snapshot; replacing it publishes a new one
+MANIFEST_FILE = "manifest.json"
+SEGMENTS_DIR = "segments"
+
+# Unreferenced segments younger than this may belong to a write in progress
+ORPHAN_GRACE_SECONDS = 3600
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Queries touching more than 1/8 of the corpus use a dense score array
+DENSE_ACCUMULATOR_RATIO = 8
+
+# Stages reported by TextIndex.search
+SEARCH_STAGES = ("Scoring BM25 postings...", "Ranking results by relevance...", "Loading matched chunks...")
+
+# BM25 score at which confidence reaches 0.5
+CONFIDENCE_PIVOT = 1.0
+
+
+def tokenize(text):
+    """Split text into lowercase terms, dropping stopwords"""
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+def record_text(record):
+    """Collect the searchable text of a result record"""
+    return " ".join(str(record[field]) for field in TEXT_FIELDS if record.get(field))
+
+
+def score_to_confidence(score):
+    """Map an unbounded BM25 score onto the 0-1 confidence scale"""
+    return score / (score + CONFIDENCE_PIVOT)
+
+
+class MappedLexicon:
+    """Read-only term -> (df, posting offset) map kept in memory-mapped files
+
+    Terms are stored sorted as UTF-8 bytes, whose order matches string
+    order, and found by binary search. Nothing is copied onto the heap, so
+    every process that opens a segment shares a single copy in the page
+    cache. Supports the dict operations the index and merger use.
+    """
+
+    def __init__(self, path):
+        self.offsets = np.load(os.path.join(path, "lexicon_offsets.npy"), mmap_mode="r")
+        self.entries = np.load(os.path.join(path, "lexicon_entries.npy"), mmap_mode="r")
+        with open(os.path.join(path, "lexicon_terms.bin"), "rb") as f:
+            self._terms = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if len(self.entries) else b""
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        if len(self.entries):
+            self._terms.close()
+
+    def _term(self, position):
+        return self._terms[int(self.offsets[position]):int(self.offsets[position + 1])]
+
+    def _find(self, term):
+        key = term.encode("utf-8")
+        low, high = 0, len(self.entries)
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.entries) and self._term(low) == key:
+            return low
+        return None
+
+    def get(self, term, default=None):
+        position = self._find(term)
+        if position is None:
+            return default
+        df, offset = self.entries[position]
+        return int(df), int(offset)
+
+    def __getitem__(self, term):
+        entry = self.get(term)
+        if entry is None:
+            raise KeyError(term)
+        return entry
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def __iter__(self):
+        for position in range(len(self.entries)):
+            yield self._term(position).decode("utf-8")
+
+    def items(self):
+        for term, (df, offset) in zip(self, self.entries.tolist()):
+            yield term, (df, offset)
+
+
+def save_lexicon(directory, lexicon):
+    """Write a term -> (df, posting offset) dict in the format MappedLexicon reads"""
+    terms = sorted(term.encode("utf-8") for term in lexicon)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(term) for term in terms])
+    entries = np.array([lexicon[term.decode("utf-8")] for term in terms], dtype=np.int64).reshape(-1, 2)
+    with open(os.path.join(directory, "lexicon_terms.bin"), "wb") as f:
+        f.write(b"".join(terms))
+    np.save(os.path.join(directory, "lexicon_offsets.npy"), offsets)
+    np.save(os.path.join(directory, "lexicon_entries.npy"), entries)
+
+
+class Segment:
+    """One immutable slice of the BM25 index stored on disk
+
+    The lexicon, postings and per-document arrays are all memory-mapped,
+    so only the pages a query touches are read in and every process
+    serving the index shares them through the page cache. Segments
+    written before the mapped lexicon existed load ``lexicon.json`` onto
+    the heap instead. Posting lists hold local
+    document numbers; ``doc_rows`` maps them to global row ids, which
+    stay aligned with the vector store. A segment is never modified after
+    it is written, so any number of snapshots can share it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if os.path.exists(os.path.join(path, "lexicon_terms.bin")):
+            self.lexicon = MappedLexicon(path)
+        else:
+            with open(os.path.join(path, "lexicon.json"), encoding="utf-8") as f:
+                self.lexicon = json.load(f)
+
+        self.num_docs = meta["num_docs"]
+        self.total_length = meta["total_length"]
+        # Indexed chunks per record type, e.g. {"image": 12, "audio": 3}
+        self.type_counts = meta.get("type_counts", {})
+        # Source file names of the segment's records, to find a file's rows without reading every segment
+        self.sources = frozenset(meta.get("sources", ()))
+
+        self.posting_docs = np.load(os.path.join(path, "posting_docs.npy"), mmap_mode="r")
+        self.posting_tfs = np.load(os.path.join(path, "posting_tfs.npy"), mmap_mode="r")
+        self.doc_offsets = np.load(os.path.join(path, "doc_offsets.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"), mmap_mode="r")
+        self.doc_rows = np.load(os.path.join(path, "doc_rows.npy"), mmap_mode="r")
+
+        # The document store is memory-mapped so concurrent readers need no file position
+        with open(os.path.join(path, "docs.jsonl"), "rb") as f:
+            self._docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.num_docs else b""
+        self._memory_bytes = None
+        self._mapped_bytes = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    def __len__(self):
+        return self.num_docs
+
+    @property
+    def first_row(self):
+        return int(self.doc_rows[0]) if self.num_docs else 0
+
+    def close(self):
+        """Release the document store and lexicon mappings"""
+        if self.num_docs:
+            self._docs.close()
+        if isinstance(self.lexicon, MappedLexicon):
+            self.lexicon.close()
+
+    def memory_bytes(self):
+        """Approximate heap bytes held by the segment; only a legacy JSON lexicon lives on the heap"""
+        if self._memory_bytes is None:
+            self._memory_bytes = 0
+            if isinstance(self.lexicon, dict):
+                self._memory_bytes = sys.getsizeof(self.lexicon) + sum(
+                    sys.getsizeof(term) + sys.getsizeof(entry) + sum(sys.getsizeof(value) for value in entry)
+                    for term, entry in self.lexicon.items()
+                )
+        return self._memory_bytes
+
+    def mapped_bytes(self):
+        """Bytes of the segment's memory-mapped files, shared by every process that opens it"""
+        return self._mapped_bytes
+
+    def local_id(self, row):
+        """Local document number of a global row id, or None when this segment does not hold it"""
+        local = int(np.searchsorted(self.doc_rows, row))
+        if local < self.num_docs and self.doc_rows[local] == row:
+            return local
+        return None
+
+    def document_line(self, local):
+        """A stored record's raw JSON line, newline included"""
+        start = int(self.doc_offsets[local])
+        return self._docs[start:self._docs.find(b"\n", start) + 1]
+
+    def get_document(self, local):
+        return json.loads(self.document_line(local))
+
+    def iter_documents(self):
+        """Yield every stored record in row order
+
+        Reads the mapping rather than the file, so a snapshot still
+        iterates a segment that a merge has since deleted.
+        """
+        for local in range(self.num_docs):
+            yield self.get_document(local)
+
+
+class TextIndex:
+    """Read-only BM25 snapshot over the segments listed in one manifest
+
+    A snapshot pins its segments for as long as it is referenced, so a
+    query sees the same documents from start to finish while writers
+    publish newer snapshots. Document frequencies and the average document
+    length are summed across segments, so scores match those of a single
+    index over the same records. Nothing here takes a lock.
+
+    Deleted rows are listed in the manifest for good, since the vector
+    store keeps their rows, and filtered out of results. Like the rest of
+    a segment they stay in its statistics until a merge rewrites it
+    without them.
+    """
+
+    def __init__(self, index_dir, manifest=None, opened=None):
+        self.index_dir = index_dir
+        if manifest is None:
+            manifest = read_manifest(index_dir)
+        self.manifest = manifest
+        self.k1 = manifest["k1"]
+        self.b = manifest["b"]
+        # Changes on every publish, so caches can key on it
+        self.version = manifest["build_id"]
+        self.generation = manifest["generation"]
+        # One past the highest row id ever published; the vector store holds exactly this many rows
+        self.num_rows = manifest["rows"]
+
+        # Segments already open in an earlier snapshot are shared, not reopened
+        opened = opened or {}
+        self.segments = [opened.get(name) or Segment(os.path.join(index_dir, SEGMENTS_DIR, name))
+                         for name in manifest["segments"]]
+        # Row ranges of non-empty segments are ordered and disjoint, so a row's segment is found by bisection
+        self._lookup = [segment for segment in self.segments if len(segment)]
+        self._first_rows = [segment.first_row for segment in self._lookup]
+        self.deleted_rows = frozenset(manifest.get("deleted_rows", ()))
+        self._deleted = np.array(sorted(self.deleted_rows), dtype=np.int64)
+        # Deleted rows not yet purged by a merge
+        self.stored_deleted = [row for row in self._deleted.tolist() if self._locate(row) is not None]
+
+        self.num_docs = sum(len(segment) for segment in self.segments)
+        self.avg_doc_length = (sum(segment.total_length for segment in self.segments) / self.num_docs
+                               if self.num_docs else 0.0)
+        self.type_counts = Counter()
+        for segment in self.segments:
+            self.type_counts.update(segment.type_counts)
+        self.type_counts.subtract(self.get_document(row).get("type", "unknown") for row in self.stored_deleted)
+
+        # BM25 length normalisation is norm_base + norm_scale * doc_length, computed per touched posting
+        avg = self.avg_doc_length or 1.0
+        self.norm_base = self.k1 * (1 - self.b)
+        self.norm_scale = self.k1 * self.b / avg
+
+    def __len__(self):
+        """Number of live (not deleted) documents"""
+        return self.num_docs - len(self.stored_deleted)
+
+    def close(self):
+        """Release every segment's mapping; only for callers that own the index outright"""
+        for segment in self.segments:
+            segment.close()
+
+    def memory_bytes(self):
+        """Approximate heap bytes held by this snapshot's segments"""
+        return sum(segment.memory_bytes() for segment in self.segments)
+
+    def mapped_bytes(self):
+        return sum(segment.mapped_bytes() for segment in self.segments)
+
+    def idf(self, df):
+        """BM25 inverse document frequency"""
+        return math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def _locate(self, doc_id):
+        """(segment, local id) holding a row, or None"""
+        position = bisect.bisect_right(self._first_rows, doc_id) - 1
+        if position >= 0:
+            segment = self._lookup[position]
+            local = segment.local_id(doc_id)
+            if local is not None:
+                return segment, local
+        return None
+
+    def get_document(self, doc_id):
+        """Read a stored record by document (row) id"""
+        located = self._locate(doc_id)
+        if located is None:
+            raise KeyError(f"Row {doc_id} is not in index snapshot {self.generation}")
+        segment, local = located
+        return segment.get_document(local)
+
+    def iter_documents(self):
+        """Yield every stored record in row order"""
+        for segment in self.segments:
+            yield from segment.iter_documents()
+
+    def iter_rows(self):
+        """Yield (row id, record) pairs of live documents in row order"""
+        for segment in self.segments:
+            for row, record in zip(segment.doc_rows.tolist(), segment.iter_documents()):
+                if row not in self.deleted_rows:
+                    yield row, record
+
+    def rows_for_source(self, source):
+        """Row ids of the live documents extracted from one source file"""
+        return [row for segment in self.segments if source in segment.sources
+                for row, record in zip(segment.doc_rows.tolist(), segment.iter_documents())
+                if record.get("source") == source and row not in self.deleted_rows]
+
+    def score(self, query):
+        """Return (doc_ids, scores) for every document matching a query term"""
+        doc_parts = []
+        score_parts = []
+        for term in set(tokenize(query)):
+            entries = []
+            for segment in self.segments:
+                entry = segment.lexicon.get(term)
+                if entry is not None:
+                    entries.append((segment, entry))
+            if not entries:
+                continue
+            idf = self.idf(sum(df for _, (df, _) in entries))
+            for segment, (df, offset) in entries:
+                docs = segment.posting_docs[offset:offset + df]
+                tfs = segment.posting_tfs[offset:offset + df].astype(np.float32)
+                norms = self.norm_base + self.norm_scale * segment.doc_lengths[docs]
+                doc_parts.append(segment.doc_rows[docs])
+                score_parts.append(idf * tfs * (self.k1 + 1) / (tfs + norms))
+
+        if not doc_parts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        all_docs = np.concatenate(doc_parts)
+        all_scores = np.concatenate(score_parts)
+        if len(self._deleted):
+            live = ~np.isin(all_docs, self._deleted)
+            all_docs, all_scores = all_docs[live], all_scores[live]
+        if len(all_docs) * DENSE_ACCUMULATOR_RATIO > self.num_docs:
+            # Common terms touch most documents, so a dense accumulator beats sorting
+            dense = np.bincount(all_docs, weights=all_scores, minlength=self.num_rows)
+            doc_ids = np.flatnonzero(dense)
+            return doc_ids.astype(np.int32), dense[doc_ids].astype(np.float32)
+
+        # Accumulate per-document scores over the touched postings only
+        doc_ids, inverse = np.unique(all_docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=all_scores).astype(np.float32)
+        return doc_ids.astype(np.int32), scores
+
+    def top_k(self, query, k=10, progress=None):
+        """Return the k best (doc_id, score) pairs for a query"""
+        with span("retrieve.keyword"):
+            doc_ids, scores = self.score(query)
+        report(progress, SEARCH_STAGES[0])
+        with span("rank.keyword"):
+            if len(scores) > k:
+                best = np.argpartition(-scores, k - 1)[:k]
+            else:
+                best = np.arange(len(scores))
+            best = best[np.argsort(-scores[best], kind="stable")]
+        report(progress, SEARCH_STAGES[1])
+        return [(int(doc_ids[i]), float(scores[i])) for i in best]
+
+    def search(self, query, k=10, progress=None):
+        """Return the top-k stored records with BM25-derived confidence scores
+
+        ``progress`` is an optional PipelineProgress over SEARCH_STAGES.
+        """
+        results = []
+        hits = self.top_k(query, k, progress)
+        with span("load"):
+            for doc_id, score in hits:
+                record = self.get_document(doc_id)
+                record["doc_id"] = doc_id
+                record["confidence"] = round(score_to_confidence(score), 4)
+                results.append(record)
+        report(progress, SEARCH_STAGES[2])
+        return results
+
+    def publish(self, segment_names=(), deleted_rows=(), merged=None):
+        """Atomically publish a new snapshot and return it
+
+        ``segment_names`` are appended, ``deleted_rows`` are added to the
+        deleted set, and ``merged`` is (replaced segment names, new segment
+        name or None) from a merge: the new segment takes the place of the
+        run it replaces. Only the manifest swap makes any of this visible, so a crash
+        before it leaves this snapshot as the current one.
+        """
+        opened = {segment.name: segment for segment in self.segments}
+        names = list(self.manifest["segments"])
+        deleted = self.deleted_rows | set(deleted_rows)
+        if merged is not None:
+            replaced, merged_name = merged
+            position = names.index(replaced[0])
+            names = names[:position] + ([merged_name] if merged_name else []) + \
+                [name for name in names[position:] if name not in replaced]
+        added = [Segment(os.path.join(self.index_dir, SEGMENTS_DIR, name))
+                 for name in list(segment_names) + ([merged[1]] if merged and merged[1] else [])]
+        opened.update((segment.name, segment) for segment in added)
+        manifest = dict(
+            self.manifest,
+            generation=self.generation + 1,
+            build_id=uuid.uuid4().hex,
+            segments=names + list(segment_names),
+            rows=max([self.num_rows] + [int(segment.doc_rows[-1]) + 1 for segment in added if len(segment)]),
+            deleted_rows=sorted(deleted)
+        )
+        write_manifest(self.index_dir, manifest)
+        return TextIndex(self.index_dir, manifest, opened)
+
+    def refresh(self):
+        """The snapshot currently published on disk, or self when it is still current
+
+        Lets a read-only process follow another process's writes; segments
+        both snapshots list are shared rather than reopened.
+        """
+        manifest = read_manifest(self.index_dir)
+        if manifest["build_id"] == self.version:
+            return self
+        return TextIndex(self.index_dir, manifest, {segment.name: segment for segment in self.segments})
+
+
+def read_manifest(index_dir):
+    with open(os.path.join(index_dir, MANIFEST_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def replace_json(path, data):
+    """Write JSON to a synced temporary file and rename it over ``path``, so readers see old or new whole"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_manifest(index_dir, manifest):
+    """Replace the manifest atomically and durably; this is the commit point of every write"""
+    replace_json(os.path.join(index_dir, MANIFEST_FILE), manifest)
+
+
+def save_segment(index_dir, lexicon, posting_docs, posting_tfs, doc_lengths, doc_rows, doc_lines, meta):
+    """Write a segment's files and return its name
+
+    ``doc_lines`` yields each stored record as one JSON line, in local
+    document order. The segment is written under a temporary name and
+    renamed once complete, so readers and recovery never see a partial one.
+    """
+    name = f"seg-{uuid.uuid4().hex[:12]}"
+    segment_dir = os.path.join(index_dir, SEGMENTS_DIR, name)
+    tmp_dir = segment_dir + ".tmp"
+    os.makedirs(tmp_dir)
+
+    np.save(os.path.join(tmp_dir, "posting_docs.npy"), np.asarray(posting_docs, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "posting_tfs.npy"), np.asarray(posting_tfs, dtype=np.uint16))
+    np.save(os.path.join(tmp_dir, "doc_lengths.npy"), np.asarray(doc_lengths, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "doc_rows.npy"), np.asarray(doc_rows, dtype=np.int64))
+
+    doc_offsets = []
+    with open(os.path.join(tmp_dir, "docs.jsonl"), "wb") as f:
+        for line in doc_lines:
+            doc_offsets.append(f.tell())
+            f.write(line)
+    np.save(os.path.join(tmp_dir, "doc_offsets.npy"), np.array(doc_offsets, dtype=np.int64))
+
+    save_lexicon(tmp_dir, lexicon)
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    os.replace(tmp_dir, segment_dir)
+    return name
+
+
+def write_segment(index_dir, records, first_row=0, rows=None):
+    """Write records as a new, unpublished segment and return its name
+
+    Rows default to consecutive ids from ``first_row``.
+    """
+    if rows is None:
+        rows = np.arange(first_row, first_row + len(records))
+    postings = defaultdict(list)
+    doc_lengths = []
+    for doc_id, record in enumerate(records):
+        terms = tokenize(record_text(record))
+        doc_lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            postings[term].append((doc_id, tf))
+
+    lexicon = {}
+    posting_docs = []
+    posting_tfs = []
+    offset = 0
+    for term in sorted(postings):
+        entries = postings[term]
+        lexicon[term] = [len(entries), offset]
+        posting_docs.extend(doc_id for doc_id, _ in entries)
+        posting_tfs.extend(min(tf, 65535) for _, tf in entries)
+        offset += len(entries)
+
+    meta = {
+        "num_docs": len(doc_lengths),
+        "total_length": sum(doc_lengths),
+        "type_counts": Counter(record.get("type", "unknown") for record in records),
+        "sources": sorted({record["source"] for record in records if record.get("source")})
+    }
+    doc_lines = (json.dumps(record).encode("utf-8") + b"\n" for record in records)
+    return save_segment(index_dir, lexicon, posting_docs, posting_tfs, doc_lengths, rows, doc_lines, meta)
+
+
+def remove_orphan_segments(index_dir, min_age=ORPHAN_GRACE_SECONDS):
+    """Delete segment directories no manifest references, left by crashed or superseded writes
+
+    Only entries older than ``min_age`` are removed, so a segment another
+    process is about to publish survives.
+    """
+    segments_dir = os.path.join(index_dir, SEGMENTS_DIR)
+    if not os.path.isdir(segments_dir):
+        return
+    live = set(read_manifest(index_dir)["segments"])
+    for name in os.listdir(segments_dir):
+        path = os.path.join(segments_dir, name)
+        if name not in live and time.time() - os.path.getmtime(path) > min_age:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def build_text_index(records, index_dir=DEFAULT_INDEX_DIR, k1=BM25_K1, b=BM25_B):
+    """Build an on-disk BM25 index over result records as a single segment and open it"""
+    os.makedirs(os.path.join(index_dir, SEGMENTS_DIR), exist_ok=True)
+    name = write_segment(index_dir, records)
+    previous = read_manifest(index_dir) if os.path.exists(os.path.join(index_dir, MANIFEST_FILE)) else {}
+    write_manifest(index_dir, {
+        "generation": previous.get("generation", 0) + 1,
+        "build_id": uuid.uuid4().hex,
+        "k1": k1,
+        "b": b,
+        "segments": [name],
+        "rows": len(records)
+    })
+    remove_orphan_segments(index_dir)
+    return TextIndex(index_dir)
+
+
+def open_text_index(index_dir=DEFAULT_INDEX_DIR, records=None):
+    """Open the current snapshot, building the index from records if none exists yet"""
+    if os.path.exists(os.path.join(index_dir, MANIFEST_FILE)):
+        remove_orphan_segments(index_dir)
+        return TextIndex(index_dir)
+    if records is None:
+        raise FileNotFoundError(f"No text index found at {index_dir}")
+    return build_text_index(records, index_dir)
@@ -0,0 +1,176 @@
+# Stage Tracing and Latency Metrics for the Multimodal RAG System
+
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+DEFAULT_EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_data", "metrics")
+
+# Most recent durations kept per span for percentile estimates
+SAMPLE_WINDOW = 2048
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+EXPORT_INTERVAL_SECONDS = 15.0
+
+METRIC_NAME_PATTERN = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class Tracer:
+    """Thread-safe recorder of wall-clock stage spans and event counters
+
+    Each span name keeps a total count and sum plus a sliding window of
+    recent durations, from which p50/p95/p99 are computed on demand.
+    """
+
+    def __init__(self, window=SAMPLE_WINDOW):
+        self.window = window
+        self.started_at = time.time()
+        self._samples = {}
+        self._totals = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block under ``name``"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """Record one duration measured elsewhere, e.g. in a worker process"""
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+                self._totals[name] = [0, 0.0]
+            samples.append(seconds)
+            totals = self._totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def increment(self, name, amount=1):
+        """Add to an event counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def latency(self, name):
+        """Count, mean and percentiles in seconds for a span, or None if never recorded"""
+        with self._lock:
+            if name not in self._samples:
+                return None
+            samples = np.fromiter(self._samples[name], dtype=np.float64)
+            count, total = self._totals[name]
+        summary = {"count": count, "mean": total / count, "sum": total}
+        for quantile, value in zip(QUANTILES, np.quantile(samples, QUANTILES)):
+            summary[f"p{round(quantile * 100)}"] = float(value)
+        return summary
+
+    def snapshot(self):
+        """Every span summary and counter as a JSON-serialisable dict"""
+        with self._lock:
+            names = sorted(self._samples)
+            counters = dict(self._counters)
+        return {
+            "timestamp": time.time(),
+            "uptime_seconds": time.time() - self.started_at,
+            "spans": {name: self.latency(name) for name in names},
+            "counters": counters
+        }
+
+    def to_prometheus(self):
+        """Render the snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP rag_stage_duration_seconds Wall-clock duration of pipeline stages",
+            "# TYPE rag_stage_duration_seconds summary"
+        ]
+        for name, summary in snapshot["spans"].items():
+            for quantile in QUANTILES:
+                value = summary[f"p{round(quantile * 100)}"]
+                lines.append(f'rag_stage_duration_seconds{{stage="{name}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'rag_stage_duration_seconds_sum{{stage="{name}"}} {summary["sum"]:.6f}')
+            lines.append(f'rag_stage_duration_seconds_count{{stage="{name}"}} {summary["count"]}')
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = "rag_" + METRIC_NAME_PATTERN.sub("_", name) + "_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, export_dir=DEFAULT_EXPORT_DIR):
+        """Write metrics.json and metrics.prom, replacing both atomically"""
+        os.makedirs(export_dir, exist_ok=True)
+        outputs = {
+            "metrics.json": json.dumps(self.snapshot(), indent=2),
+            "metrics.prom": self.to_prometheus()
+        }
+        for file_name, text in outputs.items():
+            path = os.path.join(export_dir, file_name)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+
+
+# Process-wide tracer shared by every pipeline stage
+_tracer = Tracer()
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def span(name):
+    """Time a block on the process-wide tracer"""
+    return _tracer.span(name)
+
+
+def record(name, seconds):
+    _tracer.record(name, seconds)
+
+
+def increment(name, amount=1):
+    _tracer.increment(name, amount)
+
+
+def latency(name):
+    return _tracer.latency(name)
+
+
+def snapshot():
+    return _tracer.snapshot()
+
+
+def prometheus_text():
+    return _tracer.to_prometheus()
+
+
+def export_metrics(export_dir=DEFAULT_EXPORT_DIR):
+    _tracer.export(export_dir)
+
+
+def start_exporter(export_dir=DEFAULT_EXPORT_DIR, interval=EXPORT_INTERVAL_SECONDS):
+    """Export metrics files periodically from a daemon thread; safe to call repeatedly"""
+    global _exporter
+    with _exporter_lock:
+        if _exporter is not None:
+            return
+
+        def export_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    export_metrics(export_dir)
+                except Exception:
+                    # A failed export must not stop the exporter; the next interval retries
+                    increment("metrics_export_failures")
+
+        _exporter = threading.Thread(target=export_loop, name="metrics-exporter", daemon=True)
+        _exporter.start()
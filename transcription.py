@@ -0,0 +1,313 @@
+# Streaming Audio Transcription for the Multimodal RAG System
+
+import abc
+import os
+import time
+import wave
+from collections import deque
+
+import numpy as np
+
+from audio_segments import SEGMENT_SECONDS
+
+# Recordings that can be decoded to samples with the standard library
+STREAMING_EXTENSIONS = (".wav",)
+
+# Voice activity is decided per frame of this length
+FRAME_SECONDS = 0.03
+
+# Audio decoded per read; memory use depends on this, not on the file length
+BLOCK_SECONDS = 15.0
+
+# A frame is voiced when this far above the estimated noise floor...
+ENERGY_MARGIN_DB = 12.0
+# ...and never below this absolute level, so digital silence and dither stay silent
+SILENCE_DBFS = -55.0
+# Percentile of a block's frame levels taken as its noise floor
+NOISE_PERCENTILE = 10
+# Fastest rise of the noise floor between blocks, so long speech does not become the floor
+NOISE_RISE_DB_PER_SECOND = 0.5
+
+# Silence bridged inside an utterance, and the shortest and longest utterance kept
+HANGOVER_SECONDS = 0.4
+MIN_SPEECH_SECONDS = 0.25
+MAX_UTTERANCE_SECONDS = 30.0
+
+# Utterances in flight per worker; bounds the decoded audio held at once
+PENDING_PER_WORKER = 4
+
+# Pitch search range of the stand-in transcriber
+PITCH_RANGE_HZ = (60.0, 400.0)
+
+
+class Transcriber(abc.ABC):
+    """Interface for speech-to-text engines run on the transcription pool
+
+    ``transcribe(samples, sample_rate)`` receives one utterance as mono
+    float32 samples in [-1, 1] and returns its text. Instances are pickled
+    to worker processes, so they should load any model lazily there.
+    """
+
+    model_name = "base"
+
+    @abc.abstractmethod
+    def transcribe(self, samples, sample_rate):
+        """Text of one utterance"""
+
+
+class StandInTranscriber(Transcriber):
+    """Deterministic local stand-in for a speech recognition model
+
+    Describes each utterance from its signal instead of recognising words:
+    length, loudness and median voice pitch, estimated by autocorrelation
+    over 40 ms windows. The same audio always yields the same text.
+    """
+
+    model_name = "stand-in-v1"
+
+    def __init__(self, window_seconds=0.04):
+        self.window_seconds = window_seconds
+
+    def pitch(self, samples, sample_rate):
+        """Median fundamental frequency of the louder windows, or None for unvoiced audio"""
+        window = int(sample_rate * self.window_seconds)
+        count = len(samples) // window
+        if count == 0:
+            return None
+        windows = samples[:count * window].reshape(count, window)
+        energy = np.einsum("ij,ij->i", windows, windows)
+        windows = windows[energy >= np.median(energy)]
+        windows = windows - windows.mean(axis=1, keepdims=True)
+        spectrum = np.fft.rfft(windows, n=2 * window, axis=1)
+        correlation = np.fft.irfft(spectrum * np.conj(spectrum), axis=1)[:, :window]
+        low = max(int(sample_rate / PITCH_RANGE_HZ[1]), 1)
+        high = min(int(sample_rate / PITCH_RANGE_HZ[0]), window - 1)
+        if high <= low:
+            return None
+        lags = low + np.argmax(correlation[:, low:high], axis=1)
+        strength = correlation[np.arange(len(lags)), lags] / np.maximum(correlation[:, 0], 1e-12)
+        voiced = lags[strength > 0.3]
+        if not len(voiced):
+            return None
+        return sample_rate / float(np.median(voiced))
+
+    def transcribe(self, samples, sample_rate):
+        seconds = len(samples) / sample_rate
+        rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float64)))) if len(samples) else 0.0
+        text = f"Speech for {seconds:.1f} seconds at {20 * np.log10(max(rms, 1e-10)):.0f} dBFS"
+        pitch = self.pitch(samples, sample_rate)
+        if pitch is not None:
+            text += f" with voice pitch near {pitch:.0f} Hz"
+        return text + "."
+
+
+def is_streamable(file_name):
+    """Whether a recording can be decoded and transcribed by this module"""
+    return os.path.splitext(file_name)[1].lower() in STREAMING_EXTENSIONS
+
+
+def pcm_to_float(data, sample_width, channels):
+    """Mono float32 samples in [-1, 1] from interleaved little-endian PCM bytes"""
+    if sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768
+    elif sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = (np.where(values & 0x800000, values - 0x1000000, values)).astype(np.float32) / 8388608
+    elif sample_width == 4:
+        samples = np.frombuffer(data, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise wave.Error(f"Unsupported sample width: {sample_width} bytes")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def iter_wav_blocks(path, block_seconds=BLOCK_SECONDS, frame_seconds=FRAME_SECONDS):
+    """Yield (sample_rate, start sample, samples) blocks of a WAV file
+
+    Blocks hold a whole number of VAD frames, so only the final block can
+    end on a partial frame.
+    """
+    with wave.open(path, "rb") as recording:
+        rate = recording.getframerate()
+        width = recording.getsampwidth()
+        channels = recording.getnchannels()
+        frame_length = max(int(rate * frame_seconds), 1)
+        block_frames = frame_length * max(int(block_seconds / frame_seconds), 1)
+        position = 0
+        while True:
+            data = recording.readframes(block_frames)
+            if not data:
+                return
+            samples = pcm_to_float(data, width, channels)
+            yield rate, position, samples
+            position += len(samples)
+
+
+class VoiceActivityDetector:
+    """Streaming energy-based voice activity segmentation
+
+    Frame levels in dBFS are compared with a noise floor re-estimated per
+    block as a low percentile of its frame levels. Voiced frames open an
+    utterance; it closes after ``HANGOVER_SECONDS`` of silence or at
+    ``MAX_UTTERANCE_SECONDS``. Only the open utterance's samples are kept.
+    """
+
+    def __init__(self, sample_rate, frame_seconds=FRAME_SECONDS):
+        self.sample_rate = sample_rate
+        self.frame_length = max(int(sample_rate * frame_seconds), 1)
+        self.noise_floor = None
+        self._parts = []
+        self._start = None
+        self._last_voiced = None
+
+    def _level_threshold(self, levels):
+        block_floor = float(np.percentile(levels, NOISE_PERCENTILE))
+        if self.noise_floor is None:
+            self.noise_floor = block_floor
+        else:
+            seconds = len(levels) * self.frame_length / self.sample_rate
+            self.noise_floor = min(block_floor, self.noise_floor + NOISE_RISE_DB_PER_SECOND * seconds)
+        return max(self.noise_floor + ENERGY_MARGIN_DB, SILENCE_DBFS)
+
+    def _close(self):
+        """Finish the open utterance; returns it, or None when too short"""
+        utterance = None
+        end = self._last_voiced
+        if end - self._start >= MIN_SPEECH_SECONDS * self.sample_rate:
+            samples = np.concatenate(self._parts)[:end - self._start]
+            utterance = {"start": self._start / self.sample_rate, "end": end / self.sample_rate,
+                         "samples": samples}
+        self._parts = []
+        self._start = self._last_voiced = None
+        return utterance
+
+    def feed(self, position, samples):
+        """Consume a block starting at sample ``position``; returns the utterances it closed"""
+        count = len(samples) // self.frame_length
+        if count == 0:
+            return []
+        frames = samples[:count * self.frame_length].reshape(count, self.frame_length)
+        rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / self.frame_length)
+        levels = 20 * np.log10(np.maximum(rms, 1e-10))
+        voiced = levels > self._level_threshold(levels)
+
+        hangover = HANGOVER_SECONDS * self.sample_rate
+        longest = MAX_UTTERANCE_SECONDS * self.sample_rate
+        closed = []
+        part_start = 0
+        for i in range(count):
+            frame_start = position + i * self.frame_length
+            if self._start is not None and (
+                frame_start - self._last_voiced > hangover or frame_start - self._start >= longest
+            ):
+                self._parts.append(samples[part_start:i * self.frame_length])
+                utterance = self._close()
+                if utterance:
+                    closed.append(utterance)
+            if voiced[i]:
+                if self._start is None:
+                    self._start = frame_start
+                    part_start = i * self.frame_length
+                self._last_voiced = frame_start + self.frame_length
+        if self._start is not None:
+            self._parts.append(samples[part_start:count * self.frame_length])
+        return closed
+
+    def flush(self):
+        """Close the utterance still open at the end of the stream"""
+        if self._start is None:
+            return []
+        utterance = self._close()
+        return [utterance] if utterance else []
+
+
+def detect_speech(blocks):
+    """Yield utterances {start, end, sample_rate, samples} from (rate, position, samples) blocks"""
+    detector = None
+    for rate, position, samples in blocks:
+        if detector is None:
+            detector = VoiceActivityDetector(rate)
+        for utterance in detector.feed(position, samples):
+            yield dict(utterance, sample_rate=rate)
+    if detector is not None:
+        for utterance in detector.flush():
+            yield dict(utterance, sample_rate=detector.sample_rate)
+
+
+def _transcribe_utterance(transcriber, samples, sample_rate):
+    """Worker task: (text, seconds spent)"""
+    started = time.perf_counter()
+    text = transcriber.transcribe(samples, sample_rate)
+    return text, time.perf_counter() - started
+
+
+def transcribe_utterances(utterances, transcriber, executor=None, max_pending=None):
+    """Yield utterances with their ``text`` and ``seconds`` in time order
+
+    Utterances fan out to ``executor`` (any concurrent.futures executor)
+    with at most ``max_pending`` in flight, and are reassembled in order as
+    they finish. Without an executor they are transcribed inline.
+    """
+    if executor is None:
+        for utterance in utterances:
+            text, seconds = _transcribe_utterance(transcriber, utterance["samples"], utterance["sample_rate"])
+            yield {"start": utterance["start"], "end": utterance["end"], "text": text, "seconds": seconds}
+        return
+
+    max_pending = max_pending or PENDING_PER_WORKER * (os.cpu_count() or 1)
+    pending = deque()
+    for utterance in utterances:
+        future = executor.submit(_transcribe_utterance, transcriber, utterance["samples"], utterance["sample_rate"])
+        # Keep only timings here so submitted samples can be freed
+        pending.append((utterance["start"], utterance["end"], future))
+        while len(pending) >= max_pending:
+            yield _finished(*pending.popleft())
+    while pending:
+        yield _finished(*pending.popleft())
+
+
+def _finished(start, end, future):
+    text, seconds = future.result()
+    return {"start": start, "end": end, "text": text, "seconds": seconds}
+
+
+def group_utterances(utterances, segment_seconds=SEGMENT_SECONDS):
+    """Merge consecutive transcribed utterances into segments of about ``segment_seconds``"""
+    group = []
+    for utterance in utterances:
+        group.append(utterance)
+        if group[-1]["end"] - group[0]["start"] >= segment_seconds:
+            yield _segment(group)
+            group = []
+    if group:
+        yield _segment(group)
+
+
+def _segment(group):
+    return {"start": group[0]["start"], "end": group[-1]["end"],
+            "text": " ".join(utterance["text"] for utterance in group if utterance["text"])}
+
+
+def transcribe_recording(path, transcriber=None, executor=None, max_pending=None, on_utterance=None):
+    """Yield time-ordered transcript segments {start, end, text} of a recording
+
+    The file is decoded block by block, split into utterances by voice
+    activity and transcribed on ``executor``, so memory stays flat however
+    long the recording is. ``on_utterance`` is called with each transcribed
+    utterance, e.g. to report progress.
+    """
+    transcriber = transcriber or StandInTranscriber()
+    utterances = transcribe_utterances(detect_speech(iter_wav_blocks(path)), transcriber, executor, max_pending)
+    if on_utterance is not None:
+        utterances = _observe(utterances, on_utterance)
+    return group_utterances(utterances)
+
+
+def _observe(items, callback):
+    for item in items:
+        callback(item)
+        yield item
@@ -0,0 +1,83 @@
+# Shared Streamlit Panels for the Multimodal RAG System
+
+import streamlit as st
+
+from memory import format_bytes, memory_usage
+
+# Status icons app.py shows; clapp.py renders the same panels without them
+ICONS = {"info": "ℹ️ ", "failed": "❌ ", "done": "✅ ", "memory": "🧠 "}
+NO_ICONS = dict.fromkeys(ICONS, "")
+
+def submit_uploads(service, load_manager, uploaded_files, icons=ICONS):
+    """Queue newly uploaded files for background ingestion
+
+    ``load_manager`` returns the app's IngestManager; it is only called
+    when the service may write, so read-only servers never start workers.
+    """
+    if service.read_only:
+        st.info(f"{icons['info']}This server shares another server's index read-only; upload files there to index them")
+        return
+    manager = load_manager()
+    for uploaded_file in uploaded_files:
+        key = f"{uploaded_file.name}:{uploaded_file.size}"
+        if key not in st.session_state.ingest_jobs:
+            st.session_state.ingest_jobs[key] = manager.submit(uploaded_file.name, uploaded_file.getvalue())
+
+def show_ingest_progress(load_manager, icons=ICONS):
+    """Show upload ingestion progress, polling only while jobs are running"""
+    if not st.session_state.ingest_jobs:
+        return
+    manager = load_manager()
+    jobs = [manager.status(job_id) for job_id in st.session_state.ingest_jobs.values()]
+    active = any(job and job['state'] not in ('done', 'failed') for job in jobs)
+
+    @st.fragment(run_every=1.0 if active else None)
+    def render_jobs():
+        for job_id in st.session_state.ingest_jobs.values():
+            job = manager.status(job_id)
+            if job is None:
+                continue
+            if job['state'] == 'failed':
+                st.error(f"{icons['failed']}{job['file_name']}: {job['error']}")
+            elif job['state'] == 'done':
+                merged = f", {job['duplicates']} near-duplicate(s) merged" if job.get('duplicates') else ""
+                merged += f", {job['replaced']} earlier chunk(s) replaced" if job.get('replaced') else ""
+                st.caption(f"{icons['done']}{job['file_name']}: {job['chunks']} chunk(s) indexed{merged}")
+            else:
+                searchable = f" ({job['chunks']} chunk(s) searchable)" if job['chunks'] else ""
+                st.progress(job['progress'], text=f"{job['file_name']}: {job['stage']}{searchable}")
+
+    render_jobs()
+
+def memory_rows(usage):
+    """Table rows of process RSS, worker RSS and the bytes each tracked component holds"""
+    rows = [{"Component": "process RSS", "Size": format_bytes(usage['rss'])},
+            {"Component": "ingestion workers RSS", "Size": format_bytes(usage['workers_rss'])}]
+    rows += [{"Component": name, "Size": format_bytes(size)} for name, size in usage['components'].items()]
+    return rows
+
+def show_memory_usage(in_sidebar=False, icons=ICONS):
+    """RSS against the memory budget, with the bytes held by each tracked component
+
+    In the sidebar the table is shown directly under a Memory heading;
+    elsewhere it sits in an expander below the budget line.
+    """
+    usage = memory_usage()
+    used = usage['total'] if usage['total'] is not None else usage['tracked']
+    budget = f"{format_bytes(used)} of {format_bytes(usage['budget'])} budget"
+    if in_sidebar:
+        with st.sidebar:
+            st.markdown("###  Memory")
+            if usage['over_budget']:
+                st.warning(budget)
+            else:
+                st.caption(budget)
+            st.dataframe(memory_rows(usage), hide_index=True, use_container_width=True)
+        return
+    message = f"{icons['memory']}Memory: {budget}"
+    if usage['over_budget']:
+        st.warning(message)
+    else:
+        st.info(message)
+    with st.expander(f"{icons['memory']}Memory by component"):
+        st.dataframe(memory_rows(usage), hide_index=True)
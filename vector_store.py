@@ -0,0 +1,215 @@
+# Memory-Mapped Vector Store for the Multimodal RAG System
+
+import json
+import os
+
+import numpy as np
+
+from text_index import record_text
+
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_data", "vectors")
+
+SUPPORTED_DTYPES = ("float16", "int8")
+
+# Rows scored per block; keeps the working set small when the store exceeds the page cache
+BLOCK_ROWS = 8192
+
+
+def top_k_indices(scores, k):
+    """Indices of the k largest scores, best first"""
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+    else:
+        best = np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+class VectorStore:
+    """Append-only embedding matrix on disk with a JSON-lines metadata sidecar
+
+    Vectors live in a raw file that is memory-mapped read-only, so opening a
+    store costs nothing and only the blocks being scanned are paged in.
+    The row count in ``store.json`` is the commit point: bytes written past
+    it by an interrupted append are simply ignored.
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR, dim=None, dtype="float16"):
+        self.store_dir = store_dir
+        self.header_path = os.path.join(store_dir, "store.json")
+        self.vectors_path = os.path.join(store_dir, "vectors.bin")
+        self.scales_path = os.path.join(store_dir, "scales.bin")
+        self.meta_path = os.path.join(store_dir, "meta.jsonl")
+        self.offsets_path = os.path.join(store_dir, "meta_offsets.bin")
+
+        if os.path.exists(self.header_path):
+            with open(self.header_path, encoding="utf-8") as f:
+                header = json.load(f)
+        else:
+            if dim is None:
+                raise FileNotFoundError(f"No vector store found at {store_dir}")
+            if dtype not in SUPPORTED_DTYPES:
+                raise ValueError(f"Unsupported dtype {dtype!r}, expected one of {SUPPORTED_DTYPES}")
+            os.makedirs(store_dir, exist_ok=True)
+            header = {"dim": dim, "dtype": dtype, "count": 0}
+            for path in (self.vectors_path, self.scales_path, self.meta_path, self.offsets_path):
+                open(path, "wb").close()
+            self._write_header(header)
+
+        self.dim = header["dim"]
+        self.dtype = header["dtype"]
+        self._map(header["count"])
+
+    def __len__(self):
+        return self.count
+
+    def _write_header(self, header):
+        """Atomically replace the store header"""
+        tmp_path = self.header_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(tmp_path, self.header_path)
+
+    def _map(self, count):
+        """Memory-map the first ``count`` committed rows read-only
+
+        The row count is published last so concurrent readers never index
+        past the arrays they see.
+        """
+        if count == 0:
+            self.vectors = np.zeros((0, self.dim), dtype=self.dtype)
+            self.scales = None if self.dtype == "float16" else np.zeros(0, dtype=np.float32)
+            self.meta_offsets = np.zeros(0, dtype=np.int64)
+        else:
+            self.vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(count, self.dim))
+            self.meta_offsets = np.memmap(self.offsets_path, dtype=np.int64, mode="r", shape=(count,))
+            if self.dtype == "int8":
+                self.scales = np.memmap(self.scales_path, dtype=np.float32, mode="r", shape=(count,))
+            else:
+                self.scales = None
+        self.count = count
+
+    def _encode_rows(self, vectors):
+        """Convert float vectors to the on-disk representation"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dtype == "float16":
+            return vectors.astype(np.float16), None
+        # Symmetric per-row int8 quantisation
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def add(self, vectors, records):
+        """Append vectors with their metadata records and return the new row ids"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if len(vectors) != len(records):
+            raise ValueError("vectors and records must have the same length")
+        codes, scales = self._encode_rows(vectors)
+
+        # Truncate anything left behind by an interrupted append before writing
+        row_bytes = self.dim * np.dtype(self.dtype).itemsize
+        with open(self.vectors_path, "r+b") as f:
+            f.truncate(self.count * row_bytes)
+            f.seek(0, os.SEEK_END)
+            f.write(codes.tobytes())
+        if scales is not None:
+            with open(self.scales_path, "r+b") as f:
+                f.truncate(self.count * 4)
+                f.seek(0, os.SEEK_END)
+                f.write(scales.tobytes())
+
+        offsets = []
+        meta_end = int(self.meta_offsets[-1]) if self.count else 0
+        with open(self.meta_path, "r+b") as f:
+            if self.count:
+                f.seek(meta_end)
+                f.readline()
+                meta_end = f.tell()
+            f.truncate(meta_end)
+            f.seek(meta_end)
+            for record in records:
+                offsets.append(f.tell())
+                f.write(json.dumps(record).encode("utf-8") + b"\n")
+        with open(self.offsets_path, "r+b") as f:
+            f.truncate(self.count * 8)
+            f.seek(0, os.SEEK_END)
+            f.write(np.array(offsets, dtype=np.int64).tobytes())
+
+        first_row = self.count
+        count = first_row + len(vectors)
+        self._write_header({"dim": self.dim, "dtype": self.dtype, "count": count})
+        self._map(count)
+        return np.arange(first_row, count)
+
+    def refresh(self):
+        """Map rows committed by another process since this store was opened; returns True when the count changed"""
+        with open(self.header_path, encoding="utf-8") as f:
+            count = json.load(f)["count"]
+        if count == self.count:
+            return False
+        self._map(count)
+        return True
+
+    def truncate(self, count):
+        """Forget rows past ``count``; their bytes are overwritten by the next append"""
+        if count < self.count:
+            self._write_header({"dim": self.dim, "dtype": self.dtype, "count": count})
+            self._map(count)
+
+    def get_vectors(self, row_ids):
+        """Return float32 vectors for the given rows"""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        vectors = np.asarray(self.vectors[row_ids], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= np.asarray(self.scales[row_ids])[:, None]
+        return vectors
+
+    def get_records(self, row_ids):
+        """Read the metadata records for the given rows"""
+        records = []
+        with open(self.meta_path, "rb") as f:
+            for row_id in row_ids:
+                f.seek(int(self.meta_offsets[row_id]))
+                records.append(json.loads(f.readline()))
+        return records
+
+    def block_scores(self, query, start, stop):
+        """Dot products between a query vector and rows [start, stop)"""
+        block = np.asarray(self.vectors[start:stop], dtype=np.float32)
+        scores = block @ query
+        if self.scales is not None:
+            scores *= self.scales[start:stop]
+        return scores
+
+    def top_k(self, query, k=10, block_rows=BLOCK_ROWS):
+        """Return the k most similar (row_id, score) pairs by brute-force dot product"""
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        best_ids = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start in range(0, self.count, block_rows):
+            stop = min(start + block_rows, self.count)
+            scores = self.block_scores(query, start, stop)
+            keep = top_k_indices(scores, k)
+            # Merge the block winners into the running top-k
+            best_ids = np.concatenate([best_ids, keep + start])
+            best_scores = np.concatenate([best_scores, scores[keep]])
+            order = top_k_indices(best_scores, k)
+            best_ids, best_scores = best_ids[order], best_scores[order]
+        return [(int(row_id), float(score)) for row_id, score in zip(best_ids, best_scores)]
+
+    def search(self, query, k=10):
+        """Return the top-k metadata records annotated with their similarity score"""
+        hits = self.top_k(query, k)
+        records = self.get_records([row_id for row_id, _ in hits])
+        for record, (row_id, score) in zip(records, hits):
+            record["row_id"] = row_id
+            record["score"] = round(score, 4)
+        return records
+
+
+def open_vector_store(store_dir, encoder, records=None, text_fn=record_text, dtype="float16"):
+    """Open a store, encoding and adding records if it is still empty"""
+    store = VectorStore(store_dir, dim=encoder.dim, dtype=dtype)
+    if len(store) == 0 and records:
+        store.add(encoder.encode([text_fn(record) for record in records]), records)
+    return store